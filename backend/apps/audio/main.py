@@ -26,6 +26,7 @@ import json
 
 
 from constants import ERROR_MESSAGES
+from utils.http_client import get_session
 from utils.utils import (
     decode_token,
     get_current_user,
@@ -100,9 +101,9 @@ async def get_audio_voices(user=Depends(get_admin_user)):
     timeout = aiohttp.ClientTimeout(total=5)
     try:
         headers = {"xi-api-key": ELEVENLABS_API_KEY}
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(f"{ELEVENLABS_API_BASE_URL}/v2/voices?page_size=100", headers=headers) as response:
-                return await response.json()
+        session = get_session(ELEVENLABS_API_BASE_URL)
+        async with session.get(f"{ELEVENLABS_API_BASE_URL}/v2/voices?page_size=100", headers=headers, timeout=timeout) as response:
+            return await response.json()
     except Exception as e:
         # Handle connection error here
         log.error(f"Connection error: {e}")
@@ -115,9 +116,9 @@ async def get_audio_models(user=Depends(get_admin_user)):
     timeout = aiohttp.ClientTimeout(total=5)
     try:
         headers = {"xi-api-key": ELEVENLABS_API_KEY}
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(f"{ELEVENLABS_API_BASE_URL}/v1/models", headers=headers) as response:
-                return await response.json()
+        session = get_session(ELEVENLABS_API_BASE_URL)
+        async with session.get(f"{ELEVENLABS_API_BASE_URL}/v1/models", headers=headers, timeout=timeout) as response:
+            return await response.json()
     except Exception as e:
         # Handle connection error here
         log.error(f"Connection error: {e}")
@@ -164,18 +165,18 @@ async def openai_speech(request: Request, user=Depends(get_verified_user)):
 
     r = None
     try:
-        r = requests.post(
+        session = get_session(app.state.config.OPENAI_API_BASE_URL)
+        r = await session.post(
             url=f"{app.state.config.OPENAI_API_BASE_URL}/audio/speech",
             data=body,
             headers=headers,
-            stream=True,
         )
 
         r.raise_for_status()
 
         # Save the streaming content to a file
         with open(file_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
+            async for chunk in r.content.iter_chunked(8192):
                 f.write(chunk)
 
         with open(file_body_path, "w") as f:
@@ -189,16 +190,19 @@ async def openai_speech(request: Request, user=Depends(get_verified_user)):
         error_detail = "Open WebUI: Server Connection Error"
         if r is not None:
             try:
-                res = r.json()
+                res = await r.json()
                 if "error" in res:
                     error_detail = f"External: {res['error']['message']}"
             except:
                 error_detail = f"External: {e}"
 
         raise HTTPException(
-            status_code=r.status_code if r != None else 500,
+            status_code=r.status if r != None else 500,
             detail=error_detail,
         )
+    finally:
+        if r is not None:
+            r.release()
 
 
 @app.post("/speech/elevenlabs")
@@ -223,7 +227,8 @@ async def elevenlabs_speech(request: Request, user=Depends(get_verified_user)):
         voice_id = body['voice_id']
         del body['voice_id']
 
-        r = requests.post(
+        session = get_session(ELEVENLABS_API_BASE_URL)
+        r = await session.post(
             url=f"{ELEVENLABS_API_BASE_URL}/v1/text-to-speech/{voice_id}/stream?output_format=mp3_22050_32",
             data=json.dumps(body).encode(),
             headers=headers,
@@ -233,7 +238,7 @@ async def elevenlabs_speech(request: Request, user=Depends(get_verified_user)):
 
         # Save the streaming content to a file
         with open(file_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
+            async for chunk in r.content.iter_chunked(8192):
                 f.write(chunk)
 
         body['voice_id'] = voice_id
@@ -248,16 +253,19 @@ async def elevenlabs_speech(request: Request, user=Depends(get_verified_user)):
         error_detail = "Open WebUI: Server Connection Error"
         if r is not None:
             try:
-                res = r.json()
+                res = await r.json()
                 if "error" in res:
                     error_detail = f"External: {res['error']['message']}"
             except:
                 error_detail = f"External: {e}"
 
         raise HTTPException(
-            status_code=r.status_code if r != None else 500,
+            status_code=r.status if r != None else 500,
             detail=error_detail,
         )
+    finally:
+        if r is not None:
+            r.release()
 
 
 @app.post("/transcription/whisper")
@@ -11,9 +11,11 @@ from fastapi import (
     Form,
 )
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from faster_whisper import WhisperModel
 
 from constants import ERROR_MESSAGES
+from utils.http_client import get_session
 from utils.utils import (
     get_current_user,
     get_admin_user,
@@ -392,7 +394,7 @@ def save_url_image(url):
 
 
 @app.post("/generations")
-def generate_image(
+async def generate_image(
     form_data: GenerateImageForm,
     user=Depends(get_current_user),
 ):
@@ -421,14 +423,15 @@ def generate_image(
                 "response_format": "b64_json",
             }
 
-            r = requests.post(
+            session = get_session(app.state.config.OPENAI_API_BASE_URL)
+            r = await session.post(
                 url=f"{app.state.config.OPENAI_API_BASE_URL}/images/generations",
                 json=data,
                 headers=headers,
             )
 
             r.raise_for_status()
-            res = r.json()
+            res = await r.json()
 
             images = []
 
@@ -459,7 +462,8 @@ def generate_image(
 
             data = ImageGenerationPayload(**data)
 
-            res = comfyui_generate_image(
+            res = await run_in_threadpool(
+                comfyui_generate_image,
                 app.state.config.MODEL,
                 data,
                 user.id,
@@ -470,7 +474,7 @@ def generate_image(
             images = []
 
             for image in res["data"]:
-                image_filename = save_url_image(image["url"])
+                image_filename = await run_in_threadpool(save_url_image, image["url"])
                 images.append({"url": f"/cache/image/generations/{image_filename}"})
                 file_body_path = IMAGE_CACHE_DIR.joinpath(f"{image_filename}.json")
 
@@ -481,7 +485,7 @@ def generate_image(
             return images
         else:
             if form_data.model:
-                set_model_handler(form_data.model)
+                await run_in_threadpool(set_model_handler, form_data.model)
 
             data = {
                 "prompt": form_data.prompt,
@@ -496,12 +500,13 @@ def generate_image(
             if form_data.negative_prompt is not None:
                 data["negative_prompt"] = form_data.negative_prompt
 
-            r = requests.post(
+            session = get_session(app.state.config.AUTOMATIC1111_BASE_URL)
+            r = await session.post(
                 url=f"{app.state.config.AUTOMATIC1111_BASE_URL}/sdapi/v1/txt2img",
                 json=data,
             )
 
-            res = r.json()
+            res = await r.json()
 
             log.debug(f"res: {res}")
 
@@ -521,7 +526,10 @@ def generate_image(
         error = e
 
         if r != None:
-            data = r.json()
+            data = await r.json()
             if "error" in data:
                 error = data["error"]["message"]
         raise HTTPException(status_code=400, detail=ERROR_MESSAGES.DEFAULT(error))
+    finally:
+        if r is not None:
+            r.release()
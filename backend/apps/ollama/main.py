@@ -11,14 +11,12 @@ from fastapi import (
 )
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
-from fastapi.concurrency import run_in_threadpool
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, conint
 
 import os
 import re
 import copy
-import random
 import requests
 import json
 import uuid
@@ -27,7 +25,7 @@ import asyncio
 import logging
 import time
 from urllib.parse import urlparse
-from typing import Optional, List, Union
+from typing import Optional, List, Dict, Union
 
 from starlette.background import BackgroundTask
 
@@ -36,6 +34,15 @@ from apps.webui.models.users import Users
 from apps.webui.models.prompts_classes import Prompts
 from apps.webui.models.evaluations import Evaluations
 from constants import ERROR_MESSAGES
+from utils.http_client import get_session, get_sync_session, release_response
+from utils.balancer import LoadBalancer, BalancedRequest, LOAD_BALANCER_POLICIES
+from utils.health import (
+    UpstreamHealth,
+    UpstreamUnavailableError,
+    FAILOVER_STATUSES,
+    probe_upstream,
+    request_upstream,
+)
 from utils.utils import (
     decode_token,
     get_current_user,
@@ -43,12 +50,16 @@ from utils.utils import (
     get_admin_user,
 )
 
-from utils.models import get_model_id_from_custom_model_id
+from utils.models import get_model_id_from_custom_model_id, AvailableModels
+from utils.payload import get_json_form, dump_json
+from utils.latency import StreamTimer, OLLAMA_TOKEN_MARKERS
 
 
 from config import (
     SRC_LOG_LEVELS,
     OLLAMA_BASE_URLS,
+    OLLAMA_LOAD_BALANCER_POLICY,
+    OLLAMA_BASE_URL_WEIGHTS,
     ENABLE_OLLAMA_API,
     ENABLE_MODEL_FILTER,
     MODEL_FILTER_LIST,
@@ -76,18 +87,18 @@ app.state.config.MODEL_FILTER_LIST = MODEL_FILTER_LIST
 
 app.state.config.ENABLE_OLLAMA_API = ENABLE_OLLAMA_API
 app.state.config.OLLAMA_BASE_URLS = OLLAMA_BASE_URLS
+app.state.config.OLLAMA_LOAD_BALANCER_POLICY = OLLAMA_LOAD_BALANCER_POLICY
+app.state.config.OLLAMA_BASE_URL_WEIGHTS = OLLAMA_BASE_URL_WEIGHTS
 app.state.MODELS = {}
 
-
-# TODO: Implement a more intelligent load balancing mechanism for distributing requests among multiple backend instances.
-# Current implementation uses a simple round-robin approach (random.choice). Consider incorporating algorithms like weighted round-robin,
-# least connections, or least response time for better resource utilization and performance optimization.
+app.state.BALANCER = LoadBalancer(app.state.config.OLLAMA_LOAD_BALANCER_POLICY)
 
 
 @app.middleware("http")
 async def check_url(request: Request, call_next):
+    # the shared registry refreshes every provider's model list in one load
     if len(app.state.MODELS) == 0:
-        await get_all_models()
+        await AvailableModels.get_models()
     else:
         pass
 
@@ -113,6 +124,7 @@ class OllamaConfigForm(BaseModel):
 @app.post("/config/update")
 async def update_config(form_data: OllamaConfigForm, user=Depends(get_admin_user)):
     app.state.config.ENABLE_OLLAMA_API = form_data.enable_ollama_api
+    AvailableModels.invalidate()
     return {"ENABLE_OLLAMA_API": app.state.config.ENABLE_OLLAMA_API}
 
 
@@ -128,47 +140,151 @@ class UrlUpdateForm(BaseModel):
 @app.post("/urls/update")
 async def update_ollama_api_url(form_data: UrlUpdateForm, user=Depends(get_admin_user)):
     app.state.config.OLLAMA_BASE_URLS = form_data.urls
+    AvailableModels.invalidate()
 
     log.info(f"app.state.config.OLLAMA_BASE_URLS: {app.state.config.OLLAMA_BASE_URLS}")
     return {"OLLAMA_BASE_URLS": app.state.config.OLLAMA_BASE_URLS}
 
 
+@app.get("/balancer")
+async def get_load_balancer(user=Depends(get_admin_user)):
+    return {
+        "OLLAMA_LOAD_BALANCER_POLICY": app.state.config.OLLAMA_LOAD_BALANCER_POLICY,
+        "OLLAMA_BASE_URL_WEIGHTS": app.state.config.OLLAMA_BASE_URL_WEIGHTS,
+        "policies": LOAD_BALANCER_POLICIES,
+        "upstreams": app.state.BALANCER.get_stats(app.state.config.OLLAMA_BASE_URLS),
+    }
+
+
+class LoadBalancerUpdateForm(BaseModel):
+    policy: str
+    weights: Optional[List[conint(ge=1)]] = None
+
+
+@app.post("/balancer/update")
+async def update_load_balancer(
+    form_data: LoadBalancerUpdateForm, user=Depends(get_admin_user)
+):
+    if form_data.weights is not None and len(form_data.weights) > len(
+        app.state.config.OLLAMA_BASE_URLS
+    ):
+        raise HTTPException(status_code=400, detail=ERROR_MESSAGES.INVALID_WEIGHTS)
+
+    try:
+        app.state.BALANCER.set_policy(form_data.policy)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=ERROR_MESSAGES.DEFAULT(e))
+
+    app.state.config.OLLAMA_LOAD_BALANCER_POLICY = form_data.policy
+    if form_data.weights is not None:
+        app.state.config.OLLAMA_BASE_URL_WEIGHTS = form_data.weights
+
+    return {
+        "OLLAMA_LOAD_BALANCER_POLICY": app.state.config.OLLAMA_LOAD_BALANCER_POLICY,
+        "OLLAMA_BASE_URL_WEIGHTS": app.state.config.OLLAMA_BASE_URL_WEIGHTS,
+    }
+
+
+def select_url_idx(url_idxs: List[int]) -> int:
+    # skip ejected upstreams, unless every upstream for the model is ejected
+    available = [
+        idx
+        for idx in url_idxs
+        if UpstreamHealth.is_available(app.state.config.OLLAMA_BASE_URLS[idx])
+    ]
+    if len(available) > 0:
+        url_idxs = available
+
+    urls = [app.state.config.OLLAMA_BASE_URLS[idx] for idx in url_idxs]
+    weights = [
+        (
+            app.state.config.OLLAMA_BASE_URL_WEIGHTS[idx]
+            if idx < len(app.state.config.OLLAMA_BASE_URL_WEIGHTS)
+            else 1
+        )
+        for idx in url_idxs
+    ]
+    return url_idxs[app.state.BALANCER.select(urls, weights)]
+
+
 async def fetch_url(url):
     timeout = aiohttp.ClientTimeout(total=5)
     try:
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url) as response:
-                return await response.json()
+        session = get_session(url)
+        async with session.get(url, timeout=timeout) as response:
+            return await response.json()
     except Exception as e:
         # Handle connection error here
         log.error(f"Connection error: {e}")
         return None
 
 
-async def cleanup_response(
-    response: Optional[aiohttp.ClientResponse],
-    session: Optional[aiohttp.ClientSession],
+async def release_balanced_response(
+    response: aiohttp.ClientResponse, request: Optional[BalancedRequest] = None
 ):
-    if response:
-        response.close()
-    if session:
-        await session.close()
+    await release_response(response)
+    if request:
+        request.done()
+
 
+async def stream_with_timer(stream, timer: StreamTimer):
+    output_tokens = None
+    timer.open_stream()
+    try:
+        async for line in stream:
+            timer.chunk(line)
+            # the final line of /api/chat and /api/generate carries the token count
+            if b'"eval_count"' in line:
+                try:
+                    output_tokens = json.loads(line).get("eval_count")
+                except Exception:
+                    pass
+            yield line
+    finally:
+        timer.finish(output_tokens)
+
+
+async def post_streaming_url(
+    url: str,
+    payload: Union[str, bytes],
+    upstream: str,
+    failover: bool = False,
+    timer: Optional[StreamTimer] = None,
+):
+    # upstream is the base url of `url`; the balancer tracks it until the stream ends.
+    # With failover, connection errors and 502/503/504 are raised as
+    # UpstreamUnavailableError so the caller can retry on another backend.
+    request = BalancedRequest(app.state.BALANCER, upstream)
 
-async def post_streaming_url(url: str, payload: str):
     r = None
     try:
-        session = aiohttp.ClientSession()
-        r = await session.post(url, data=payload)
+        r = await request_upstream("POST", url, upstream, timer=timer, data=payload)
+        request.mark_response()
+
+        if failover and r.status in FAILOVER_STATUSES:
+            raise UpstreamUnavailableError(upstream, f"HTTP {r.status}")
         r.raise_for_status()
 
         return StreamingResponse(
-            r.content,
+            r.content if timer is None else stream_with_timer(r.content, timer),
             status_code=r.status,
             headers=dict(r.headers),
-            background=BackgroundTask(cleanup_response, response=r, session=session),
+            background=BackgroundTask(
+                release_balanced_response, response=r, request=request
+            ),
         )
     except Exception as e:
+        request.done(failed=True)
+
+        if isinstance(e, UpstreamUnavailableError):
+            if r is not None:
+                r.release()
+            if failover:
+                raise e
+            raise HTTPException(
+                status_code=503, detail=ERROR_MESSAGES.UPSTREAM_UNAVAILABLE
+            )
+
         error_detail = "Open WebUI: Server Connection Error"
         if r is not None:
             try:
@@ -177,13 +293,50 @@ async def post_streaming_url(url: str, payload: str):
                     error_detail = f"Ollama: {res['error']}"
             except:
                 error_detail = f"Ollama: {e}"
+            finally:
+                r.release()
 
         raise HTTPException(
-            status_code=r.status if r else 500,
+            status_code=r.status if r is not None else 500,
             detail=error_detail,
         )
 
 
+def invalidate_models_after(response: StreamingResponse) -> StreamingResponse:
+    # pulled or created models only show up in the listing once the stream is done
+    response.background = BackgroundTasks(
+        [response.background, BackgroundTask(AvailableModels.invalidate)]
+    )
+    return response
+
+
+async def post_streaming_url_with_failover(
+    path: str,
+    payload: Union[str, bytes],
+    url_idxs: List[int],
+    timer: Optional[StreamTimer] = None,
+):
+    candidates = list(url_idxs)
+
+    while True:
+        url_idx = select_url_idx(candidates)
+        candidates.remove(url_idx)
+
+        url = app.state.config.OLLAMA_BASE_URLS[url_idx]
+        log.info(f"url: {url}")
+
+        try:
+            return await post_streaming_url(
+                f"{url}{path}",
+                payload,
+                upstream=url,
+                failover=len(candidates) > 0,
+                timer=timer,
+            )
+        except UpstreamUnavailableError as e:
+            log.warning(f"{e}, failing over to another backend")
+
+
 def merge_models_lists(model_lists):
     merged_models = {}
 
@@ -207,8 +360,14 @@ async def get_all_models():
     log.info("get_all_models()")
 
     if app.state.config.ENABLE_OLLAMA_API:
+        # ejected upstreams are skipped instead of waiting on them for every listing
         tasks = [
-            fetch_url(f"{url}/api/tags") for url in app.state.config.OLLAMA_BASE_URLS
+            (
+                fetch_url(f"{url}/api/tags")
+                if UpstreamHealth.is_available(url)
+                else asyncio.sleep(0, result=None)
+            )
+            for url in app.state.config.OLLAMA_BASE_URLS
         ]
         responses = await asyncio.gather(*tasks)
 
@@ -228,6 +387,19 @@ async def get_all_models():
     return models
 
 
+async def check_upstream_health():
+    if app.state.config.ENABLE_OLLAMA_API:
+        await asyncio.gather(
+            *[
+                probe_upstream(url, f"{url}/api/version")
+                for url in app.state.config.OLLAMA_BASE_URLS
+            ]
+        )
+
+
+UpstreamHealth.register_check("ollama", check_upstream_health)
+
+
 @app.get("/api/tags")
 @app.get("/api/tags/{url_idx}")
 async def get_ollama_tags(
@@ -252,25 +424,29 @@ async def get_ollama_tags(
 
         r = None
         try:
-            r = requests.request(method="GET", url=f"{url}/api/tags")
+            session = get_session(url)
+            r = await session.get(f"{url}/api/tags")
             r.raise_for_status()
 
-            return r.json()
+            return await r.json()
         except Exception as e:
             log.exception(e)
             error_detail = "Open WebUI: Server Connection Error"
             if r is not None:
                 try:
-                    res = r.json()
+                    res = await r.json()
                     if "error" in res:
                         error_detail = f"Ollama: {res['error']}"
                 except:
                     error_detail = f"Ollama: {e}"
 
             raise HTTPException(
-                status_code=r.status_code if r else 500,
+                status_code=r.status if r is not None else 500,
                 detail=error_detail,
             )
+        finally:
+            if r is not None:
+                r.release()
 
 
 @app.get("/api/version")
@@ -305,25 +481,29 @@ async def get_ollama_versions(url_idx: Optional[int] = None):
 
         r = None
         try:
-            r = requests.request(method="GET", url=f"{url}/api/version")
+            session = get_session(url)
+            r = await session.get(f"{url}/api/version")
             r.raise_for_status()
 
-            return r.json()
+            return await r.json()
         except Exception as e:
             log.exception(e)
             error_detail = "Open WebUI: Server Connection Error"
             if r is not None:
                 try:
-                    res = r.json()
+                    res = await r.json()
                     if "error" in res:
                         error_detail = f"Ollama: {res['error']}"
                 except:
                     error_detail = f"Ollama: {e}"
 
             raise HTTPException(
-                status_code=r.status_code if r else 500,
+                status_code=r.status if r is not None else 500,
                 detail=error_detail,
             )
+        finally:
+            if r is not None:
+                r.release()
 
 
 class ModelNameForm(BaseModel):
@@ -343,7 +523,10 @@ async def pull_model(
     # Admin should be able to pull models from any source
     payload = {**form_data.model_dump(exclude_none=True), "insecure": True}
 
-    return await post_streaming_url(f"{url}/api/pull", json.dumps(payload))
+    response = await post_streaming_url(
+        f"{url}/api/pull", json.dumps(payload), upstream=url
+    )
+    return invalidate_models_after(response)
 
 
 class PushModelForm(BaseModel):
@@ -372,7 +555,9 @@ async def push_model(
     log.debug(f"url: {url}")
 
     return await post_streaming_url(
-        f"{url}/api/push", form_data.model_dump_json(exclude_none=True).encode()
+        f"{url}/api/push",
+        form_data.model_dump_json(exclude_none=True).encode(),
+        upstream=url,
     )
 
 
@@ -392,9 +577,12 @@ async def create_model(
     url = app.state.config.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
-    return await post_streaming_url(
-        f"{url}/api/create", form_data.model_dump_json(exclude_none=True).encode()
+    response = await post_streaming_url(
+        f"{url}/api/create",
+        form_data.model_dump_json(exclude_none=True).encode(),
+        upstream=url,
     )
+    return invalidate_models_after(response)
 
 
 class CopyModelForm(BaseModel):
@@ -421,32 +609,37 @@ async def copy_model(
     url = app.state.config.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
+    r = None
     try:
-        r = requests.request(
-            method="POST",
-            url=f"{url}/api/copy",
+        session = get_session(url)
+        r = await session.post(
+            f"{url}/api/copy",
             data=form_data.model_dump_json(exclude_none=True).encode(),
         )
         r.raise_for_status()
 
-        log.debug(f"r.text: {r.text}")
+        log.debug(f"r.text: {await r.text()}")
 
+        AvailableModels.invalidate()
         return True
     except Exception as e:
         log.exception(e)
         error_detail = "Open WebUI: Server Connection Error"
         if r is not None:
             try:
-                res = r.json()
+                res = await r.json()
                 if "error" in res:
                     error_detail = f"Ollama: {res['error']}"
             except:
                 error_detail = f"Ollama: {e}"
 
         raise HTTPException(
-            status_code=r.status_code if r else 500,
+            status_code=r.status if r is not None else 500,
             detail=error_detail,
         )
+    finally:
+        if r is not None:
+            r.release()
 
 
 @app.delete("/api/delete")
@@ -468,32 +661,37 @@ async def delete_model(
     url = app.state.config.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
+    r = None
     try:
-        r = requests.request(
-            method="DELETE",
-            url=f"{url}/api/delete",
+        session = get_session(url)
+        r = await session.delete(
+            f"{url}/api/delete",
             data=form_data.model_dump_json(exclude_none=True).encode(),
         )
         r.raise_for_status()
 
-        log.debug(f"r.text: {r.text}")
+        log.debug(f"r.text: {await r.text()}")
 
+        AvailableModels.invalidate()
         return True
     except Exception as e:
         log.exception(e)
         error_detail = "Open WebUI: Server Connection Error"
         if r is not None:
             try:
-                res = r.json()
+                res = await r.json()
                 if "error" in res:
                     error_detail = f"Ollama: {res['error']}"
             except:
                 error_detail = f"Ollama: {e}"
 
         raise HTTPException(
-            status_code=r.status_code if r else 500,
+            status_code=r.status if r is not None else 500,
             detail=error_detail,
         )
+    finally:
+        if r is not None:
+            r.release()
 
 
 @app.post("/api/show")
@@ -504,34 +702,38 @@ async def show_model_info(form_data: ModelNameForm, user=Depends(get_verified_us
             detail=ERROR_MESSAGES.MODEL_NOT_FOUND(form_data.name),
         )
 
-    url_idx = random.choice(app.state.MODELS[form_data.name]["urls"])
+    url_idx = select_url_idx(app.state.MODELS[form_data.name]["urls"])
     url = app.state.config.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
+    r = None
     try:
-        r = requests.request(
-            method="POST",
-            url=f"{url}/api/show",
+        session = get_session(url)
+        r = await session.post(
+            f"{url}/api/show",
             data=form_data.model_dump_json(exclude_none=True).encode(),
         )
         r.raise_for_status()
 
-        return r.json()
+        return await r.json()
     except Exception as e:
         log.exception(e)
         error_detail = "Open WebUI: Server Connection Error"
         if r is not None:
             try:
-                res = r.json()
+                res = await r.json()
                 if "error" in res:
                     error_detail = f"Ollama: {res['error']}"
             except:
                 error_detail = f"Ollama: {e}"
 
         raise HTTPException(
-            status_code=r.status_code if r else 500,
+            status_code=r.status if r is not None else 500,
             detail=error_detail,
         )
+    finally:
+        if r is not None:
+            r.release()
 
 
 class GenerateEmbeddingsForm(BaseModel):
@@ -555,7 +757,7 @@ async def generate_embeddings(
             model = f"{model}:latest"
 
         if model in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[model]["urls"])
+            url_idx = select_url_idx(app.state.MODELS[model]["urls"])
         else:
             raise HTTPException(
                 status_code=400,
@@ -565,30 +767,41 @@ async def generate_embeddings(
     url = app.state.config.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
+    request = BalancedRequest(app.state.BALANCER, url)
+
+    r = None
     try:
-        r = requests.request(
-            method="POST",
-            url=f"{url}/api/embeddings",
+        session = get_session(url)
+        r = await session.post(
+            f"{url}/api/embeddings",
             data=form_data.model_dump_json(exclude_none=True).encode(),
         )
+        request.mark_response()
         r.raise_for_status()
 
-        return r.json()
+        data = await r.json()
+        request.done()
+
+        return data
     except Exception as e:
         log.exception(e)
+        request.done(failed=True)
         error_detail = "Open WebUI: Server Connection Error"
         if r is not None:
             try:
-                res = r.json()
+                res = await r.json()
                 if "error" in res:
                     error_detail = f"Ollama: {res['error']}"
             except:
                 error_detail = f"Ollama: {e}"
 
         raise HTTPException(
-            status_code=r.status_code if r else 500,
+            status_code=r.status if r is not None else 500,
             detail=error_detail,
         )
+    finally:
+        if r is not None:
+            r.release()
 
 
 def generate_ollama_embeddings(
@@ -605,7 +818,7 @@ def generate_ollama_embeddings(
             model = f"{model}:latest"
 
         if model in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[model]["urls"])
+            url_idx = select_url_idx(app.state.MODELS[model]["urls"])
         else:
             raise HTTPException(
                 status_code=400,
@@ -615,15 +828,20 @@ def generate_ollama_embeddings(
     url = app.state.config.OLLAMA_BASE_URLS[url_idx]
     log.info(f"url: {url}")
 
+    request = BalancedRequest(app.state.BALANCER, url)
+
+    r = None
     try:
-        r = requests.request(
-            method="POST",
-            url=f"{url}/api/embeddings",
+        session = get_sync_session(url)
+        r = session.post(
+            f"{url}/api/embeddings",
             data=form_data.model_dump_json(exclude_none=True).encode(),
         )
+        request.mark_response()
         r.raise_for_status()
 
         data = r.json()
+        request.done()
 
         log.info(f"generate_ollama_embeddings {data}")
 
@@ -633,6 +851,7 @@ def generate_ollama_embeddings(
             raise "Something went wrong :/"
     except Exception as e:
         log.exception(e)
+        request.done(failed=True)
         error_detail = "Open WebUI: Server Connection Error"
         if r is not None:
             try:
@@ -662,6 +881,7 @@ class GenerateCompletionForm(BaseModel):
 @app.post("/api/generate")
 @app.post("/api/generate/{url_idx}")
 async def generate_completion(
+    request: Request,
     form_data: GenerateCompletionForm,
     url_idx: Optional[int] = None,
     user=Depends(get_verified_user),
@@ -674,18 +894,20 @@ async def generate_completion(
             model = f"{model}:latest"
 
         if model in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[model]["urls"])
+            url_idxs = app.state.MODELS[model]["urls"]
         else:
             raise HTTPException(
                 status_code=400,
                 detail=ERROR_MESSAGES.MODEL_NOT_FOUND(form_data.model),
             )
+    else:
+        url_idxs = [url_idx]
 
-    url = app.state.config.OLLAMA_BASE_URLS[url_idx]
-    log.info(f"url: {url}")
-
-    return await post_streaming_url(
-        f"{url}/api/generate", form_data.model_dump_json(exclude_none=True).encode()
+    return await post_streaming_url_with_failover(
+        "/api/generate",
+        form_data.model_dump_json(exclude_none=True).encode(),
+        url_idxs,
+        timer=StreamTimer(request, form_data.model, OLLAMA_TOKEN_MARKERS),
     )
 
 
@@ -710,16 +932,13 @@ class GenerateChatCompletionForm(BaseModel):
 @app.post("/api/chat")
 @app.post("/api/chat/{url_idx}")
 async def generate_chat_completion(
-    form_data: GenerateChatCompletionForm,
+    request: Request,
     url_idx: Optional[int] = None,
     user=Depends(get_verified_user),
 ):
-
-    log.debug(
-        "form_data.model_dump_json(exclude_none=True).encode(): {0} ".format(
-            form_data.model_dump_json(exclude_none=True).encode()
-        )
-    )
+    # the body was already parsed by the middlewares and is shared through request.state
+    form_data = await get_json_form(request, GenerateChatCompletionForm)
+    log.debug("form_data: %s", form_data)
 
     payload = {
         **form_data.model_dump(exclude_none=True),
@@ -834,12 +1053,14 @@ async def generate_chat_completion(
             payload["model"] = f"{payload['model']}:latest"
 
         if payload["model"] in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[payload["model"]]["urls"])
+            url_idxs = app.state.MODELS[payload["model"]]["urls"]
         else:
             raise HTTPException(
                 status_code=400,
                 detail=ERROR_MESSAGES.MODEL_NOT_FOUND(form_data.model),
             )
+    else:
+        url_idxs = [url_idx]
 
     # Replace prompt command with prompt content so end users cannot see prompt
     if "profile_id" in payload:
@@ -869,10 +1090,12 @@ async def generate_chat_completion(
 
         del payload["evaluation_id"]
 
-    url = app.state.config.OLLAMA_BASE_URLS[url_idx]
-    log.info(f"url: {url}")
-
-    return await post_streaming_url(f"{url}/api/chat", json.dumps(payload))
+    return await post_streaming_url_with_failover(
+        "/api/chat",
+        dump_json(payload),
+        url_idxs,
+        timer=StreamTimer(request, payload.get("model"), OLLAMA_TOKEN_MARKERS),
+    )
 
 
 # TODO: we should update this part once Ollama supports other types
@@ -893,10 +1116,12 @@ class OpenAIChatCompletionForm(BaseModel):
 @app.post("/v1/chat/completions")
 @app.post("/v1/chat/completions/{url_idx}")
 async def generate_openai_chat_completion(
-    form_data: OpenAIChatCompletionForm,
+    request: Request,
     url_idx: Optional[int] = None,
     user=Depends(get_verified_user),
 ):
+    # the body was already parsed by the middlewares and is shared through request.state
+    form_data = await get_json_form(request, OpenAIChatCompletionForm)
 
     payload = {
         **form_data.model_dump(exclude_none=True),
@@ -953,12 +1178,14 @@ async def generate_openai_chat_completion(
             payload["model"] = f"{payload['model']}:latest"
 
         if payload["model"] in app.state.MODELS:
-            url_idx = random.choice(app.state.MODELS[payload["model"]]["urls"])
+            url_idxs = app.state.MODELS[payload["model"]]["urls"]
         else:
             raise HTTPException(
                 status_code=400,
                 detail=ERROR_MESSAGES.MODEL_NOT_FOUND(form_data.model),
             )
+    else:
+        url_idxs = [url_idx]
 
     # Replace prompt command with prompt content so end users cannot see prompt
     if "profile_id" in payload:
@@ -988,10 +1215,12 @@ async def generate_openai_chat_completion(
 
         del payload["evaluation_id"]
 
-    url = app.state.config.OLLAMA_BASE_URLS[url_idx]
-    log.info(f"url: {url}")
-
-    return await post_streaming_url(f"{url}/v1/chat/completions", json.dumps(payload))
+    return await post_streaming_url_with_failover(
+        "/v1/chat/completions",
+        dump_json(payload),
+        url_idxs,
+        timer=StreamTimer(request, payload.get("model"), OLLAMA_TOKEN_MARKERS),
+    )
 
 
 @app.get("/v1/models")
@@ -1028,11 +1257,14 @@ async def get_openai_models(
 
     else:
         url = app.state.config.OLLAMA_BASE_URLS[url_idx]
+
+        r = None
         try:
-            r = requests.request(method="GET", url=f"{url}/api/tags")
+            session = get_session(url)
+            r = await session.get(f"{url}/api/tags")
             r.raise_for_status()
 
-            models = r.json()
+            models = await r.json()
 
             return {
                 "data": [
@@ -1052,16 +1284,19 @@ async def get_openai_models(
             error_detail = "Open WebUI: Server Connection Error"
             if r is not None:
                 try:
-                    res = r.json()
+                    res = await r.json()
                     if "error" in res:
                         error_detail = f"Ollama: {res['error']}"
                 except:
                     error_detail = f"Ollama: {e}"
 
             raise HTTPException(
-                status_code=r.status_code if r else 500,
+                status_code=r.status if r is not None else 500,
                 detail=error_detail,
             )
+        finally:
+            if r is not None:
+                r.release()
 
 
 class UrlForm(BaseModel):
@@ -1103,39 +1338,40 @@ async def download_file_stream(
 
     timeout = aiohttp.ClientTimeout(total=600)  # Set the timeout
 
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        async with session.get(file_url, headers=headers) as response:
-            total_size = int(response.headers.get("content-length", 0)) + current_size
+    session = get_session(file_url)
+    async with session.get(file_url, headers=headers, timeout=timeout) as response:
+        total_size = int(response.headers.get("content-length", 0)) + current_size
 
-            with open(file_path, "ab+") as file:
-                async for data in response.content.iter_chunked(chunk_size):
-                    current_size += len(data)
-                    file.write(data)
+        with open(file_path, "ab+") as file:
+            async for data in response.content.iter_chunked(chunk_size):
+                current_size += len(data)
+                file.write(data)
 
-                    done = current_size == total_size
-                    progress = round((current_size / total_size) * 100, 2)
+                done = current_size == total_size
+                progress = round((current_size / total_size) * 100, 2)
 
-                    yield f'data: {{"progress": {progress}, "completed": {current_size}, "total": {total_size}}}\n\n'
+                yield f'data: {{"progress": {progress}, "completed": {current_size}, "total": {total_size}}}\n\n'
 
-                if done:
-                    file.seek(0)
-                    hashed = calculate_sha256(file)
-                    file.seek(0)
+            if done:
+                file.seek(0)
+                hashed = calculate_sha256(file)
+                file.seek(0)
 
-                    url = f"{ollama_url}/api/blobs/sha256:{hashed}"
-                    response = requests.post(url, data=file)
+                url = f"{ollama_url}/api/blobs/sha256:{hashed}"
+                async with get_session(url).post(url, data=file) as response:
+                    ok = response.ok
 
-                    if response.ok:
-                        res = {
-                            "done": done,
-                            "blob": f"sha256:{hashed}",
-                            "name": file_name,
-                        }
-                        os.remove(file_path)
+                if ok:
+                    res = {
+                        "done": done,
+                        "blob": f"sha256:{hashed}",
+                        "name": file_name,
+                    }
+                    os.remove(file_path)
 
-                        yield f"data: {json.dumps(res)}\n\n"
-                    else:
-                        raise "Ollama: Could not create blob, Please try again."
+                    yield f"data: {json.dumps(res)}\n\n"
+                else:
+                    raise "Ollama: Could not create blob, Please try again."
 
 
 # def number_generator():
@@ -1278,6 +1514,18 @@ def upload_model(file: UploadFile = File(...), url_idx: Optional[int] = None):
 #     )
 
 
+# request id -> cancel event for the streams proxied below
+REQUEST_POOL: Dict[str, asyncio.Event] = {}
+
+
+@app.get("/cancel/{request_id}")
+async def cancel_ollama_request(request_id: str, user=Depends(get_verified_user)):
+    cancel_event = REQUEST_POOL.get(request_id)
+    if cancel_event is not None:
+        cancel_event.set()
+    return True
+
+
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def deprecated_proxy(
     path: str, request: Request, user=Depends(get_verified_user)
@@ -1299,72 +1547,69 @@ async def deprecated_proxy(
     headers.pop("authorization", None)
     headers.pop("origin", None)
     headers.pop("referer", None)
+    headers.pop("content-length", None)
 
     r = None
+    request_id = str(uuid.uuid4())
 
-    def get_request():
-        nonlocal r
-
-        request_id = str(uuid.uuid4())
-        try:
-            REQUEST_POOL.append(request_id)
-
-            def stream_content():
-                try:
-                    if path == "generate":
-                        data = json.loads(body.decode("utf-8"))
+    try:
+        r = await request_upstream(
+            request.method, target_url, url, data=body, headers=headers
+        )
+        r.raise_for_status()
 
-                        if data.get("stream", True):
-                            yield json.dumps({"id": request_id, "done": False}) + "\n"
+        async def stream_content():
+            # registered once streaming starts: the finally below never runs for a
+            # client that disconnects before then
+            cancel_event = asyncio.Event()
+            REQUEST_POOL[request_id] = cancel_event
+            try:
+                if path == "generate":
+                    data = json.loads(body.decode("utf-8"))
 
-                    elif path == "chat":
+                    if data.get("stream", True):
                         yield json.dumps({"id": request_id, "done": False}) + "\n"
 
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if request_id in REQUEST_POOL:
-                            yield chunk
-                        else:
-                            log.warning("User: canceled request")
-                            break
-                finally:
-                    if hasattr(r, "close"):
-                        r.close()
-                        if request_id in REQUEST_POOL:
-                            REQUEST_POOL.remove(request_id)
-
-            r = requests.request(
-                method=request.method,
-                url=target_url,
-                data=body,
-                headers=headers,
-                stream=True,
-            )
-
-            r.raise_for_status()
+                elif path == "chat":
+                    yield json.dumps({"id": request_id, "done": False}) + "\n"
 
-            # r.close()
+                async for chunk in r.content.iter_chunked(8192):
+                    if cancel_event.is_set():
+                        log.warning("User: canceled request")
+                        break
+                    yield chunk
+            finally:
+                REQUEST_POOL.pop(request_id, None)
 
-            return StreamingResponse(
-                stream_content(),
-                status_code=r.status_code,
-                headers=dict(r.headers),
-            )
-        except Exception as e:
-            raise e
+        # the preamble changes the body length, so let the server re-frame it
+        response_headers = dict(r.headers)
+        response_headers.pop("Content-Length", None)
+        response_headers.pop("Transfer-Encoding", None)
 
-    try:
-        return await run_in_threadpool(get_request)
+        return StreamingResponse(
+            stream_content(),
+            status_code=r.status,
+            headers=response_headers,
+            background=BackgroundTask(release_response, response=r),
+        )
+    except UpstreamUnavailableError as e:
+        log.error(e)
+        raise HTTPException(
+            status_code=503, detail=ERROR_MESSAGES.UPSTREAM_UNAVAILABLE
+        )
     except Exception as e:
         error_detail = "Open WebUI: Server Connection Error"
         if r is not None:
             try:
-                res = r.json()
+                res = await r.json()
                 if "error" in res:
                     error_detail = f"Ollama: {res['error']}"
             except:
                 error_detail = f"Ollama: {e}"
+            finally:
+                r.release()
 
         raise HTTPException(
-            status_code=r.status_code if r else 500,
+            status_code=r.status if r is not None else 500,
             detail=error_detail,
         )
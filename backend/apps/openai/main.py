@@ -2,7 +2,6 @@ from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, FileResponse
 
-import requests
 import aiohttp
 import asyncio
 import json
@@ -12,11 +11,23 @@ from pydantic import BaseModel
 from starlette.background import BackgroundTask
 
 from apps.webui.models.models import Models
-from apps.webui.models.users import Users
-from apps.webui.models.metrics import Metrics, MetricForm
+from apps.webui.models.metrics import MetricForm
 from apps.webui.models.prompts_classes import Prompts
 from apps.webui.models.evaluations import Evaluations
 from constants import ERROR_MESSAGES
+from utils.http_client import get_session, release_response
+from utils.models import AvailableModels
+from utils.payload import get_json_body, dump_json
+from utils.accounting import TokenAccounting
+from utils.usage import parse_usage_event, OPENAI_USAGE_MARKERS
+from utils.latency import StreamTimer, OPENAI_TOKEN_MARKERS
+from utils.health import (
+    UpstreamHealth,
+    UpstreamUnavailableError,
+    FAILOVER_STATUSES,
+    probe_upstream,
+    request_upstream,
+)
 from utils.utils import (
     get_current_user,
     get_verified_user,
@@ -65,8 +76,9 @@ app.state.MODELS = {}
 
 @app.middleware("http")
 async def check_url(request: Request, call_next):
+    # the shared registry refreshes every provider's model list in one load
     if len(app.state.MODELS) == 0:
-        await get_all_models()
+        await AvailableModels.get_models()
     else:
         pass
 
@@ -86,6 +98,7 @@ class OpenAIConfigForm(BaseModel):
 @app.post("/config/update")
 async def update_config(form_data: OpenAIConfigForm, user=Depends(get_admin_user)):
     app.state.config.ENABLE_OPENAI_API = form_data.enable_openai_api
+    AvailableModels.invalidate()
     return {"ENABLE_OPENAI_API": app.state.config.ENABLE_OPENAI_API}
 
 
@@ -106,6 +119,7 @@ async def get_openai_urls(user=Depends(get_admin_user)):
 async def update_openai_urls(form_data: UrlsUpdateForm, user=Depends(get_admin_user)):
     await get_all_models()
     app.state.config.OPENAI_API_BASE_URLS = form_data.urls
+    AvailableModels.invalidate()
     return {"OPENAI_API_BASE_URLS": app.state.config.OPENAI_API_BASE_URLS}
 
 
@@ -117,6 +131,7 @@ async def get_openai_keys(user=Depends(get_admin_user)):
 @app.post("/keys/update")
 async def update_openai_key(form_data: KeysUpdateForm, user=Depends(get_admin_user)):
     app.state.config.OPENAI_API_KEYS = form_data.keys
+    AvailableModels.invalidate()
     return {"OPENAI_API_KEYS": app.state.config.OPENAI_API_KEYS}
 
 
@@ -145,18 +160,18 @@ async def speech(request: Request, user=Depends(get_verified_user)):
             headers["X-Title"] = "Open WebUI"
         r = None
         try:
-            r = requests.post(
+            session = get_session(app.state.config.OPENAI_API_BASE_URLS[idx])
+            r = await session.post(
                 url=f"{app.state.config.OPENAI_API_BASE_URLS[idx]}/audio/speech",
                 data=body,
                 headers=headers,
-                stream=True,
             )
 
             r.raise_for_status()
 
             # Save the streaming content to a file
             with open(file_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
+                async for chunk in r.content.iter_chunked(8192):
                     f.write(chunk)
 
             with open(file_body_path, "w") as f:
@@ -170,15 +185,18 @@ async def speech(request: Request, user=Depends(get_verified_user)):
             error_detail = "Open WebUI: Server Connection Error"
             if r is not None:
                 try:
-                    res = r.json()
+                    res = await r.json()
                     if "error" in res:
                         error_detail = f"External: {res['error']}"
                 except:
                     error_detail = f"External: {e}"
 
             raise HTTPException(
-                status_code=r.status_code if r else 500, detail=error_detail
+                status_code=r.status if r is not None else 500, detail=error_detail
             )
+        finally:
+            if r is not None:
+                r.release()
 
     except ValueError:
         raise HTTPException(status_code=401, detail=ERROR_MESSAGES.OPENAI_NOT_FOUND)
@@ -188,25 +206,15 @@ async def fetch_url(url, key):
     timeout = aiohttp.ClientTimeout(total=5)
     try:
         headers = {"Authorization": f"Bearer {key}"}
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url, headers=headers) as response:
-                return await response.json()
+        session = get_session(url)
+        async with session.get(url, headers=headers, timeout=timeout) as response:
+            return await response.json()
     except Exception as e:
         # Handle connection error here
         log.error(f"Connection error: {e}")
         return None
 
 
-async def cleanup_response(
-    response: Optional[aiohttp.ClientResponse],
-    session: Optional[aiohttp.ClientSession],
-):
-    if response:
-        response.close()
-    if session:
-        await session.close()
-
-
 def merge_models_lists(model_lists):
     log.debug(f"merge_models_lists {model_lists}")
     merged_list = []
@@ -262,8 +270,13 @@ async def get_all_models(raw: bool = False):
                     )
                 ]
 
+        # ejected upstreams are skipped instead of waiting on them for every listing
         tasks = [
-            fetch_url(f"{url}/models", app.state.config.OPENAI_API_KEYS[idx])
+            (
+                fetch_url(f"{url}/models", app.state.config.OPENAI_API_KEYS[idx])
+                if UpstreamHealth.is_available(url)
+                else asyncio.sleep(0, result=None)
+            )
             for idx, url in enumerate(app.state.config.OPENAI_API_BASE_URLS)
         ]
 
@@ -289,11 +302,89 @@ async def get_all_models(raw: bool = False):
         }
 
         log.debug(f"models: {models}")
-        app.state.MODELS = {model["id"]: model for model in models["data"]}
+        app.state.MODELS = {}
+        for model in models["data"]:
+            # keep every url serving this model id so requests can fail over
+            if model["id"] in app.state.MODELS:
+                model["urlIdxs"] = app.state.MODELS[model["id"]]["urlIdxs"] + [
+                    model["urlIdx"]
+                ]
+            else:
+                model["urlIdxs"] = [model["urlIdx"]]
+            app.state.MODELS[model["id"]] = model
 
     return models
 
 
+async def check_upstream_health():
+    if app.state.config.ENABLE_OPENAI_API:
+        await asyncio.gather(
+            *[
+                probe_upstream(
+                    url,
+                    f"{url}/models",
+                    headers={"Authorization": f"Bearer {app.state.config.OPENAI_API_KEYS[idx]}"},
+                )
+                for idx, url in enumerate(app.state.config.OPENAI_API_BASE_URLS)
+                if idx < len(app.state.config.OPENAI_API_KEYS)
+            ]
+        )
+
+
+UpstreamHealth.register_check("openai", check_upstream_health)
+
+
+def get_upstream_headers(idx: int) -> dict:
+    headers = {}
+    headers["Authorization"] = f"Bearer {app.state.config.OPENAI_API_KEYS[idx]}"
+    headers["Content-Type"] = "application/json"
+    return headers
+
+
+async def send_upstream_request(
+    method: str,
+    path: str,
+    data,
+    url_idxs: List[int],
+    timer: Optional[StreamTimer] = None,
+) -> aiohttp.ClientResponse:
+    # try healthy upstreams serving the model first, failing over on
+    # connection errors, timeouts and 502/503/504
+    candidates = [
+        idx
+        for idx in url_idxs
+        if UpstreamHealth.is_available(app.state.config.OPENAI_API_BASE_URLS[idx])
+    ]
+    if len(candidates) == 0:
+        candidates = url_idxs
+
+    for i, idx in enumerate(candidates):
+        url = app.state.config.OPENAI_API_BASE_URLS[idx]
+        last = i == len(candidates) - 1
+
+        try:
+            r = await request_upstream(
+                method,
+                f"{url}/{path}",
+                url,
+                timer=timer,
+                data=data,
+                headers=get_upstream_headers(idx),
+            )
+        except UpstreamUnavailableError as e:
+            if last:
+                raise e
+            log.warning(f"{e}, failing over to another backend")
+            continue
+
+        if r.status in FAILOVER_STATUSES and not last:
+            log.warning(f"{url} returned {r.status}, failing over to another backend")
+            r.release()
+            continue
+
+        return r
+
+
 @app.get("/models")
 @app.get("/models/{url_idx}")
 async def get_models(url_idx: Optional[int] = None, user=Depends(get_current_user)):
@@ -320,10 +411,11 @@ async def get_models(url_idx: Optional[int] = None, user=Depends(get_current_use
         r = None
 
         try:
-            r = requests.request(method="GET", url=f"{url}/models", headers=headers)
+            session = get_session(url)
+            r = await session.get(f"{url}/models", headers=headers)
             r.raise_for_status()
 
-            response_data = r.json()
+            response_data = await r.json()
             if "api.openai.com" in url:
                 response_data["data"] = list(
                     filter(lambda model: "gpt" in model["id"], response_data["data"])
@@ -335,23 +427,27 @@ async def get_models(url_idx: Optional[int] = None, user=Depends(get_current_use
             error_detail = "Open WebUI: Server Connection Error"
             if r is not None:
                 try:
-                    res = r.json()
+                    res = await r.json()
                     if "error" in res:
                         error_detail = f"External: {res['error']}"
                 except:
                     error_detail = f"External: {e}"
 
             raise HTTPException(
-                status_code=r.status_code if r else 500,
+                status_code=r.status if r is not None else 500,
                 detail=error_detail,
             )
+        finally:
+            if r is not None:
+                r.release()
 
 
 @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
     idx = 0
+    url_idxs = None
 
-    body = await request.body()
+    body = None
     # TODO: Remove below after gpt-4-vision fix from Open AI
     # Try to decode the body of the request from bytes to a UTF-8 string (Require add max_token to fix gpt-4-vision)
 
@@ -359,11 +455,12 @@ async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
     model_str = ""
     chat_id = ""
     is_eval = False
+    timer = None
 
     try:
         if "chat/completions" in path:
-            body = body.decode("utf-8")
-            body = json.loads(body)
+            # parsed once by the middlewares and shared through request.state
+            body = await get_json_body(request)
 
             payload = {**body}
             model_id: str
@@ -454,6 +551,7 @@ async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
             model = app.state.MODELS[payload.get("model")]
 
             idx = model["urlIdx"]
+            url_idxs = [idx] + [i for i in model.get("urlIdxs", []) if i != idx]
 
             if "pipeline" in model and model.get("pipeline"):
                 payload["user"] = {"name": user.name, "id": user.id}
@@ -467,32 +565,27 @@ async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
 
             payload["stream_options"] = {"include_usage": True}
 
+            timer = StreamTimer(request, payload.get("model"), OPENAI_TOKEN_MARKERS)
+
             # Convert the modified body back to JSON
-            payload = json.dumps(payload)
+            payload = dump_json(payload)
 
     except json.JSONDecodeError as e:
         log.error("Error loading request body into a dictionary:", e)
 
-    url = app.state.config.OPENAI_API_BASE_URLS[idx]
-    key = app.state.config.OPENAI_API_KEYS[idx]
-
-    target_url = f"{url}/{path}"
-
-    headers = {}
-    headers["Authorization"] = f"Bearer {key}"
-    headers["Content-Type"] = "application/json"
+    if payload is None:
+        body = await request.body()
 
     r = None
-    session = None
     streaming = False
 
     try:
-        session = aiohttp.ClientSession()
-        r = await session.request(
-            method=request.method,
-            url=target_url,
-            data=payload if payload else body,
-            headers=headers,
+        r = await send_upstream_request(
+            request.method,
+            path,
+            payload if payload else body,
+            url_idxs if url_idxs else [idx],
+            timer=timer,
         )
 
         r.raise_for_status()
@@ -501,12 +594,10 @@ async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
         if "text/event-stream" in r.headers.get("Content-Type", ""):
             streaming = True
             return StreamingResponse(
-                stream_token_counter(r.content, user.id, chat_id, model_str, is_eval),
+                stream_token_counter(r.content, user.id, chat_id, model_str, is_eval, timer),
                 status_code=r.status,
                 headers=dict(r.headers),
-                background=BackgroundTask(
-                    cleanup_response, response=r, session=session
-                ),
+                background=BackgroundTask(release_response, response=r),
             )
         else:
             response_data = await r.json()
@@ -514,16 +605,20 @@ async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
             if response_data is not None and response_data.get("usage"):
                 input_tokens = response_data["usage"]["prompt_tokens"]
                 output_tokens = response_data["usage"]["completion_tokens"]
-                Metrics.update_metric_entry(
+                TokenAccounting.record(
                         MetricForm(user_id=user.id,
                                    chat_id=chat_id,
                                    selected_model_id=model_str,
                                    input_tokens=input_tokens,
                                    output_tokens=output_tokens,
                                    message_count=1 if not is_eval else 0))
-                Users.increment_user_token_count_by_id(user.id, input_tokens + output_tokens)
 
             return response_data
+    except UpstreamUnavailableError as e:
+        log.error(e)
+        raise HTTPException(
+            status_code=503, detail=ERROR_MESSAGES.UPSTREAM_UNAVAILABLE
+        )
     except Exception as e:
         log.exception(e)
         error_detail = "Open WebUI: Server Connection Error"
@@ -537,33 +632,38 @@ async def proxy(path: str, request: Request, user=Depends(get_verified_user)):
                 error_detail = f"External: {e}"
         raise HTTPException(status_code=r.status if r else 500, detail=error_detail)
     finally:
-        if not streaming and session:
-            if r:
-                r.close()
-            await session.close()
+        if not streaming and r is not None:
+            r.release()
 
 
-async def stream_token_counter(stream, user_id, chat_id, model_id, is_eval):
+async def stream_token_counter(stream, user_id, chat_id, model_id, is_eval, timer=None):
     # reads stream and increments token count if usage found in stream
-    async for line in stream:
-        try:
-            result = None
-            if line.startswith(b"data: "):
-                result = json.loads(line[6:])  # strip "data: " at the front of response
-
-            if result is not None and result.get("usage"):
-                input_tokens = result["usage"]["prompt_tokens"]
-                output_tokens = result["usage"]["completion_tokens"]
-                Metrics.update_metric_entry(
-                        MetricForm(user_id=user_id,
-                                   chat_id=chat_id,
-                                   selected_model_id=model_id,
-                                   input_tokens=input_tokens,
-                                   output_tokens=output_tokens,
-                                   message_count=1 if not is_eval else 0))
-                Users.increment_user_token_count_by_id(user_id, input_tokens + output_tokens)
-
-        except json.decoder.JSONDecodeError:
-            pass
-        finally:
-            yield line
+    output_tokens = None
+    if timer is not None:
+        timer.open_stream()
+    try:
+        async for line in stream:
+            try:
+                if timer is not None:
+                    timer.chunk(line)
+
+                result = parse_usage_event(line, OPENAI_USAGE_MARKERS)
+
+                if result is not None and result.get("usage"):
+                    input_tokens = result["usage"]["prompt_tokens"]
+                    output_tokens = result["usage"]["completion_tokens"]
+                    TokenAccounting.record(
+                            MetricForm(user_id=user_id,
+                                       chat_id=chat_id,
+                                       selected_model_id=model_id,
+                                       input_tokens=input_tokens,
+                                       output_tokens=output_tokens,
+                                       message_count=1 if not is_eval else 0))
+
+            except Exception as e:
+                log.error(f"Error recording token usage: {e}")
+            finally:
+                yield line
+    finally:
+        if timer is not None:
+            timer.finish(output_tokens)
@@ -0,0 +1,57 @@
+"""
+Rewrites the stored chat JSON of existing rows in the compressed or the plain
+encoding of CompressedTextField. Run it from the backend directory:
+
+    python -m apps.webui.internal.compress_chats              # compress
+    python -m apps.webui.internal.compress_chats --decompress # e.g. before a downgrade
+
+New writes follow ENABLE_CHAT_COMPRESSION, so set it to match before restarting.
+Rows that already have the requested encoding are skipped and the tool can be
+stopped and run again at any time. With SQLite the file only shrinks after VACUUM.
+"""
+
+import argparse
+
+import peewee as pw
+
+from apps.webui.internal.db import DB, compress_text, decompress_text
+from apps.webui.models.chats import Chat, ChatMessage
+
+
+def rewrite_column(model, field, convert, batch_size: int) -> int:
+    primary_key = model._meta.primary_key
+    ids = [id for id, in model.select(primary_key).tuples()]
+
+    rewritten = 0
+    for batch in pw.chunked(ids, batch_size):
+        # the stored text as it is, without CompressedTextField decoding it
+        query = model.select(primary_key, pw.fn.COALESCE(field, "").coerce(False))\
+            .where(primary_key.in_(batch))
+        with DB.atomic():
+            for id, stored in query.tuples():
+                value = convert(stored)
+                if value != stored:
+                    model.update({field: pw.Value(value, converter=False)})\
+                        .where(primary_key == id).execute()
+                    rewritten += 1
+    return rewritten
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--decompress", action="store_true", help="write the plain JSON back")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM a SQLite database afterwards")
+    args = parser.parse_args()
+
+    convert = decompress_text if args.decompress else compress_text
+    for model, field in ((Chat, Chat.chat), (ChatMessage, ChatMessage.message)):
+        rewritten = rewrite_column(model, field, convert, args.batch_size)
+        print(f"{model._meta.table_name}: rewrote {rewritten} rows")
+
+    if args.vacuum and isinstance(DB, pw.SqliteDatabase):
+        DB.execute_sql("VACUUM")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,19 @@
+import base64
 import json
+import zlib
 
 import peewee as pw
 from peewee_migrate import Router
 from playhouse.db_url import connect
-from config import SRC_LOG_LEVELS, DATA_DIR, DATABASE_URL, BACKEND_DIR
+from config import (
+    SRC_LOG_LEVELS,
+    DATA_DIR,
+    DATABASE_URL,
+    BACKEND_DIR,
+    ENABLE_CHAT_COMPRESSION,
+    CHAT_COMPRESSION_MIN_SIZE,
+)
+from utils.telemetry import time_queries
 import os
 import logging
 
@@ -20,6 +30,61 @@ class JSONField(pw.TextField):
             return json.loads(value)
 
 
+# version tag of compressed values; uncompressed JSON never starts with it
+ZLIB_PREFIX = "zlib:"
+
+
+def compress_text(value: str) -> str:
+    if value.startswith(ZLIB_PREFIX) or len(value) < CHAT_COMPRESSION_MIN_SIZE:
+        return value
+    compressed = ZLIB_PREFIX + base64.b64encode(zlib.compress(value.encode("utf-8"))).decode("ascii")
+    return compressed if len(compressed) < len(value) else value
+
+
+def decompress_text(value: str) -> str:
+    if value.startswith(ZLIB_PREFIX):
+        return zlib.decompress(base64.b64decode(value[len(ZLIB_PREFIX):])).decode("utf-8")
+    return value
+
+
+class CompressedTextField(pw.TextField):
+    """
+    Text that is written compressed when ENABLE_CHAT_COMPRESSION is set: "zlib:"
+    followed by the base64 of the zlib-compressed UTF-8. Values are read by their
+    prefix, so rows written before, or with compression turned off, stay readable.
+    """
+
+    def db_value(self, value):
+        if value is not None and ENABLE_CHAT_COMPRESSION:
+            return compress_text(value)
+        return value
+
+    def python_value(self, value):
+        if value is not None:
+            return decompress_text(value)
+
+
+
+def iter_batches(query: pw.ModelSelect, key: pw.Field, batch_size: int = 500):
+    """
+    Yields the rows of `query` in lists of up to `batch_size`, ordered by the unique
+    `key`. Each list is a separate query starting after the last key, so memory
+    stays constant and no cursor is held open between batches.
+    """
+    last = None
+    while True:
+        batch_query = query.order_by(key).limit(batch_size)
+        if last is not None:
+            batch_query = batch_query.where(key > last)
+
+        rows = list(batch_query)
+        if rows:
+            yield rows
+        if len(rows) < batch_size:
+            return
+        last = getattr(rows[-1], key.name)
+
+
 # Check if the file exists
 if os.path.exists(f"{DATA_DIR}/ollama.db"):
     # Rename the file
@@ -37,3 +102,4 @@ router = Router(
 )
 router.run()
 DB.connect(reuse_if_open=True)
+time_queries(DB)
@@ -0,0 +1,81 @@
+"""Peewee migrations -- 038_add_metric_indexes.py.
+
+Some examples (model - class or model name)::
+
+    > Model = migrator.orm['table_name']            # Return model in current state by name
+    > Model = migrator.ModelClass                   # Return model in current state by name
+
+    > migrator.sql(sql)                             # Run custom SQL
+    > migrator.run(func, *args, **kwargs)           # Run python function with the given args
+    > migrator.create_model(Model)                  # Create a model (could be used as decorator)
+    > migrator.remove_model(model, cascade=True)    # Remove a model
+    > migrator.add_fields(model, **fields)          # Add fields to a model
+    > migrator.change_fields(model, **fields)       # Change fields
+    > migrator.remove_fields(model, *field_names, cascade=True)
+    > migrator.rename_field(model, old_field_name, new_field_name)
+    > migrator.rename_table(model, new_table_name)
+    > migrator.add_index(model, *col_names, unique=False)
+    > migrator.add_not_null(model, *field_names)
+    > migrator.add_default(model, field_name, default)
+    > migrator.add_constraint(model, name, sql)
+    > migrator.drop_index(model, *col_names)
+    > migrator.drop_not_null(model, *field_names)
+    > migrator.drop_constraints(model, *constraints)
+
+"""
+
+from contextlib import suppress
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+with suppress(ImportError):
+    import playhouse.postgres_ext as pw_pext
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your migrations here."""
+    Metric = migrator.orm["metric"]
+    key = (Metric.user_id, Metric.chat_id, Metric.model_id, Metric.date)
+
+    # Concurrent get-or-create could leave several rows for one key; merge them into
+    # the oldest row so the unique index can be built
+    duplicates = (
+        Metric.select(
+            *key,
+            pw.fn.MIN(Metric.id).alias("keep_id"),
+            pw.fn.SUM(Metric.input_tokens).alias("total_input_tokens"),
+            pw.fn.SUM(Metric.output_tokens).alias("total_output_tokens"),
+            pw.fn.SUM(Metric.message_count).alias("total_message_count"),
+        )
+        .group_by(*key)
+        .having(pw.fn.COUNT(Metric.id) > 1)
+        .dicts()
+    )
+    for row in list(duplicates):
+        Metric.update(
+            input_tokens=row["total_input_tokens"],
+            output_tokens=row["total_output_tokens"],
+            message_count=row["total_message_count"],
+        ).where(Metric.id == row["keep_id"]).execute()
+
+        Metric.delete().where(
+            (Metric.user_id == row["user_id"])
+            & (Metric.chat_id == row["chat_id"])
+            & (Metric.model_id == row["model_id"])
+            & (Metric.date == row["date"])
+            & (Metric.id != row["keep_id"])
+        ).execute()
+
+    migrator.add_index("metric", "user_id", "chat_id", "model_id", "date", unique=True)
+    migrator.add_index("metric", "chat_id")
+    migrator.add_index("metric", "date")
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your rollback migrations here."""
+
+    migrator.drop_index("metric", "date")
+    migrator.drop_index("metric", "chat_id")
+    migrator.drop_index("metric", "user_id", "chat_id", "model_id", "date")
@@ -0,0 +1,101 @@
+"""Peewee migrations -- 039_add_metric_rollup_table.py.
+
+Some examples (model - class or model name)::
+
+    > Model = migrator.orm['table_name']            # Return model in current state by name
+    > Model = migrator.ModelClass                   # Return model in current state by name
+
+    > migrator.sql(sql)                             # Run custom SQL
+    > migrator.run(func, *args, **kwargs)           # Run python function with the given args
+    > migrator.create_model(Model)                  # Create a model (could be used as decorator)
+    > migrator.remove_model(model, cascade=True)    # Remove a model
+    > migrator.add_fields(model, **fields)          # Add fields to a model
+    > migrator.change_fields(model, **fields)       # Change fields
+    > migrator.remove_fields(model, *field_names, cascade=True)
+    > migrator.rename_field(model, old_field_name, new_field_name)
+    > migrator.rename_table(model, new_table_name)
+    > migrator.add_index(model, *col_names, unique=False)
+    > migrator.add_not_null(model, *field_names)
+    > migrator.add_default(model, field_name, default)
+    > migrator.add_constraint(model, name, sql)
+    > migrator.drop_index(model, *col_names)
+    > migrator.drop_not_null(model, *field_names)
+    > migrator.drop_constraints(model, *constraints)
+
+"""
+
+import datetime
+from contextlib import suppress
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+with suppress(ImportError):
+    import playhouse.postgres_ext as pw_pext
+
+
+def backfill_metric_rollups(migrator: Migrator):
+    Metric = migrator.orm["metric"]
+    Chat = migrator.orm["chat"]
+    MetricRollup = migrator.orm["metricrollup"]
+
+    chat_refs = {chat.id: (chat.class_id, chat.prompt_id)
+                 for chat in Chat.select(Chat.id, Chat.class_id, Chat.prompt_id).iterator()}
+
+    rollups = {}
+    for metric in Metric.select().iterator():
+        class_id, prompt_id = chat_refs.get(metric.chat_id, (None, None))
+        keys = {"user": metric.user_id, "class": class_id, "prompt": prompt_id, "model": metric.model_id}
+        periods = {"day": metric.date, "week": metric.date - datetime.timedelta(days=metric.date.weekday())}
+
+        for period, period_start in periods.items():
+            for group_by, group_key in keys.items():
+                if group_key is None:
+                    continue
+
+                totals = rollups.setdefault((period, period_start, group_by, str(group_key)), [0, 0, 0])
+                totals[0] += metric.input_tokens
+                totals[1] += metric.output_tokens
+                totals[2] += metric.message_count
+
+    rows = [{"period": period,
+             "period_start": period_start,
+             "group_by": group_by,
+             "group_key": group_key,
+             "input_tokens": input_tokens,
+             "output_tokens": output_tokens,
+             "message_count": message_count}
+            for (period, period_start, group_by, group_key), (input_tokens, output_tokens, message_count)
+            in rollups.items()]
+    for batch in pw.chunked(rows, 100):
+        MetricRollup.insert_many(batch).execute()
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    @migrator.create_model
+    class MetricRollup(pw.Model):
+        id = pw.AutoField()
+        period = pw.CharField(max_length=255)        # "day" or "week"
+        period_start = pw.DateField()                # the day itself, or the Monday of the week
+        group_by = pw.CharField(max_length=255)      # "user", "class", "prompt" or "model"
+        group_key = pw.CharField(max_length=255)
+
+        input_tokens = pw.BigIntegerField(default=0)
+        output_tokens = pw.BigIntegerField(default=0)
+        message_count = pw.BigIntegerField(default=0)
+
+        class Meta:
+            table_name = "metricrollup"
+            indexes = (
+                (("period", "group_by", "period_start", "group_key"), True),
+            )
+
+    # build the rollups once from the existing raw metrics; new usage maintains them
+    migrator.run(backfill_metric_rollups, migrator)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your rollback migrations here."""
+
+    migrator.remove_model("metricrollup")
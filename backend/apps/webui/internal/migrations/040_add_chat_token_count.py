@@ -0,0 +1,77 @@
+"""Peewee migrations -- 040_add_chat_token_count.py.
+
+Some examples (model - class or model name)::
+
+    > Model = migrator.orm['table_name']            # Return model in current state by name
+    > Model = migrator.ModelClass                   # Return model in current state by name
+
+    > migrator.sql(sql)                             # Run custom SQL
+    > migrator.run(func, *args, **kwargs)           # Run python function with the given args
+    > migrator.create_model(Model)                  # Create a model (could be used as decorator)
+    > migrator.remove_model(model, cascade=True)    # Remove a model
+    > migrator.add_fields(model, **fields)          # Add fields to a model
+    > migrator.change_fields(model, **fields)       # Change fields
+    > migrator.remove_fields(model, *field_names, cascade=True)
+    > migrator.rename_field(model, old_field_name, new_field_name)
+    > migrator.rename_table(model, new_table_name)
+    > migrator.add_index(model, *col_names, unique=False)
+    > migrator.add_not_null(model, *field_names)
+    > migrator.add_default(model, field_name, default)
+    > migrator.add_constraint(model, name, sql)
+    > migrator.drop_index(model, *col_names)
+    > migrator.drop_not_null(model, *field_names)
+    > migrator.drop_constraints(model, *constraints)
+
+"""
+
+import json
+from contextlib import suppress
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+with suppress(ImportError):
+    import playhouse.postgres_ext as pw_pext
+
+
+def backfill_chat_token_counts(migrator: Migrator):
+    Metric = migrator.orm["metric"]
+    Chat = migrator.orm["chat"]
+
+    token_counts = {
+        row["chat_id"]: row["token_count"]
+        for row in Metric.select(
+            Metric.chat_id,
+            pw.fn.SUM(Metric.input_tokens + Metric.output_tokens).alias("token_count"),
+        )
+        .group_by(Metric.chat_id)
+        .dicts()
+    }
+
+    # chats from before token accounting only have the usage saved in their JSON
+    for chat in Chat.select(Chat.id, Chat.chat).iterator():
+        if chat.id in token_counts:
+            continue
+        try:
+            usage = json.loads(chat.chat).get("usage") or {}
+            token_counts[chat.id] = usage.get("total_tokens", 0)
+        except Exception:
+            pass
+
+    for chat_id, token_count in token_counts.items():
+        if token_count:
+            Chat.update(token_count=token_count).where(Chat.id == chat_id).execute()
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your migrations here."""
+
+    migrator.add_fields("chat", token_count=pw.BigIntegerField(default=0))
+    migrator.run(backfill_chat_token_counts, migrator)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your rollback migrations here."""
+
+    migrator.remove_fields("chat", "token_count")
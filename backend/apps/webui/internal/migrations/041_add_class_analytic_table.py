@@ -0,0 +1,86 @@
+"""Peewee migrations -- 041_add_class_analytic_table.py.
+
+Some examples (model - class or model name)::
+
+    > Model = migrator.orm['table_name']            # Return model in current state by name
+    > Model = migrator.ModelClass                   # Return model in current state by name
+
+    > migrator.sql(sql)                             # Run custom SQL
+    > migrator.run(func, *args, **kwargs)           # Run python function with the given args
+    > migrator.create_model(Model)                  # Create a model (could be used as decorator)
+    > migrator.remove_model(model, cascade=True)    # Remove a model
+    > migrator.add_fields(model, **fields)          # Add fields to a model
+    > migrator.change_fields(model, **fields)       # Change fields
+    > migrator.remove_fields(model, *field_names, cascade=True)
+    > migrator.rename_field(model, old_field_name, new_field_name)
+    > migrator.rename_table(model, new_table_name)
+    > migrator.add_index(model, *col_names, unique=False)
+    > migrator.add_not_null(model, *field_names)
+    > migrator.add_default(model, field_name, default)
+    > migrator.add_constraint(model, name, sql)
+    > migrator.drop_index(model, *col_names)
+    > migrator.drop_not_null(model, *field_names)
+    > migrator.drop_constraints(model, *constraints)
+
+"""
+
+from contextlib import suppress
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+with suppress(ImportError):
+    import playhouse.postgres_ext as pw_pext
+
+
+def backfill_class_analytics(migrator: Migrator):
+    Chat = migrator.orm["chat"]
+    ClassAnalytic = migrator.orm["classanalytic"]
+
+    # shared chats are copies under a "shared-<chat id>" user and are left out
+    query = Chat.select(
+        Chat.class_id,
+        Chat.user_id,
+        Chat.prompt_id,
+        pw.fn.COUNT(Chat.id).alias("attempts"),
+        pw.fn.SUM(Chat.session_time).alias("session_time"),
+        pw.fn.SUM(pw.Case(None, [(Chat.is_submitted == True, 1)], 0)).alias("submissions"),
+        pw.fn.SUM(Chat.token_count).alias("token_count"),
+    ).where(
+        Chat.class_id.is_null(False),
+        Chat.prompt_id.is_null(False),
+        ~Chat.user_id.startswith("shared-"),
+    ).group_by(Chat.class_id, Chat.user_id, Chat.prompt_id)
+
+    for batch in pw.chunked(query.dicts().iterator(), 100):
+        ClassAnalytic.insert_many(batch).execute()
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    @migrator.create_model
+    class ClassAnalytic(pw.Model):
+        id = pw.AutoField()
+        class_id = pw.IntegerField()
+        user_id = pw.CharField(max_length=255)
+        prompt_id = pw.IntegerField()
+
+        attempts = pw.BigIntegerField(default=0)
+        session_time = pw.BigIntegerField(default=0)
+        submissions = pw.BigIntegerField(default=0)
+        token_count = pw.BigIntegerField(default=0)
+
+        class Meta:
+            table_name = "classanalytic"
+            indexes = (
+                (("class_id", "user_id", "prompt_id"), True),
+            )
+
+    # computed once from the existing chats; chat and metric writes maintain it
+    migrator.run(backfill_class_analytics, migrator)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your rollback migrations here."""
+
+    migrator.remove_model("classanalytic")
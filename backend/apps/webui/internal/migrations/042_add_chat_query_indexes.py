@@ -0,0 +1,67 @@
+"""Peewee migrations -- 042_add_chat_query_indexes.py.
+
+Some examples (model - class or model name)::
+
+    > Model = migrator.orm['table_name']            # Return model in current state by name
+    > Model = migrator.ModelClass                   # Return model in current state by name
+
+    > migrator.sql(sql)                             # Run custom SQL
+    > migrator.run(func, *args, **kwargs)           # Run python function with the given args
+    > migrator.create_model(Model)                  # Create a model (could be used as decorator)
+    > migrator.remove_model(model, cascade=True)    # Remove a model
+    > migrator.add_fields(model, **fields)          # Add fields to a model
+    > migrator.change_fields(model, **fields)       # Change fields
+    > migrator.remove_fields(model, *field_names, cascade=True)
+    > migrator.rename_field(model, old_field_name, new_field_name)
+    > migrator.rename_table(model, new_table_name)
+    > migrator.add_index(model, *col_names, unique=False)
+    > migrator.add_not_null(model, *field_names)
+    > migrator.add_default(model, field_name, default)
+    > migrator.add_constraint(model, name, sql)
+    > migrator.drop_index(model, *col_names)
+    > migrator.drop_not_null(model, *field_names)
+    > migrator.drop_constraints(model, *constraints)
+
+"""
+
+from contextlib import suppress
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+with suppress(ImportError):
+    import playhouse.postgres_ext as pw_pext
+
+
+# composite indexes for the predicates and orderings of the chat, tag and class queries
+INDEXES = [
+    # ChatTable listings of one user's chats, newest first by (updated_at, id)
+    ("chat", ("user_id", "archived", "updated_at", "id")),
+    # admin listings over all chats, newest first
+    ("chat", ("updated_at", "id")),
+    # chats of a class assignment and submission checks
+    ("chat", ("class_id", "prompt_id", "is_submitted")),
+    # tag lookups by name, and the tags of one chat
+    ("chatidtag", ("user_id", "tag_name")),
+    ("chatidtag", ("user_id", "chat_id")),
+    # students of a class and classes of a student
+    ("studentclass", ("class_id", "student_id")),
+    ("studentclass", ("student_id", "class_id")),
+    # assignment lookups by class and prompt
+    ("classprompt", ("class_id", "prompt_id")),
+]
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your migrations here."""
+
+    for table, columns in INDEXES:
+        migrator.add_index(table, *columns)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your rollback migrations here."""
+
+    for table, columns in reversed(INDEXES):
+        migrator.drop_index(table, *columns)
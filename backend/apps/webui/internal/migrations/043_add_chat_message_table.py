@@ -0,0 +1,145 @@
+"""Peewee migrations -- 043_add_chat_message_table.py.
+
+Some examples (model - class or model name)::
+
+    > Model = migrator.orm['table_name']            # Return model in current state by name
+    > Model = migrator.ModelClass                   # Return model in current state by name
+
+    > migrator.sql(sql)                             # Run custom SQL
+    > migrator.run(func, *args, **kwargs)           # Run python function with the given args
+    > migrator.create_model(Model)                  # Create a model (could be used as decorator)
+    > migrator.remove_model(model, cascade=True)    # Remove a model
+    > migrator.add_fields(model, **fields)          # Add fields to a model
+    > migrator.change_fields(model, **fields)       # Change fields
+    > migrator.remove_fields(model, *field_names, cascade=True)
+    > migrator.rename_field(model, old_field_name, new_field_name)
+    > migrator.rename_table(model, new_table_name)
+    > migrator.add_index(model, *col_names, unique=False)
+    > migrator.add_not_null(model, *field_names)
+    > migrator.add_default(model, field_name, default)
+    > migrator.add_constraint(model, name, sql)
+    > migrator.drop_index(model, *col_names)
+    > migrator.drop_not_null(model, *field_names)
+    > migrator.drop_constraints(model, *constraints)
+
+"""
+
+from contextlib import suppress
+import json
+
+import peewee as pw
+from peewee_migrate import Migrator
+
+
+with suppress(ImportError):
+    import playhouse.postgres_ext as pw_pext
+
+
+# same as get_message_chain, split_chat and join_chat in apps/webui/models/chats.py
+# at this revision
+def get_message_chain(messages: dict, message_id):
+    chain = []
+    while message_id in messages and len(chain) < len(messages):
+        chain.append(messages[message_id])
+        message_id = messages[message_id].get("parentId")
+    return chain[::-1]
+
+
+def split_chat(chat: dict):
+    history = chat.get("history")
+    if not isinstance(history, dict) or not isinstance(history.get("messages"), dict):
+        return chat, {}
+
+    messages = history["messages"]
+    header = {**chat, "history": {key: value for key, value in history.items() if key != "messages"}}
+
+    if chat.get("messages") == get_message_chain(messages, history.get("currentId")):
+        header.pop("messages", None)
+    return header, messages
+
+
+def join_chat(header: dict, messages: dict):
+    history = header.get("history")
+    if not isinstance(history, dict) or "messages" in history:
+        return header
+
+    chat = {**header, "history": {**history, "messages": messages}}
+    if "messages" not in chat:
+        chat["messages"] = get_message_chain(messages, history.get("currentId"))
+    return chat
+
+
+def split_chat_messages(migrator: Migrator):
+    Chat = migrator.orm["chat"]
+    ChatMessage = migrator.orm["chatmessage"]
+
+    chat_ids = [chat_id for chat_id, in Chat.select(Chat.id).tuples()]
+    for batch in pw.chunked(chat_ids, 100):
+        rows = []
+        for chat_id, chat, updated_at in Chat.select(Chat.id, Chat.chat, Chat.updated_at)\
+                .where(Chat.id.in_(batch)).tuples():
+            header, messages = split_chat(json.loads(chat))
+            if not messages:
+                continue
+
+            rows.extend(
+                {"chat_id": chat_id,
+                 "message_id": message_id,
+                 "parent_id": message.get("parentId"),
+                 "message": json.dumps(message),
+                 "created_at": updated_at,
+                 "updated_at": updated_at}
+                for message_id, message in messages.items()
+            )
+            Chat.update(chat=json.dumps(header)).where(Chat.id == chat_id).execute()
+
+        for rows_batch in pw.chunked(rows, 100):
+            ChatMessage.insert_many(rows_batch).execute()
+
+
+def join_chat_messages(Chat, ChatMessage):
+    # every chat, also those whose messages were all removed after the split
+    chat_ids = [chat_id for chat_id, in Chat.select(Chat.id).tuples()]
+    for chat_id in chat_ids:
+        chat = Chat.get(Chat.id == chat_id)
+        messages = {
+            message_id: json.loads(message)
+            for message_id, message in ChatMessage.select(ChatMessage.message_id, ChatMessage.message)
+            .where(ChatMessage.chat_id == chat_id)
+            .order_by(ChatMessage.id)
+            .tuples()
+        }
+        chat_json = join_chat(json.loads(chat.chat), messages)
+        Chat.update(chat=json.dumps(chat_json)).where(Chat.id == chat_id).execute()
+
+
+def migrate(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your migrations here."""
+
+    @migrator.create_model
+    class ChatMessage(pw.Model):
+        id = pw.AutoField()
+        chat_id = pw.CharField(max_length=255)
+        message_id = pw.CharField(max_length=255)
+        parent_id = pw.CharField(max_length=255, null=True)
+        message = pw.TextField()
+
+        created_at = pw.BigIntegerField()
+        updated_at = pw.BigIntegerField()
+
+        class Meta:
+            table_name = "chatmessage"
+            indexes = (
+                (("chat_id", "message_id"), True),
+            )
+
+    # moves history.messages out of every chat's JSON into chatmessage rows
+    migrator.run(split_chat_messages, migrator)
+
+
+def rollback(migrator: Migrator, database: pw.Database, *, fake=False):
+    """Write your rollback migrations here."""
+
+    # remove_model drops chatmessage from migrator.orm before the queued run executes
+    migrator.run(join_chat_messages, migrator.orm["chat"], migrator.orm["chatmessage"])
+    migrator.remove_model("chatmessage")
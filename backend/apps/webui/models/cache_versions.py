@@ -0,0 +1,109 @@
+from typing import Any, Callable, Dict, Hashable, Optional
+import peewee as pw
+import threading
+import time
+
+from apps.webui.internal.db import DB
+
+import logging
+from config import SRC_LOG_LEVELS, CACHE_VERSION_CHECK_INTERVAL
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MODELS"])
+
+####################
+# CacheVersion DB Schema
+####################
+
+
+class CacheVersion(pw.Model):
+    name = pw.CharField(unique=True)
+    version = pw.BigIntegerField(default=0)
+
+    class Meta:
+        database = DB
+
+
+class CacheVersionsTable:
+    def __init__(self, db):
+        self.db = db
+        self.db.create_tables([CacheVersion])
+
+    def get_version(self, name: str) -> int:
+        result = CacheVersion.get_or_none(CacheVersion.name == name)
+        return result.version if result else 0
+
+    def bump_version(self, name: str):
+        updated: int = (
+            CacheVersion.update(version=CacheVersion.version + 1)
+            .where(CacheVersion.name == name)
+            .execute()
+        )
+        if updated == 0:
+            try:
+                CacheVersion.create(name=name, version=1)
+            except pw.IntegrityError:
+                # another worker created the row first
+                self.bump_version(name)
+
+
+CacheVersions = CacheVersionsTable(DB)
+
+
+class VersionedCache:
+    """
+    In-process read-through cache for rows that are read on every completion but
+    rarely written (prompts, evaluations, custom models).
+
+    Writers call `invalidate`, which clears the local entries and bumps the shared
+    version stamp. Other workers compare the stamp at most every
+    CACHE_VERSION_CHECK_INTERVAL seconds and drop their entries when it moved.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.entries: Dict[Hashable, Any] = {}
+        self.version: Optional[int] = None
+        self.checked_at = 0.0
+        self.generation = 0  # local invalidations, guards against caching a stale load
+        self.lock = threading.Lock()
+
+    def _sync_version(self):
+        now = time.monotonic()
+        if now - self.checked_at < CACHE_VERSION_CHECK_INTERVAL:
+            return
+
+        version = CacheVersions.get_version(self.name)
+        with self.lock:
+            self.checked_at = now
+            if version != self.version:
+                self.entries = {}
+                self.version = version
+                self.generation += 1
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        self._sync_version()
+
+        with self.lock:
+            if key in self.entries:
+                return self.entries[key]
+            generation = self.generation
+
+        value = loader()
+
+        with self.lock:
+            if generation == self.generation:
+                self.entries[key] = value
+        return value
+
+    def invalidate(self):
+        try:
+            CacheVersions.bump_version(self.name)
+        except Exception:
+            log.exception(f"Failed to bump cache version '{self.name}'")
+
+        with self.lock:
+            self.entries = {}
+            self.generation += 1
+            # pick up the bumped version on the next read
+            self.checked_at = 0.0
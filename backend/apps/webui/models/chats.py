@@ -1,13 +1,16 @@
+from collections import defaultdict
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple, Type
 import peewee as pw
 from playhouse.shortcuts import model_to_dict
 
+import base64
 import json
 import uuid
 import time
 
-from apps.webui.internal.db import DB
+from apps.webui.internal.db import DB, CompressedTextField, iter_batches
+from apps.webui.models.tags import ChatIdTag
 
 import logging
 from config import SRC_LOG_LEVELS
@@ -24,7 +27,7 @@ class Chat(pw.Model):
     id = pw.CharField(unique=True)
     user_id = pw.CharField()
     title = pw.TextField()
-    chat = pw.TextField()  # Save Chat JSON as Text
+    chat = CompressedTextField()  # Save Chat JSON as Text
 
     created_at = pw.BigIntegerField()
     updated_at = pw.BigIntegerField()
@@ -41,8 +44,56 @@ class Chat(pw.Model):
     is_submitted = pw.BooleanField(default=False)
     is_disabled = pw.BooleanField(default=False)
 
+    token_count = pw.BigIntegerField(default=0)  # Maintained from the metric write path
+
+    class Meta:
+        database = DB
+        indexes = (
+            # a user's (un)archived chats, newest first, as paged by paginate_chats
+            (("user_id", "archived", "updated_at", "id"), False),
+            # all chats newest first, for the admin listings
+            (("updated_at", "id"), False),
+            # chats and submissions of a class assignment
+            (("class_id", "prompt_id", "is_submitted"), False),
+        )
+
+
+class ChatMessage(pw.Model):
+    """One message of a chat's history, stored apart from the chat JSON."""
+    chat_id = pw.CharField()
+    message_id = pw.CharField()
+    parent_id = pw.CharField(null=True)
+    message = CompressedTextField()  # message JSON, as in the chat's history.messages
+
+    created_at = pw.BigIntegerField()
+    updated_at = pw.BigIntegerField()
+
+    class Meta:
+        database = DB
+        indexes = (
+            (("chat_id", "message_id"), True),
+        )
+
+
+class ClassAnalytic(pw.Model):
+    """
+    Totals over one student's chats for one class assignment, i.e. the result of
+    `select_class_analytics`, kept up to date by the chat and metric write paths.
+    """
+    class_id = pw.IntegerField()
+    user_id = pw.CharField()
+    prompt_id = pw.IntegerField()
+
+    attempts = pw.BigIntegerField(default=0)
+    session_time = pw.BigIntegerField(default=0)
+    submissions = pw.BigIntegerField(default=0)
+    token_count = pw.BigIntegerField(default=0)
+
     class Meta:
         database = DB
+        indexes = (
+            (("class_id", "user_id", "prompt_id"), True),
+        )
 
 
 class ChatModel(BaseModel):
@@ -66,6 +117,143 @@ class ChatModel(BaseModel):
     is_submitted: bool = False
     is_disabled: bool = False
 
+    token_count: int = 0
+
+
+class ClassAnalyticModel(BaseModel):
+    user_id: str
+    prompt_id: int
+
+    attempts: int = 0
+    session_time: int = 0
+    submissions: int = 0
+    token_count: int = 0
+
+
+CLASS_ANALYTIC_FIELDS = ("attempts", "session_time", "submissions", "token_count")
+
+
+def select_class_analytics(*where):
+    # shared chats are copies under a "shared-<chat id>" user and are left out
+    return Chat.select(
+        Chat.class_id,
+        Chat.user_id,
+        Chat.prompt_id,
+        pw.fn.COUNT(Chat.id).alias("attempts"),
+        pw.fn.SUM(Chat.session_time).alias("session_time"),
+        pw.fn.SUM(pw.Case(None, [(Chat.is_submitted == True, 1)], 0)).alias("submissions"),
+        pw.fn.SUM(Chat.token_count).alias("token_count"),
+    ).where(
+        Chat.class_id.is_null(False),
+        Chat.prompt_id.is_null(False),
+        ~Chat.user_id.startswith("shared-"),
+        *where,
+    ).group_by(Chat.class_id, Chat.user_id, Chat.prompt_id)
+
+
+# lightweight columns for chat listings, leaving out the chat JSON
+CHAT_INFO_FIELDS = (
+    Chat.id,
+    Chat.user_id,
+    Chat.title,
+    Chat.token_count,
+    Chat.session_time,
+    Chat.visits,
+    Chat.updated_at,
+    Chat.created_at,
+    Chat.class_id,
+    Chat.prompt_id,
+    Chat.is_submitted,
+    Chat.is_disabled,
+)
+
+
+def get_message_chain(messages: Dict[str, dict], message_id: Optional[str]) -> List[dict]:
+    """The messages from the root down to `message_id`, following parentId."""
+    chain = []
+    while message_id in messages and len(chain) < len(messages):
+        chain.append(messages[message_id])
+        message_id = messages[message_id].get("parentId")
+    return chain[::-1]
+
+
+def split_chat(chat: dict) -> Tuple[dict, Dict[str, dict]]:
+    """
+    Splits chat JSON into the JSON kept in Chat.chat and the messages of
+    history.messages by id, which are stored as ChatMessage rows. The `messages`
+    list is left out only when it is the chain from history.currentId, which
+    join_chat rebuilds; any other list is kept in Chat.chat as it was sent.
+    """
+    history = chat.get("history")
+    if not isinstance(history, dict) or not isinstance(history.get("messages"), dict):
+        return chat, {}
+
+    messages = history["messages"]
+    header = {**chat, "history": {key: value for key, value in history.items() if key != "messages"}}
+
+    if chat.get("messages") == get_message_chain(messages, history.get("currentId")):
+        header.pop("messages", None)
+    return header, messages
+
+
+def splice_json(obj: str, fields: List[Tuple[str, str]]) -> str:
+    """Adds `fields`, given as already serialized JSON values, to the JSON object `obj`."""
+    spliced = ", ".join(f"{json.dumps(key)}: {value}" for key, value in fields)
+    return f"{obj[:-1]}, {spliced}}}" if obj != "{}" else f"{{{spliced}}}"
+
+
+def join_chat(header: str, messages: List[Tuple[str, Optional[str], str]]) -> str:
+    """
+    Rebuilds the chat JSON from the header split_chat returned and the stored
+    (message id, parent id, message JSON) rows. history.messages and the
+    `messages` chain are always put back, empty when there are no rows. Only the
+    small header is decoded; the messages are spliced in as they are stored.
+    """
+    chat = json.loads(header)
+    history = chat.get("history")
+    if not isinstance(history, dict) or "messages" in history:
+        # split_chat kept this chat whole
+        return header
+
+    del chat["history"]
+    by_id = "{" + ", ".join(f"{json.dumps(id)}: {message}" for id, _, message in messages) + "}"
+    fields = [("history", splice_json(json.dumps(history), [("messages", by_id)]))]
+
+    if "messages" not in chat:
+        parents = {id: (parent_id, message) for id, parent_id, message in messages}
+        path = []
+        message_id = history.get("currentId")
+        while message_id in parents and len(path) < len(parents):
+            message_id, message = parents[message_id]
+            path.append(message)
+        fields.append(("messages", "[" + ", ".join(path[::-1]) + "]"))
+
+    return splice_json(json.dumps(chat), fields)
+
+
+def load_chat_messages(chat_ids: List[str]) -> Dict[str, List[Tuple[str, Optional[str], str]]]:
+    messages = defaultdict(list)
+    for batch in pw.chunked(chat_ids, 500):
+        query = ChatMessage.select(ChatMessage.chat_id, ChatMessage.message_id, ChatMessage.parent_id, ChatMessage.message)\
+            .where(ChatMessage.chat_id.in_(batch))\
+            .order_by(ChatMessage.id)
+        for chat_id, message_id, parent_id, message in query.tuples():
+            messages[chat_id].append((message_id, parent_id, message))
+    return messages
+
+
+def to_chat_models(chats) -> List[ChatModel]:
+    """ChatModels of the Chat rows in `chats`, with their messages joined back into the chat JSON."""
+    models = [ChatModel(**model_to_dict(chat, recurse=False)) for chat in chats]
+    messages = load_chat_messages([model.id for model in models])
+    for model in models:
+        model.chat = join_chat(model.chat, messages.get(model.id, []))
+    return models
+
+
+def to_chat_model(chat: Optional[Chat]) -> Optional[ChatModel]:
+    return to_chat_models([chat])[0] if chat else None
+
 
 ####################
 # Forms
@@ -80,6 +268,10 @@ class ChatTitleForm(BaseModel):
     title: str
 
 
+class ChatMessageForm(BaseModel):
+    message: dict[str, object]  # a message as in history.messages, with its "id"
+
+
 class ChatTimingForm(BaseModel):
     timings: dict[str, int]     # map of chat_id to time spent in seconds
 
@@ -99,6 +291,14 @@ class ChatResponse(BaseModel):
     is_disabled: bool = False
 
 
+CHAT_RESPONSE_FIELDS = set(ChatResponse.model_fields) - {"chat"}
+
+
+def chat_response_json(chat: ChatModel) -> str:
+    """The ChatResponse of `chat` as JSON, with the stored chat JSON spliced in as it is."""
+    return splice_json(json.dumps(chat.model_dump(include=CHAT_RESPONSE_FIELDS)), [("chat", chat.chat)])
+
+
 class ChatTitleIdResponse(BaseModel):
     id: str
     title: str
@@ -122,14 +322,166 @@ class ChatInfoResponse(BaseModel):
     is_disabled: bool = False
 
 
+def get_chat_fields(response_model: Type[BaseModel]) -> tuple:
+    # the Chat columns `response_model` is built from, so listings skip the chat JSON
+    return tuple(getattr(Chat, name) for name in response_model.model_fields)
+
+
+CHAT_LIST_FIELDS = get_chat_fields(ChatTitleIdResponse)
+
+
+# chat listings are returned in pages of at most this many chats
+MAX_CHAT_PAGE_SIZE = 200
+
+
+def encode_chat_cursor(updated_at: int, id: str) -> str:
+    return base64.urlsafe_b64encode(f"{updated_at}:{id}".encode()).decode()
+
+
+def decode_chat_cursor(cursor: str) -> Tuple[int, str]:
+    # raises ValueError for cursors that were not made by encode_chat_cursor
+    updated_at, id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+    return int(updated_at), id
+
+
+def paginate_chats(query, cursor: Optional[Tuple[int, str]] = None, limit: Optional[int] = None):
+    """
+    Orders `query` newest first by (updated_at, id) and keeps the chats after the
+    `cursor` of the previous page's last chat. The id breaks ties, so pages neither
+    skip nor repeat chats updated in the same second.
+    """
+    if cursor is not None:
+        # a row value comparison, which the (..., updated_at, id) indexes can seek to
+        query = query.where(pw.Tuple(Chat.updated_at, Chat.id) < pw.Tuple(*cursor))
+    return query.order_by(Chat.updated_at.desc(), Chat.id.desc()).limit(limit)
+
+
+def group_chat_info_by_user(query) -> Dict[str, List[ChatInfoResponse]]:
+    # `query` selects CHAT_INFO_FIELDS
+    results = defaultdict(list)
+    for chat in query.dicts():
+        results[chat["user_id"]].append(ChatInfoResponse(**chat))
+    return results
+
+
 class ChatTable:
     def __init__(self, db):
         self.db = db
-        db.create_tables([Chat])
+        db.create_tables([Chat, ChatMessage, ClassAnalytic])
+
+    def _write_messages(self, chat_id: str, messages: Dict[str, dict], replace: bool = False):
+        """
+        Stores `messages` of the chat, writing only the new and changed ones. With
+        `replace`, stored messages that are not in `messages` are deleted.
+        """
+        now = int(time.time())
+        stored = {
+            message_id: message
+            for message_id, message in ChatMessage.select(ChatMessage.message_id, ChatMessage.message)
+            .where(ChatMessage.chat_id == chat_id)
+            .tuples()
+        }
+
+        rows = []
+        for message_id, message in messages.items():
+            data = json.dumps(message)
+            if stored.get(message_id) != data:
+                rows.append({"chat_id": chat_id,
+                             "message_id": message_id,
+                             "parent_id": message.get("parentId"),
+                             "message": data,
+                             "created_at": now,
+                             "updated_at": now})
+
+        update = [ChatMessage.parent_id, ChatMessage.message, ChatMessage.updated_at]
+        for batch in pw.chunked(rows, 100):
+            query = ChatMessage.insert_many(batch)
+            if isinstance(self.db, pw.MySQLDatabase):
+                query = query.on_conflict(update={field: pw.fn.VALUES(field) for field in update})
+            else:
+                query = query.on_conflict(
+                    conflict_target=[ChatMessage.chat_id, ChatMessage.message_id],
+                    update={field: getattr(pw.EXCLUDED, field.name) for field in update},
+                )
+            query.execute()
+
+        if replace:
+            removed = [message_id for message_id in stored if message_id not in messages]
+            for batch in pw.chunked(removed, 500):
+                ChatMessage.delete()\
+                    .where((ChatMessage.chat_id == chat_id) & ChatMessage.message_id.in_(batch))\
+                    .execute()
+
+    def _copy_messages(self, from_chat_id: str, to_chat_id: str):
+        fields = [ChatMessage.message_id, ChatMessage.parent_id, ChatMessage.message,
+                  ChatMessage.created_at, ChatMessage.updated_at]
+        ChatMessage.delete().where(ChatMessage.chat_id == to_chat_id).execute()
+        ChatMessage.insert_from(
+            ChatMessage.select(pw.Value(to_chat_id), *fields)
+            .where(ChatMessage.chat_id == from_chat_id)
+            .order_by(ChatMessage.id),
+            [ChatMessage.chat_id, *fields],
+        ).execute()
+
+    def _delete_chats(self, where) -> int:
+        # removes the chats matching `where` together with their messages
+        with self.db.atomic():
+            ChatMessage.delete()\
+                .where(ChatMessage.chat_id.in_(Chat.select(Chat.id).where(where)))\
+                .execute()
+            return Chat.delete().where(where).execute()
+
+    def _upsert_class_analytics(self, rows: List[dict], increment: bool):
+        # on the (class_id, user_id, prompt_id) unique index, adding to or replacing the totals
+        fields = [getattr(ClassAnalytic, name) for name in CLASS_ANALYTIC_FIELDS]
+        conflict_target = [ClassAnalytic.class_id, ClassAnalytic.user_id, ClassAnalytic.prompt_id]
+        if isinstance(self.db, pw.MySQLDatabase):
+            conflict_target = None
+            values = {field: pw.fn.VALUES(field) for field in fields}
+        else:
+            values = {field: getattr(pw.EXCLUDED, field.name) for field in fields}
+        update = {field: field + value if increment else value for field, value in values.items()}
+
+        for batch in pw.chunked(rows, 100):
+            ClassAnalytic.insert_many(batch)\
+                .on_conflict(conflict_target=conflict_target, update=update)\
+                .execute()
+
+    def increment_class_analytics(self, deltas: Dict[tuple, Dict[str, int]]):
+        """
+        Adds `deltas`, keyed by (class_id, user_id, prompt_id) with a value per
+        CLASS_ANALYTIC_FIELDS name, to the ClassAnalytic rows. Errors are raised so
+        that callers can run it inside their own transaction.
+        """
+        rows = []
+        for (class_id, user_id, prompt_id), delta in deltas.items():
+            rows.append({"class_id": class_id,
+                         "user_id": user_id,
+                         "prompt_id": prompt_id,
+                         **{field: delta.get(field, 0) for field in CLASS_ANALYTIC_FIELDS}})
+        self._upsert_class_analytics(rows, increment=True)
+
+    def _refresh_class_analytics(self, **filters):
+        # recomputes the rows matching `filters` from the chats, used after deletes
+        with self.db.atomic():
+            rows = list(
+                select_class_analytics(*[getattr(Chat, name) == value for name, value in filters.items()]).dicts()
+            )
+            ClassAnalytic.delete()\
+                .where(*[getattr(ClassAnalytic, name) == value for name, value in filters.items()])\
+                .execute()
+            self._upsert_class_analytics(rows, increment=False)
+
+    def _get_class_analytic_key(self, id: str) -> Optional[tuple]:
+        chat = Chat.select(Chat.class_id, Chat.user_id, Chat.prompt_id).where(Chat.id == id).get_or_none()
+        if chat is None or chat.class_id is None or chat.prompt_id is None or chat.user_id.startswith("shared-"):
+            return None
+        return (chat.class_id, chat.user_id, chat.prompt_id)
 
     def insert_new_chat(self, user_id: str, form_data: ChatForm) -> Optional[ChatModel]:
         try:
             id = str(uuid.uuid4())
+            header, messages = split_chat(form_data.chat)
             chat = ChatModel(
                 **{
                     "id": id,
@@ -145,7 +497,11 @@ class ChatTable:
                 }
             )
 
-            result = Chat.create(**chat.model_dump())
+            with self.db.atomic():
+                result = Chat.create(**{**chat.model_dump(), "chat": json.dumps(header)})
+                self._write_messages(id, messages)
+                if chat.class_id is not None and chat.prompt_id is not None:
+                    self.increment_class_analytics({(chat.class_id, user_id, chat.prompt_id): {"attempts": 1}})
             return chat if result else None
 
         except Exception:
@@ -153,19 +509,106 @@ class ChatTable:
             return None
 
     def update_chat_by_id(self, id: str, chat: dict[str, object]) -> Optional[ChatModel]:
+        """
+        Merges the top-level fields of `chat` into the stored chat. When `chat` has a
+        history, its messages replace the stored ones, also when there are none; only
+        changed messages are written.
+        """
         try:
-            query = Chat.update(
-                chat=json.dumps(chat),
-                title=chat["title"] if "title" in chat else "New Chat",
-                updated_at=int(time.time()),
-            ).where(Chat.id == id)
-            query.execute()
+            stored = Chat.select(Chat.chat).where(Chat.id == id).get_or_none()
+            if stored is None:
+                return None
 
-            chat = Chat.get_or_none(Chat.id == id)
-            if chat:
-                return ChatModel(**model_to_dict(chat, recurse=False))
+            updates, messages = split_chat(chat)
+            header = {**json.loads(stored.chat), **updates}
+            if "history" in chat and "messages" not in updates:
+                # a `messages` list kept from an earlier update no longer applies
+                header.pop("messages", None)
+
+            with self.db.atomic():
+                query = Chat.update(
+                    chat=json.dumps(header),
+                    title=header["title"] if "title" in header else "New Chat",
+                    updated_at=int(time.time()),
+                ).where(Chat.id == id)
+                query.execute()
+
+                if "history" in chat:
+                    self._write_messages(id, messages, replace=True)
+
+            return self.get_chat_by_id(id)
+
+        except Exception:
+            log.exception(" Exception caught in model method.")
             return None
 
+    def is_chat_owned_by_user(self, id: str, user_id: str) -> bool:
+        try:
+            return Chat.select(Chat.id).where((Chat.id == id) & (Chat.user_id == user_id)).exists()
+
+        except Exception:
+            log.exception(" Exception caught in model method.")
+            return False
+
+    def upsert_chat_message(self, id: str, user_id: str, message: dict[str, object]) -> Optional[dict]:
+        """
+        Appends `message` to the user's chat, or patches the stored message with the
+        same id. A new message becomes history.currentId and is added to its parent's
+        childrenIds, which are kept here so clients can leave them out. Only the
+        message, its parent and the chat header are written, whatever the length of
+        the conversation.
+        """
+        try:
+            with self.db.atomic():
+                chat = Chat.select(Chat.chat)\
+                    .where((Chat.id == id) & (Chat.user_id == user_id))\
+                    .get_or_none()
+                if chat is None:
+                    return None
+
+                now = int(time.time())
+                stored = ChatMessage.get_or_none(
+                    (ChatMessage.chat_id == id) & (ChatMessage.message_id == message["id"])
+                )
+                header = json.loads(chat.chat)
+                # the `messages` chain is rebuilt from the rows on read
+                header.pop("messages", None)
+
+                if stored is not None:
+                    message = {**json.loads(stored.message), **message}
+                    ChatMessage.update(
+                        parent_id=message.get("parentId"),
+                        message=json.dumps(message),
+                        updated_at=now,
+                    ).where(ChatMessage.id == stored.id).execute()
+                else:
+                    message = {"childrenIds": [], **message}
+                    ChatMessage.create(
+                        chat_id=id,
+                        message_id=message["id"],
+                        parent_id=message.get("parentId"),
+                        message=json.dumps(message),
+                        created_at=now,
+                        updated_at=now,
+                    )
+
+                    parent = ChatMessage.get_or_none(
+                        (ChatMessage.chat_id == id) & (ChatMessage.message_id == message.get("parentId"))
+                    )
+                    if parent is not None:
+                        parent_message = json.loads(parent.message)
+                        children = parent_message.setdefault("childrenIds", [])
+                        if message["id"] not in children:
+                            children.append(message["id"])
+                            ChatMessage.update(message=json.dumps(parent_message), updated_at=now)\
+                                .where(ChatMessage.id == parent.id).execute()
+
+                    header.setdefault("history", {})["currentId"] = message["id"]
+
+                Chat.update(chat=json.dumps(header), updated_at=now).where(Chat.id == id).execute()
+
+            return message
+
         except Exception:
             log.exception(" Exception caught in model method.")
             return None
@@ -174,11 +617,20 @@ class ChatTable:
         timings = data.timings
 
         try:
-            for chat_id, timing in timings.items():
-                query = Chat.update(
-                    session_time=Chat.session_time + timing
-                ).where((Chat.id == chat_id) & (Chat.user_id == user_id))
-                query.execute()
+            with self.db.atomic():
+                for chat_id, timing in timings.items():
+                    query = Chat.update(
+                        session_time=Chat.session_time + timing
+                    ).where((Chat.id == chat_id) & (Chat.user_id == user_id))
+                    query.execute()
+
+                deltas = {}
+                for chat in Chat.select(Chat.id, Chat.class_id, Chat.prompt_id)\
+                        .where(Chat.id.in_(list(timings.keys())) & (Chat.user_id == user_id))\
+                        .where(Chat.class_id.is_null(False) & Chat.prompt_id.is_null(False)):
+                    delta = deltas.setdefault((chat.class_id, user_id, chat.prompt_id), {"session_time": 0})
+                    delta["session_time"] += timings[chat.id]
+                self.increment_class_analytics(deltas)
 
             return True
 
@@ -193,7 +645,7 @@ class ChatTable:
             # Check if the chat is already shared
             if chat and chat.share_id:
                 return self.get_chat_by_id_and_user_id(chat.share_id, "shared")
-            # Create a new chat with the same data, but with a new ID
+            # Create a new chat with the same data and messages, but with a new ID
             shared_chat = ChatModel(
                 **{
                     "id": str(uuid.uuid4()),
@@ -202,17 +654,19 @@ class ChatTable:
                     "chat": chat.chat,
                     "created_at": chat.created_at,
                     "updated_at": int(time.time()),
-                    "class_id": chat.get("class_id", None),
-                    "prompt_id": chat.get("prompt_id", None),
+                    "class_id": chat.class_id,
+                    "prompt_id": chat.prompt_id,
                 }
             )
-            shared_result = Chat.create(**shared_chat.model_dump())
-            # Update the original chat with the share_id
-            result = (
-                Chat.update(share_id=shared_chat.id).where(Chat.id == chat_id).execute()
-            )
+            with self.db.atomic():
+                shared_result = Chat.create(**shared_chat.model_dump())
+                self._copy_messages(chat_id, shared_chat.id)
+                # Update the original chat with the share_id
+                result = (
+                    Chat.update(share_id=shared_chat.id).where(Chat.id == chat_id).execute()
+                )
 
-            return shared_chat if (shared_result and result) else None
+            return self.get_chat_by_id(shared_chat.id) if (shared_result and result) else None
 
         except Exception:
             log.exception(" Exception caught in model method.")
@@ -225,15 +679,16 @@ class ChatTable:
             if chat is None:
                 return None
 
-            query = Chat.update(
-                title=chat.title,
-                chat=chat.chat,
-            ).where(Chat.id == chat.share_id)
+            with self.db.atomic():
+                query = Chat.update(
+                    title=chat.title,
+                    chat=chat.chat,
+                ).where(Chat.id == chat.share_id)
 
-            query.execute()
+                query.execute()
+                self._copy_messages(chat.id, chat.share_id)
 
-            chat = Chat.get_or_none(Chat.id == chat.share_id)
-            return ChatModel(**model_to_dict(chat, recurse=False))
+            return self.get_chat_by_id(chat.share_id)
 
         except Exception:
             log.exception(" Exception caught in model method.")
@@ -241,8 +696,7 @@ class ChatTable:
 
     def delete_shared_chat_by_chat_id(self, chat_id: str) -> bool:
         try:
-            query = Chat.delete().where(Chat.user_id == f"shared-{chat_id}")
-            result: int = query.execute()  # Remove the rows, return number of rows removed.
+            result: int = self._delete_chats(Chat.user_id == f"shared-{chat_id}")
 
             return result != 0
 
@@ -258,8 +712,7 @@ class ChatTable:
             result = query.execute()
 
             if result:
-                chat = Chat.get_or_none(Chat.id == id)
-                return ChatModel(**model_to_dict(chat, recurse=False))
+                return self.get_chat_by_id(id)
             return None
 
         except Exception:
@@ -268,7 +721,7 @@ class ChatTable:
 
     def toggle_chat_archive_by_id(self, id: str) -> Optional[ChatModel]:
         try:
-            chat = self.get_chat_by_id(id)
+            chat = Chat.select(Chat.archived).where(Chat.id == id).get_or_none()
 
             if chat is None:
                 return None
@@ -280,8 +733,7 @@ class ChatTable:
             result = query.execute()
 
             if result:
-                chat = Chat.get_or_none(Chat.id == id)
-                return ChatModel(**model_to_dict(chat, recurse=False))
+                return self.get_chat_by_id(id)
             return None
 
         except Exception:
@@ -290,14 +742,10 @@ class ChatTable:
 
     def archive_all_chats_by_user_id(self, user_id: str) -> bool:
         try:
-            chats = self.get_chats_by_user_id(user_id)
-            result = 0
-            for chat in chats:
-                query = Chat.update(
-                    archived=True,
-                ).where(Chat.id == chat.id)
-
-                result += query.execute()
+            query = Chat.update(
+                archived=True,
+            ).where(Chat.user_id == user_id)
+            result: int = query.execute()
 
             return result != 0
 
@@ -305,14 +753,17 @@ class ChatTable:
             log.exception(" Exception caught in model method.")
             return False
 
-    def get_archived_chat_list_by_user_id(self, user_id: str, skip: int = 0, limit: int = 50) -> List[ChatModel]:
+    def get_archived_chat_list_by_user_id(
+        self, user_id: str, cursor: Optional[Tuple[int, str]] = None, limit: Optional[int] = None
+    ) -> List[ChatTitleIdResponse]:
         try:
-            return [
-                ChatModel(**model_to_dict(chat, recurse=False))
-                for chat in Chat.select()
-                .where(Chat.archived == True)
+            query = Chat.select(*CHAT_LIST_FIELDS)\
+                .where(Chat.archived == True)\
                 .where(Chat.user_id == user_id)
-                .order_by(Chat.updated_at.desc())
+
+            return [
+                ChatTitleIdResponse(**chat)
+                for chat in paginate_chats(query, cursor, limit).dicts()
             ]
 
         except Exception:
@@ -323,38 +774,55 @@ class ChatTable:
         self,
         user_id: str,
         include_archived: bool = False,
-    ) -> List[ChatModel]:
-        try:
-            if include_archived:
-                return [
-                    ChatModel(**model_to_dict(chat, recurse=False))
-                    for chat in Chat.select()
-                    .where(Chat.user_id == user_id)
-                    .order_by(Chat.updated_at.desc())
-                ]
-            else:
-                return [
-                    ChatModel(**model_to_dict(chat, recurse=False))
-                    for chat in Chat.select()
-                    .where(Chat.archived == False)
-                    .where(Chat.user_id == user_id)
-                    .order_by(Chat.updated_at.desc())
-                ]
+        cursor: Optional[Tuple[int, str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[ChatTitleIdResponse]:
+        try:
+            query = Chat.select(*CHAT_LIST_FIELDS).where(Chat.user_id == user_id)
+            if not include_archived:
+                query = query.where(Chat.archived == False)
+
+            return [
+                ChatTitleIdResponse(**chat)
+                for chat in paginate_chats(query, cursor, limit).dicts()
+            ]
 
         except Exception:
             log.exception(" Exception caught in model method.")
             return []
 
     def get_chat_list_by_chat_ids(
-        self, chat_ids: List[str], skip: int = 0, limit: int = 50
-    ) -> List[ChatModel]:
+        self, chat_ids: List[str], cursor: Optional[Tuple[int, str]] = None, limit: Optional[int] = None
+    ) -> List[ChatTitleIdResponse]:
         try:
+            query = Chat.select(*CHAT_LIST_FIELDS)\
+                .where(Chat.archived == False)\
+                .where(Chat.id.in_(chat_ids))
+
             return [
-                ChatModel(**model_to_dict(chat, recurse=False))
-                for chat in Chat.select()
+                ChatTitleIdResponse(**chat)
+                for chat in paginate_chats(query, cursor, limit).dicts()
+            ]
+        except Exception:
+            log.exception(" Exception caught in model method.")
+            return []
+
+    def get_chat_list_by_tag_name_and_user_id(
+        self,
+        tag_name: str,
+        user_id: str,
+        cursor: Optional[Tuple[int, str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[ChatTitleIdResponse]:
+        try:
+            query = Chat.select(*CHAT_LIST_FIELDS)\
+                .join(ChatIdTag, on=(ChatIdTag.chat_id == Chat.id))\
+                .where((ChatIdTag.user_id == user_id) & (ChatIdTag.tag_name == tag_name))\
                 .where(Chat.archived == False)
-                .where(Chat.id.in_(chat_ids))
-                .order_by(Chat.updated_at.desc())
+
+            return [
+                ChatTitleIdResponse(**chat)
+                for chat in paginate_chats(query, cursor, limit).dicts()
             ]
         except Exception:
             log.exception(" Exception caught in model method.")
@@ -362,10 +830,7 @@ class ChatTable:
 
     def get_chat_by_id(self, id: str) -> Optional[ChatModel]:
         try:
-            chat = Chat.get_or_none(Chat.id == id)
-            if chat:
-                return ChatModel(**model_to_dict(chat, recurse=False))
-            return None
+            return to_chat_model(Chat.get_or_none(Chat.id == id))
 
         except Exception:
             log.exception(" Exception caught in model method.")
@@ -376,8 +841,7 @@ class ChatTable:
             chat = Chat.get_or_none(Chat.share_id == id)
 
             if chat:
-                chat = Chat.get_or_none(Chat.id == id)
-                return ChatModel(**model_to_dict(chat, recurse=False))
+                return to_chat_model(Chat.get_or_none(Chat.id == id))
             else:
                 return None
 
@@ -387,10 +851,7 @@ class ChatTable:
 
     def get_chat_by_id_and_user_id(self, id: str, user_id: str) -> Optional[ChatModel]:
         try:
-            chat = Chat.get_or_none(Chat.id == id, Chat.user_id == user_id)
-            if chat:
-                return ChatModel(**model_to_dict(chat, recurse=False))
-            return None
+            return to_chat_model(Chat.get_or_none(Chat.id == id, Chat.user_id == user_id))
 
         except Exception:
             log.exception(" Exception caught in model method.")
@@ -407,25 +868,70 @@ class ChatTable:
             log.exception(" Exception caught in model method.")
             return False
 
-    def get_chats(self, skip: int = 0, limit: int = 50) -> List[ChatModel]:
+    def get_chat_info_list_by_user_id(
+        self,
+        user_id: str,
+        include_archived: bool = False,
+        cursor: Optional[Tuple[int, str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[ChatInfoResponse]:
+        try:
+            query = Chat.select(*CHAT_INFO_FIELDS).where(Chat.user_id == user_id)
+            if not include_archived:
+                query = query.where(Chat.archived == False)
+
+            return [
+                ChatInfoResponse(**chat)
+                for chat in paginate_chats(query, cursor, limit).dicts()
+            ]
+
+        except Exception:
+            log.exception(" Exception caught in model method.")
+            return []
+
+    def get_chat_info_lists_by_user(self) -> Dict[str, List[ChatInfoResponse]]:
+        try:
+            return group_chat_info_by_user(
+                Chat.select(*CHAT_INFO_FIELDS).order_by(Chat.updated_at.desc())
+            )
+
+        except Exception:
+            log.exception(" Exception caught in model method.")
+            return {}
+
+    def get_chat_list(
+        self, cursor: Optional[Tuple[int, str]] = None, limit: Optional[int] = None
+    ) -> List[ChatTitleIdResponse]:
         try:
             return [
-                ChatModel(**model_to_dict(chat, recurse=False))
-                for chat in Chat.select().order_by(Chat.updated_at.desc())
+                ChatTitleIdResponse(**chat)
+                for chat in paginate_chats(Chat.select(*CHAT_LIST_FIELDS), cursor, limit).dicts()
             ]
 
         except Exception:
             log.exception(" Exception caught in model method.")
             return []
 
+    def get_chats(self, cursor: Optional[Tuple[int, str]] = None, limit: Optional[int] = None) -> List[ChatModel]:
+        try:
+            return to_chat_models(paginate_chats(Chat.select(), cursor, limit))
+
+        except Exception:
+            log.exception(" Exception caught in model method.")
+            return []
+
+    def iter_chats(self) -> Iterator[List[ChatModel]]:
+        """All chats in batches, for streaming exports."""
+        for chats in iter_batches(Chat.select(), Chat.id, 50):
+            yield to_chat_models(chats)
+
     def get_chats_by_user_id(self, user_id: str) -> List[ChatModel]:
         try:
-            return [
-                ChatModel(**model_to_dict(chat, recurse=False))
-                for chat in Chat.select()
+            return to_chat_models(
+                Chat.select()
                 .where(Chat.user_id == user_id)
                 .order_by(Chat.updated_at.desc())
-            ]
+            )
 
         except Exception:
             log.exception(" Exception caught in model method.")
@@ -433,13 +939,12 @@ class ChatTable:
 
     def get_archived_chats_by_user_id(self, user_id: str) -> List[ChatModel]:
         try:
-            return [
-                ChatModel(**model_to_dict(chat, recurse=False))
-                for chat in Chat.select()
+            return to_chat_models(
+                Chat.select()
                 .where(Chat.archived == True)
                 .where(Chat.user_id == user_id)
                 .order_by(Chat.updated_at.desc())
-            ]
+            )
 
         except Exception:
             log.exception(" Exception caught in model method.")
@@ -447,8 +952,9 @@ class ChatTable:
 
     def delete_chats_by_prompt_id(self, prompt_id: int) -> int:
         try:
-            query = Chat.delete().where(Chat.prompt_id == prompt_id)
-            result = query.execute()
+            with self.db.atomic():
+                result = self._delete_chats(Chat.prompt_id == prompt_id)
+                ClassAnalytic.delete().where(ClassAnalytic.prompt_id == prompt_id).execute()
 
             return result
 
@@ -458,8 +964,11 @@ class ChatTable:
 
     def delete_chat_by_id(self, id: str) -> bool:
         try:
-            query = Chat.delete().where((Chat.id == id))
-            result = query.execute()  # Remove the rows, return number of rows removed.
+            with self.db.atomic():
+                key = self._get_class_analytic_key(id)
+                result = self._delete_chats(Chat.id == id)
+                if result != 0 and key is not None:
+                    self._refresh_class_analytics(class_id=key[0], user_id=key[1], prompt_id=key[2])
 
             return result != 0 and self.delete_shared_chat_by_chat_id(id)
 
@@ -469,8 +978,11 @@ class ChatTable:
 
     def delete_chat_by_id_and_user_id(self, id: str, user_id: str) -> bool:
         try:
-            query = Chat.delete().where((Chat.id == id) & (Chat.user_id == user_id))
-            result = query.execute()  # Remove the rows, return number of rows removed.
+            with self.db.atomic():
+                key = self._get_class_analytic_key(id)
+                result = self._delete_chats((Chat.id == id) & (Chat.user_id == user_id))
+                if result != 0 and key is not None:
+                    self._refresh_class_analytics(class_id=key[0], user_id=key[1], prompt_id=key[2])
 
             return result != 0 and self.delete_shared_chat_by_chat_id(id)
 
@@ -482,8 +994,9 @@ class ChatTable:
         try:
             self.delete_shared_chats_by_user_id(user_id)
 
-            query = Chat.delete().where(Chat.user_id == user_id)
-            query.execute()  # Remove the rows, return number of rows removed.
+            with self.db.atomic():
+                self._delete_chats(Chat.user_id == user_id)
+                ClassAnalytic.delete().where(ClassAnalytic.user_id == user_id).execute()
 
             return True
 
@@ -499,8 +1012,7 @@ class ChatTable:
             ]
 
             for shared_id in shared_chat_ids:
-                query = Chat.delete().where(Chat.share_id == shared_id)
-                query.execute()  # Remove the rows, return number of rows removed.
+                self._delete_chats(Chat.share_id == shared_id)
 
             return True
 
@@ -521,10 +1033,19 @@ class ChatTable:
 
     def submit_chat_by_id(self, user_id: str, chat_id: str) -> bool:
         try:
-            query = Chat.update(is_submitted=True).where((Chat.user_id == user_id) & (Chat.id == chat_id))
-            result: int = query.execute()
+            with self.db.atomic():
+                # only a chat that was not submitted yet counts as a new submission
+                query = Chat.update(is_submitted=True)\
+                    .where((Chat.user_id == user_id) & (Chat.id == chat_id) & (Chat.is_submitted == False))
+                result: int = query.execute()
+                if result == 0:
+                    return Chat.select(Chat.id).where((Chat.user_id == user_id) & (Chat.id == chat_id)).exists()
+
+                key = self._get_class_analytic_key(chat_id)
+                if key is not None:
+                    self.increment_class_analytics({key: {"submissions": 1}})
 
-            return result != 0
+            return True
 
         except Exception:
             log.exception(" Exception caught in model method.")
@@ -546,8 +1067,10 @@ class ChatTable:
 
     def remove_class_reference(self, class_id: int) -> bool:
         try:
-            query = Chat.update(class_id=None).where(Chat.class_id == class_id)
-            result: int = query.execute()
+            with self.db.atomic():
+                query = Chat.update(class_id=None).where(Chat.class_id == class_id)
+                result: int = query.execute()
+                ClassAnalytic.delete().where(ClassAnalytic.class_id == class_id).execute()
 
             return result != 0
 
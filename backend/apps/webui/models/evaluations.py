@@ -3,6 +3,7 @@ import peewee as pw
 from typing import List, Optional
 
 from apps.webui.internal.db import DB
+from apps.webui.models.cache_versions import VersionedCache
 
 import logging
 from config import SRC_LOG_LEVELS
@@ -46,6 +47,8 @@ class EvaluationsTable:
     def __init__(self, db):
         self.db = db
         self.db.create_tables([Evaluation])
+        # evaluations by id, read on every evaluation completion
+        self.cache = VersionedCache("evaluation")
 
     def get_evaluations(self) -> List[EvaluationModel]:
         try:
@@ -60,8 +63,8 @@ class EvaluationsTable:
             log.exception(" Exception caught in model method.")
             return []
 
-    def get_evaluation_by_id(self, eval_id: int) -> Optional[EvaluationModel]:
-        try:
+    def _get_cached_evaluation(self, eval_id: int) -> Optional[EvaluationModel]:
+        def load():
             result = Evaluation.get_or_none(Evaluation.id == eval_id)
             if result:
                 return EvaluationModel(
@@ -72,13 +75,23 @@ class EvaluationsTable:
                 )
             return None
 
+        return self.cache.get(str(eval_id), load)
+
+    def get_evaluation_by_id(self, eval_id: int) -> Optional[EvaluationModel]:
+        try:
+            result = self._get_cached_evaluation(eval_id)
+            if result:
+                # callers may modify the model, keep the cached one intact
+                return result.model_copy()
+            return None
+
         except Exception:
             log.exception(" Exception caught in model method.")
             return None
 
     def get_evaluation_content_by_id(self, eval_id: int) -> Optional[str]:
         try:
-            result: Optional[EvaluationModel] = Evaluation.get_or_none(Evaluation.id == eval_id)
+            result = self._get_cached_evaluation(eval_id)
             if result:
                 return result.content
             return None
@@ -107,6 +120,7 @@ class EvaluationsTable:
         try:
             result: Evaluation = Evaluation.create(
                     title=form_data.title, content=form_data.content, model_id=form_data.selected_model_id)
+            self.cache.invalidate()
             if result:
                 return EvaluationModel(
                     id=result.id,
@@ -128,6 +142,7 @@ class EvaluationsTable:
                     content=form_data.content,
                     model_id=form_data.selected_model_id)\
                 .where(Evaluation.id == form_data.id).execute()
+            self.cache.invalidate()
             if result:
                 updated = Evaluation.get_or_none(Evaluation.id == form_data.id)
                 return EvaluationModel(
@@ -146,6 +161,7 @@ class EvaluationsTable:
     def delete_evaluation_by_id(self, eval_id: int) -> bool:
         try:
             result: int = Evaluation.delete().where(Evaluation.id == eval_id).execute()
+            self.cache.invalidate()
             return result == 1
 
         except Exception:
@@ -1,13 +1,14 @@
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import Iterator, List, Optional, Dict
 import peewee as pw
 from playhouse.shortcuts import model_to_dict
 
 import datetime
 
-from apps.webui.internal.db import DB
-from apps.webui.models.chats import Chat
+from apps.webui.internal.db import DB, iter_batches
+from apps.webui.models.chats import Chat, Chats
 from apps.webui.models.prompts_classes import Class
+from apps.webui.models.users import User
 
 import logging
 from config import SRC_LOG_LEVELS
@@ -24,9 +25,9 @@ log.setLevel(SRC_LOG_LEVELS["MODELS"])
 class Metric(pw.Model):
     id = pw.AutoField()
     user_id = pw.CharField()
-    chat_id = pw.CharField()  # Not using foreign key since we want to save metric even when chat is deleted
+    chat_id = pw.CharField(index=True)  # Not using foreign key since we want to save metric even when chat is deleted
     model_id = pw.TextField()  # Using TextField for consistency
-    date = pw.DateField()
+    date = pw.DateField(index=True)
 
     input_tokens = pw.BigIntegerField(default=0)
     output_tokens = pw.BigIntegerField(default=0)
@@ -34,6 +35,64 @@ class Metric(pw.Model):
 
     class Meta:
         database = DB
+        indexes = (
+            # one row per user, chat, model and day; increments upsert into it
+            (("user_id", "chat_id", "model_id", "date"), True),
+        )
+
+
+class MetricRollup(pw.Model):
+    """Token totals per day or week bucket for one user, class, prompt or model."""
+    id = pw.AutoField()
+    period = pw.CharField()        # "day" or "week"
+    period_start = pw.DateField()  # the day itself, or the Monday of the week
+    group_by = pw.CharField()      # "user", "class", "prompt" or "model"
+    group_key = pw.CharField()
+
+    input_tokens = pw.BigIntegerField(default=0)
+    output_tokens = pw.BigIntegerField(default=0)
+    message_count = pw.BigIntegerField(default=0)
+
+    class Meta:
+        database = DB
+        indexes = (
+            (("period", "group_by", "period_start", "group_key"), True),
+        )
+
+
+ROLLUP_PERIODS = ["day", "week"]
+ROLLUP_GROUPS = ["user", "class", "prompt", "model"]
+
+
+def get_period_start(date: datetime.date, period: str) -> datetime.date:
+    if period == "week":
+        return date - datetime.timedelta(days=date.weekday())
+    return date
+
+
+def get_rollup_deltas(deltas: Dict[tuple, List[int]],
+                      chat_refs: Dict[str, tuple]) -> Dict[tuple, List[int]]:
+    """
+    Folds metric deltas keyed by (user_id, chat_id, model_id, date) into rollup deltas
+    keyed by (period, period_start, group_by, group_key). `chat_refs` maps chat ids to
+    their (class_id, prompt_id); chats without a class or prompt are left out of
+    those groupings.
+    """
+    rollups = {}
+    for (user_id, chat_id, model_id, date), delta in deltas.items():
+        class_id, prompt_id = chat_refs.get(chat_id, (None, None))
+        keys = {"user": user_id, "class": class_id, "prompt": prompt_id, "model": model_id}
+
+        for period in ROLLUP_PERIODS:
+            period_start = get_period_start(date, period)
+            for group_by, group_key in keys.items():
+                if group_key is None:
+                    continue
+
+                totals = rollups.setdefault((period, period_start, group_by, str(group_key)), [0, 0, 0])
+                for i, value in enumerate(delta):
+                    totals[i] += value
+    return rollups
 
 
 class MetricModel(BaseModel):
@@ -56,6 +115,15 @@ class ChatMetricModel(BaseModel):
     message_count: int = 0
 
 
+class RollupMetricModel(BaseModel):
+    period_start: datetime.date
+    key: str
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+    message_count: int = 0
+
+
 ####################
 # Forms
 ####################
@@ -81,17 +149,35 @@ def metric_to_metricmodel(metric: Metric) -> MetricModel:
 class MetricsTable:
     def __init__(self, db):
         self.db = db
-        self.db.create_tables([Metric])
+        self.db.create_tables([Metric, MetricRollup])
 
-    def get_metrics(self) -> List[MetricModel]:
+    def get_metrics(self,
+                    start: Optional[datetime.date] = None,
+                    end: Optional[datetime.date] = None) -> List[MetricModel]:
         try:
             query = Metric.select()
+            if start is not None:
+                query = query.where(Metric.date >= start)
+            if end is not None:
+                query = query.where(Metric.date <= end)
             return [metric_to_metricmodel(metric) for metric in query]
 
         except Exception:
             log.exception(" Exception caught in model method.")
             return []
 
+    def iter_metrics(self,
+                     start: Optional[datetime.date] = None,
+                     end: Optional[datetime.date] = None) -> Iterator[List[MetricModel]]:
+        """The metrics of get_metrics in batches, for streaming exports."""
+        query = Metric.select()
+        if start is not None:
+            query = query.where(Metric.date >= start)
+        if end is not None:
+            query = query.where(Metric.date <= end)
+        for metrics in iter_batches(query, Metric.id):
+            yield [metric_to_metricmodel(metric) for metric in metrics]
+
     def get_metrics_by_chats(self, instructor_id: str) -> Dict[str, ChatMetricModel]:
         try:
             query = Metric.select(Metric.chat_id,
@@ -155,25 +241,129 @@ class MetricsTable:
             log.exception(" Exception caught in model method.")
             return None
 
+    def get_rollup(self,
+                   start: datetime.date,
+                   end: datetime.date,
+                   group_by: str,
+                   period: str = "day") -> List[RollupMetricModel]:
+        """
+        Token totals per `period` bucket and `group_by` key between `start` and `end`
+        (inclusive), read from the rollup table. Weekly buckets are those whose Monday
+        falls in the range.
+        """
+        try:
+            query = MetricRollup.select()\
+                .where((MetricRollup.period == period)
+                       & (MetricRollup.group_by == group_by)
+                       & (MetricRollup.period_start.between(start, end)))\
+                .order_by(MetricRollup.period_start, MetricRollup.group_key)
+
+            return [RollupMetricModel(period_start=rollup.period_start,
+                                      key=rollup.group_key,
+                                      input_tokens=rollup.input_tokens,
+                                      output_tokens=rollup.output_tokens,
+                                      message_count=rollup.message_count)
+                    for rollup in query]
+
+        except Exception:
+            log.exception(" Exception caught in model method.")
+            return []
+
+    def _upsert(self, model, conflict_target: list, rows: List[dict]):
+        # INSERT ... ON CONFLICT DO UPDATE on the table's unique index, so concurrent
+        # increments neither race nor create duplicate rows
+        fields = (model.input_tokens, model.output_tokens, model.message_count)
+        if isinstance(self.db, pw.MySQLDatabase):
+            conflict_target = None
+            update = {field: field + pw.fn.VALUES(field) for field in fields}
+        else:
+            update = {field: field + getattr(pw.EXCLUDED, field.name) for field in fields}
+
+        for batch in pw.chunked(rows, 100):
+            model.insert_many(batch)\
+                .on_conflict(conflict_target=conflict_target, update=update)\
+                .execute()
+
+    def _write_deltas(self, deltas: Dict[tuple, List[int]]):
+        rows = []
+        for (user_id, chat_id, model_id, date), (input_tokens, output_tokens, message_count) in deltas.items():
+            rows.append({"user_id": user_id,
+                         "chat_id": chat_id,
+                         "model_id": model_id,
+                         "date": date,
+                         "input_tokens": input_tokens,
+                         "output_tokens": output_tokens,
+                         "message_count": message_count})
+        self._upsert(Metric, [Metric.user_id, Metric.chat_id, Metric.model_id, Metric.date], rows)
+
+        chat_token_counts = {}
+        for (_, chat_id, _, _), (input_tokens, output_tokens, _) in deltas.items():
+            chat_token_counts[chat_id] = chat_token_counts.get(chat_id, 0) + input_tokens + output_tokens
+
+        for chat_id, count in chat_token_counts.items():
+            if count != 0:
+                Chat.update(token_count=Chat.token_count + count).where(Chat.id == chat_id).execute()
+
+        chat_ids = list(chat_token_counts.keys())
+        chat_refs = {}
+        class_analytic_deltas = {}
+        for batch in pw.chunked(chat_ids, 500):
+            for chat in Chat.select(Chat.id, Chat.user_id, Chat.class_id, Chat.prompt_id).where(Chat.id.in_(batch)):
+                chat_refs[chat.id] = (chat.class_id, chat.prompt_id)
+                if chat.class_id is not None and chat.prompt_id is not None and chat_token_counts[chat.id] != 0:
+                    delta = class_analytic_deltas.setdefault((chat.class_id, chat.user_id, chat.prompt_id),
+                                                             {"token_count": 0})
+                    delta["token_count"] += chat_token_counts[chat.id]
+        Chats.increment_class_analytics(class_analytic_deltas)
+
+        rollup_rows = []
+        for (period, period_start, group_by, group_key), (input_tokens, output_tokens, message_count) \
+                in get_rollup_deltas(deltas, chat_refs).items():
+            rollup_rows.append({"period": period,
+                                "period_start": period_start,
+                                "group_by": group_by,
+                                "group_key": group_key,
+                                "input_tokens": input_tokens,
+                                "output_tokens": output_tokens,
+                                "message_count": message_count})
+        self._upsert(MetricRollup,
+                     [MetricRollup.period, MetricRollup.group_by, MetricRollup.period_start, MetricRollup.group_key],
+                     rollup_rows)
+
     def update_metric_entry(self, form: MetricForm) -> Optional[bool]:
         try:
-            result, _ = Metric.get_or_create(user_id=form.user_id,
-                                             chat_id=form.chat_id,
-                                             model_id=form.selected_model_id,
-                                             date=datetime.date.today())
-            if result:
-                query = Metric.update(input_tokens=Metric.input_tokens + form.input_tokens,
-                                      output_tokens=Metric.output_tokens + form.output_tokens,
-                                      message_count=Metric.message_count + form.message_count
-                                      ).where(Metric.id == result.id)
-                query.execute()
-                return True
-            else:
-                return None
+            key = (form.user_id, form.chat_id, form.selected_model_id, datetime.date.today())
+            with self.db.atomic():
+                self._write_deltas({key: [form.input_tokens, form.output_tokens, form.message_count]})
+            return True
 
         except Exception:
             log.exception(" Exception caught in model method.")
             return None
 
+    def apply_metric_deltas(self, deltas: Dict[tuple, List[int]]) -> bool:
+        """
+        Adds aggregated token deltas, keyed by (user_id, chat_id, model_id, date) with
+        [input_tokens, output_tokens, message_count] values, in one transaction.
+        The rollups, Chat.token_count and User.token_count are incremented from the
+        same deltas.
+        """
+        try:
+            user_token_counts = {}
+            for (user_id, _, _, _), (input_tokens, output_tokens, _) in deltas.items():
+                user_token_counts[user_id] = user_token_counts.get(user_id, 0) + input_tokens + output_tokens
+
+            with self.db.atomic():
+                self._write_deltas(deltas)
+
+                for user_id, count in user_token_counts.items():
+                    if count != 0:
+                        User.update(token_count=User.token_count + count).where(User.id == user_id).execute()
+
+            return True
+
+        except Exception:
+            log.exception(" Exception caught in model method.")
+            return False
 
 Metrics = MetricsTable(DB)
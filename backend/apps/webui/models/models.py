@@ -4,6 +4,7 @@ from playhouse.shortcuts import model_to_dict
 from pydantic import BaseModel, ConfigDict
 
 from apps.webui.internal.db import DB, JSONField
+from apps.webui.models.cache_versions import VersionedCache
 
 from typing import List, Optional
 
@@ -117,6 +118,8 @@ class ModelsTable:
     ):
         self.db = db
         self.db.create_tables([Model])
+        # custom models by id, read on every completion
+        self.cache = VersionedCache("model")
 
     def insert_new_model(
         self, form_data: ModelForm, user_id: str
@@ -131,6 +134,7 @@ class ModelsTable:
                 }
             )
             result = Model.create(**model.model_dump())
+            self.cache.invalidate()
 
             if result:
                 return model
@@ -150,12 +154,19 @@ class ModelsTable:
             return []
 
     def get_model_by_id(self, id: str) -> Optional[ModelModel]:
-        try:
+        def load():
             model = Model.get_or_none(Model.id == id)
             if model:
                 return ModelModel(**model_to_dict(model))
             return None
 
+        try:
+            model = self.cache.get(id, load)
+            if model:
+                # callers replace params on the result, keep the cached one intact
+                return model.model_copy(deep=True)
+            return None
+
         except Exception:
             log.exception(" Exception caught in model method.")
             return None
@@ -165,6 +176,7 @@ class ModelsTable:
             # update only the fields that are present in the model
             query = Model.update(**model.model_dump()).where(Model.id == id)
             query.execute()
+            self.cache.invalidate()
 
             model = Model.get_or_none(Model.id == id)
             if model:
@@ -179,6 +191,7 @@ class ModelsTable:
         try:
             query = Model.delete().where(Model.id == id)
             result: int = query.execute()
+            self.cache.invalidate()
             return result != 0
 
         except Exception:
@@ -3,15 +3,30 @@ import datetime
 from pydantic import BaseModel
 import peewee as pw
 from playhouse.shortcuts import model_to_dict
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 import time
 
 from apps.webui.models.roles import Role
 from apps.webui.models.users import User
 from apps.webui.models.evaluations import Evaluation
-from apps.webui.models.chats import Chat, ChatModel, Chats
-
-from apps.webui.internal.db import DB
+from apps.webui.models.chats import (
+    Chat,
+    ChatModel,
+    Chats,
+    ChatInfoResponse,
+    ChatTitleIdResponse,
+    CHAT_INFO_FIELDS,
+    CHAT_LIST_FIELDS,
+    paginate_chats,
+    ClassAnalytic,
+    CLASS_ANALYTIC_FIELDS,
+    group_chat_info_by_user,
+    to_chat_model,
+    to_chat_models,
+)
+
+from apps.webui.internal.db import DB, iter_batches
+from apps.webui.models.cache_versions import VersionedCache
 
 import logging
 from config import SRC_LOG_LEVELS
@@ -105,6 +120,8 @@ class PromptsTable:
     def __init__(self, db):
         self.db = db
         self.db.create_tables([Prompt])
+        # content and model of a prompt by id, read on every completion
+        self.cache = VersionedCache("prompt")
 
     def insert_new_prompt(self, user_id: str, form_data: PromptForm) -> Optional[PromptModel]:
         try:
@@ -127,6 +144,7 @@ class PromptsTable:
             )
 
             result = Prompt.create(**prompt.model_dump(exclude={'id'}), model_id=prompt.selected_model_id)
+            self.cache.invalidate()
             return prompt_to_promptmodel(result, True)
 
         except Exception:
@@ -169,11 +187,20 @@ class PromptsTable:
             log.exception(" Exception caught in model method.")
             return None
 
+    def _get_cached_prompt(self, id: str) -> Optional[dict]:
+        def load():
+            prompt = Prompt.select(Prompt.content, Prompt.model_id).where(Prompt.id == id).get_or_none()
+            if prompt:
+                return {"content": prompt.content, "model_id": prompt.model_id}
+            return None
+
+        return self.cache.get(str(id), load)
+
     def get_prompt_content_by_id(self, id: str) -> Optional[str]:
         try:
-            prompt: PromptModel = Prompt.select(Prompt.content).where(Prompt.id == id).get_or_none()
+            prompt = self._get_cached_prompt(id)
             if prompt:
-                return prompt.content
+                return prompt["content"]
             return None
 
         except Exception:
@@ -182,9 +209,9 @@ class PromptsTable:
 
     def get_prompt_selected_model_by_id(self, id: str) -> Optional[str]:
         try:
-            prompt: PromptModel = Prompt.select(Prompt.content).where(Prompt.id == id).get_or_none()
+            prompt = self._get_cached_prompt(id)
             if prompt:
-                return prompt.model_id
+                return prompt["model_id"]
             return None
 
         except Exception:
@@ -282,6 +309,7 @@ class PromptsTable:
                                   model_id=form_data.selected_model_id)\
                 .where(Prompt.command == command)
             result: int = query.execute()
+            self.cache.invalidate()
 
             return result != 0
 
@@ -298,6 +326,7 @@ class PromptsTable:
             with self.db.atomic():
                 ClassPrompts.delete_class_prompts_by_prompt(prompt.id)
                 Prompt.delete().where(Prompt.command == command).execute()
+            self.cache.invalidate()
 
             return True
 
@@ -310,6 +339,7 @@ class PromptsTable:
             with self.db.atomic():
                 ClassPrompts.delete_class_prompts_by_prompt(prompt_id)
                 Prompt.delete().where(Prompt.id == prompt_id).execute()
+            self.cache.invalidate()
 
             return True
 
@@ -441,6 +471,9 @@ class ClassPrompt(pw.Model):
 
     class Meta:
         database = DB
+        indexes = (
+            (("class_id", "prompt_id"), False),
+        )
 
 
 class ClassPromptModel(BaseModel):
@@ -472,6 +505,18 @@ class ClassModel(BaseModel):
     assigned_students: List[str]
 
 
+class AssignmentAnalytics(BaseModel):
+    attempts: int = 0
+    session_time: int = 0
+    submissions: int = 0
+    token_count: int = 0
+
+
+class StudentAnalytics(AssignmentAnalytics):
+    # totals over all assignments, and per assignment (prompt id)
+    assignments: Dict[int, AssignmentAnalytics] = {}
+
+
 ####################
 # Class Forms
 ####################
@@ -575,49 +620,129 @@ class ClassesTable:
         user_id: str,
         instructor_id: str,
         include_archived: bool = False,
-    ) -> List[ChatModel]:
+        cursor: Optional[Tuple[int, str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[ChatTitleIdResponse]:
         try:
-            if include_archived:
-                return [
-                    ChatModel(**model_to_dict(chat, recurse=False))
-                    for chat in Chat.select()
-                    .join(Class, pw.JOIN.LEFT_OUTER, on=(Chat.class_id == Class.id))
-                    .where((Class.instructor == instructor_id) | (Class.id.is_null() & (Chat.user_id == instructor_id)))
-                    .where(Chat.user_id == user_id)
-                    .order_by(Chat.updated_at.desc())
-                ]
-            else:
-                return [
-                    ChatModel(**model_to_dict(chat, recurse=False))
-                    for chat in Chat.select()
-                    .join(Class, pw.JOIN.LEFT_OUTER, on=(Chat.class_id == Class.id))
-                    .where((Class.instructor == instructor_id) | (Class.id.is_null() & (Chat.user_id == instructor_id)))
-                    .where(Chat.archived == False)
-                    .where(Chat.user_id == user_id)
-                    .order_by(Chat.updated_at.desc())
-                ]
+            query = Chat.select(*CHAT_LIST_FIELDS)\
+                .join(Class, pw.JOIN.LEFT_OUTER, on=(Chat.class_id == Class.id))\
+                .where((Class.instructor == instructor_id) | (Class.id.is_null() & (Chat.user_id == instructor_id)))\
+                .where(Chat.user_id == user_id)
+            if not include_archived:
+                query = query.where(Chat.archived == False)
+
+            return [
+                ChatTitleIdResponse(**chat)
+                for chat in paginate_chats(query, cursor, limit).dicts()
+            ]
 
         except Exception:
             log.exception(" Exception caught in model method.")
             return []
 
-    def get_chats_by_instructor(
+    def get_chat_info_list_by_user_id_and_instructor(
         self,
+        user_id: str,
         instructor_id: str,
-    ) -> List[ChatModel]:
+        include_archived: bool = False,
+        cursor: Optional[Tuple[int, str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[ChatInfoResponse]:
         try:
+            query = Chat.select(*CHAT_INFO_FIELDS)\
+                .join(Class, pw.JOIN.LEFT_OUTER, on=(Chat.class_id == Class.id))\
+                .where((Class.instructor == instructor_id) | (Class.id.is_null() & (Chat.user_id == instructor_id)))\
+                .where(Chat.user_id == user_id)
+            if not include_archived:
+                query = query.where(Chat.archived == False)
+
             return [
-                ChatModel(**model_to_dict(chat, recurse=False))
-                for chat in Chat.select()
+                ChatInfoResponse(**chat)
+                for chat in paginate_chats(query, cursor, limit).dicts()
+            ]
+
+        except Exception:
+            log.exception(" Exception caught in model method.")
+            return []
+
+    def get_chat_info_lists_by_instructor(self, instructor_id: str) -> Dict[str, List[ChatInfoResponse]]:
+        try:
+            return group_chat_info_by_user(
+                Chat.select(*CHAT_INFO_FIELDS)
                 .join(Class, pw.JOIN.LEFT_OUTER, on=(Chat.class_id == Class.id))
                 .where((Class.instructor == instructor_id) | (Class.id.is_null() & (Chat.user_id == instructor_id)))
                 .order_by(Chat.updated_at.desc())
+            )
+
+        except Exception:
+            log.exception(" Exception caught in model method.")
+            return {}
+
+    def get_class_analytics(self, class_id: int) -> Dict[str, StudentAnalytics]:
+        """
+        Per student totals for the class and per assignment, read from the
+        ClassAnalytic rows. Students without any chat in the class are left out.
+        """
+        try:
+            students: Dict[str, StudentAnalytics] = {}
+            query = ClassAnalytic.select()\
+                .where(ClassAnalytic.class_id == class_id)\
+                .order_by(ClassAnalytic.user_id, ClassAnalytic.prompt_id)
+
+            for row in query.dicts():
+                student = students.setdefault(row["user_id"], StudentAnalytics())
+                assignment = AssignmentAnalytics(**{field: row[field] for field in CLASS_ANALYTIC_FIELDS})
+                student.assignments[row["prompt_id"]] = assignment
+                for field in CLASS_ANALYTIC_FIELDS:
+                    setattr(student, field, getattr(student, field) + getattr(assignment, field))
+
+            return students
+
+        except Exception:
+            log.exception(" Exception caught in model method.")
+            return {}
+
+    def get_chat_list_by_instructor(
+        self, instructor_id: str, cursor: Optional[Tuple[int, str]] = None, limit: Optional[int] = None
+    ) -> List[ChatTitleIdResponse]:
+        try:
+            query = Chat.select(*CHAT_LIST_FIELDS)\
+                .join(Class, pw.JOIN.LEFT_OUTER, on=(Chat.class_id == Class.id))\
+                .where((Class.instructor == instructor_id) | (Class.id.is_null() & (Chat.user_id == instructor_id)))
+
+            return [
+                ChatTitleIdResponse(**chat)
+                for chat in paginate_chats(query, cursor, limit).dicts()
             ]
 
         except Exception:
             log.exception(" Exception caught in model method.")
             return []
 
+    def get_chats_by_instructor(
+        self,
+        instructor_id: str,
+    ) -> List[ChatModel]:
+        try:
+            return to_chat_models(
+                Chat.select()
+                .join(Class, pw.JOIN.LEFT_OUTER, on=(Chat.class_id == Class.id))
+                .where((Class.instructor == instructor_id) | (Class.id.is_null() & (Chat.user_id == instructor_id)))
+                .order_by(Chat.updated_at.desc())
+            )
+
+        except Exception:
+            log.exception(" Exception caught in model method.")
+            return []
+
+    def iter_chats_by_instructor(self, instructor_id: str) -> Iterator[List[ChatModel]]:
+        """The chats of get_chats_by_instructor in batches, for streaming exports."""
+        query = Chat.select()\
+            .join(Class, pw.JOIN.LEFT_OUTER, on=(Chat.class_id == Class.id))\
+            .where((Class.instructor == instructor_id) | (Class.id.is_null() & (Chat.user_id == instructor_id)))
+        for chats in iter_batches(query, Chat.id, 50):
+            yield to_chat_models(chats)
+
     def get_chat_by_id_and_instructor(self, id: str, instructor_id: str) -> Optional[ChatModel]:
         try:
             chat = Chat.select()\
@@ -626,9 +751,7 @@ class ClassesTable:
                 .where(Chat.id == id)\
                 .get_or_none()
 
-            if chat:
-                return ChatModel(**model_to_dict(chat, recurse=False))
-            return None
+            return to_chat_model(chat)
 
         except Exception:
             log.exception(" Exception caught in model method.")
@@ -636,12 +759,11 @@ class ClassesTable:
 
     def get_chats_by_class_id(self, class_id: str) -> List[ChatModel]:
         try:
-            return [
-                ChatModel(**model_to_dict(chat, recurse=False))
-                for chat in Chat.select()
+            return to_chat_models(
+                Chat.select()
                 .join(Class, on=(Chat.class_id == Class.id))
                 .where(Class.id == class_id)
-            ]
+            )
 
         except Exception:
             log.exception(" Exception caught in model method.")
@@ -649,12 +771,11 @@ class ClassesTable:
 
     def get_chats_by_class_id_and_instructor(self, class_id: str, instructor_id: str) -> List[ChatModel]:
         try:
-            return [
-                ChatModel(**model_to_dict(chat, recurse=False))
-                for chat in Chat.select()
+            return to_chat_models(
+                Chat.select()
                 .join(Class, on=(Chat.class_id == Class.id))
                 .where((Class.id == class_id) & (Class.instructor == instructor_id))
-            ]
+            )
 
         except Exception:
             log.exception(" Exception caught in model method.")
@@ -728,6 +849,11 @@ class StudentClass(pw.Model):
 
     class Meta:
         database = DB
+        indexes = (
+            # both directions, so either lookup is answered from the index alone
+            (("class_id", "student_id"), False),
+            (("student_id", "class_id"), False),
+        )
 
 
 class StudentClassModel(BaseModel):
@@ -38,6 +38,10 @@ class ChatIdTag(pw.Model):
 
     class Meta:
         database = DB
+        indexes = (
+            (("user_id", "tag_name"), False),
+            (("user_id", "chat_id"), False),
+        )
 
 
 class TagModel(BaseModel):
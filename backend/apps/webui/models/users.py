@@ -1,10 +1,10 @@
 from pydantic import BaseModel, ConfigDict
 import peewee as pw
 from playhouse.shortcuts import model_to_dict
-from typing import List, Optional, Dict
+from typing import Iterator, List, Optional, Dict, Tuple
 import time
 
-from apps.webui.internal.db import DB, JSONField
+from apps.webui.internal.db import DB, JSONField, iter_batches
 from apps.webui.models.roles import Role, RoleModel
 
 import logging
@@ -187,6 +187,11 @@ class UsersTable:
             log.exception(" Exception caught in model method.")
             return []
 
+    def iter_users(self) -> Iterator[List[UserModel]]:
+        """All users in batches, for streaming exports."""
+        for users in iter_batches(User.select(User, Role).join(Role), User.id):
+            yield [user_to_usermodel(user) for user in users]
+
     def get_user_profiles(self) -> Dict[str, UserProfile]:
         try:
             query = User.select(User.id, User.name, User.profile_image_url)
@@ -230,6 +235,19 @@ class UsersTable:
             log.exception(" Exception caught in model method.")
             return {}
 
+    def iter_user_statistics(self) -> Iterator[List[Tuple[str, UserStatistics]]]:
+        """The (user id, statistics) of get_user_statistics in batches, for streaming exports."""
+        query = User.select(User.id, User.token_count, User.attempts, User.session_time)
+        for users in iter_batches(query, User.id):
+            yield [
+                (user.id, UserStatistics(
+                    token_count=user.token_count,
+                    attempts=user.attempts,
+                    session_time=user.session_time
+                ))
+                for user in users
+            ]
+
     def get_num_users(self) -> Optional[int]:
         try:
             count: int = User.select().count()
@@ -1,21 +1,27 @@
-from collections import defaultdict
-from fastapi import Depends, Request, HTTPException, status
-from typing import Dict, List, Optional
+from fastapi import Depends, Request, Response, HTTPException, Query, status
+from typing import Dict, List, Optional, Tuple, Union
 from utils.utils import get_admin_or_instructor, get_current_user
 from fastapi import APIRouter
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import json
 import logging
 
 from apps.webui.models.prompts_classes import ClassPrompts, Classes
 from apps.webui.models.users import Users, UserModel
 from apps.webui.models.chats import (
+    ChatModel,
     ChatResponse,
     ChatTimingForm,
     ChatForm,
+    ChatMessageForm,
     ChatTitleIdResponse,
     ChatInfoResponse,
     Chats,
+    MAX_CHAT_PAGE_SIZE,
+    CHAT_RESPONSE_FIELDS,
+    chat_response_json,
+    decode_chat_cursor,
+    encode_chat_cursor,
 )
 
 from apps.webui.models.tags import (
@@ -26,6 +32,7 @@ from apps.webui.models.tags import (
 )
 
 from constants import ERROR_MESSAGES
+from utils.export import ExportFormat, csv_response, ndjson_response
 
 from config import SRC_LOG_LEVELS, ENABLE_ADMIN_EXPORT
 
@@ -34,6 +41,30 @@ log.setLevel(SRC_LOG_LEVELS["MODELS"])
 
 router = APIRouter()
 
+
+############################
+# Pagination
+############################
+
+
+def get_chat_cursor(cursor: Optional[str] = None) -> Optional[Tuple[int, str]]:
+    if cursor is None:
+        return None
+    try:
+        return decode_chat_cursor(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=ERROR_MESSAGES.INVALID_CURSOR
+        )
+
+
+def set_next_cursor(response: Response, chats: List[Union[ChatTitleIdResponse, ChatInfoResponse]], limit: int):
+    # a full page may be followed by more, which the client requests with this cursor
+    response.headers["Access-Control-Expose-Headers"] = "X-Next-Cursor"
+    if len(chats) == limit:
+        response.headers["X-Next-Cursor"] = encode_chat_cursor(chats[-1].updated_at, chats[-1].id)
+
+
 ############################
 # GetChatList
 ############################
@@ -42,9 +73,14 @@ router = APIRouter()
 @router.get("/", response_model=List[ChatTitleIdResponse])
 @router.get("/list", response_model=List[ChatTitleIdResponse])
 async def get_session_user_chat_list(
-    user: UserModel = Depends(get_current_user)
+    response: Response,
+    cursor: Optional[Tuple[int, str]] = Depends(get_chat_cursor),
+    limit: int = Query(50, ge=1, le=MAX_CHAT_PAGE_SIZE),
+    user: UserModel = Depends(get_current_user),
 ) -> List[ChatTitleIdResponse]:
-    return Chats.get_chat_list_by_user_id(user.id)  # fastapi filters output to conform to response_model
+    chats = Chats.get_chat_list_by_user_id(user.id, cursor=cursor, limit=limit)
+    set_next_cursor(response, chats, limit)
+    return chats
 
 
 ############################
@@ -75,29 +111,24 @@ async def delete_all_user_chats(request: Request, user: UserModel = Depends(get_
 
 @router.get("/list/user/{user_id}", response_model=List[ChatInfoResponse])
 async def get_user_chat_list_by_user_id(
-    user_id: str, user: UserModel = Depends(get_admin_or_instructor)
+    user_id: str,
+    response: Response,
+    cursor: Optional[Tuple[int, str]] = Depends(get_chat_cursor),
+    limit: int = Query(50, ge=1, le=MAX_CHAT_PAGE_SIZE),
+    user: UserModel = Depends(get_admin_or_instructor),
 ) -> List[ChatInfoResponse]:
     chats = []
     if user.role == "admin":
-        chats = Chats.get_chat_list_by_user_id(
-            user_id, include_archived=True
+        chats = Chats.get_chat_info_list_by_user_id(
+            user_id, include_archived=True, cursor=cursor, limit=limit
         )
     elif user.role == "instructor":
-        chats = Classes.get_chat_list_by_user_id_and_instructor(
-            user_id, user.id, include_archived=True
+        chats = Classes.get_chat_info_list_by_user_id_and_instructor(
+            user_id, user.id, include_archived=True, cursor=cursor, limit=limit
         )
 
-    # TODO: create a separate field in database for token_count?
-    results = []
-    for chat in chats:
-        token_count = 0
-        usage = json.loads(chat.chat).get("usage")
-        if usage is not None:
-            token_count = usage.get("total_tokens", 0)
-
-        results.append(ChatInfoResponse(**{**chat.model_dump(), "token_count": token_count}))
-
-    return results
+    set_next_cursor(response, chats, limit)
+    return chats
 
 
 ############################
@@ -109,22 +140,29 @@ async def get_user_chat_list_by_user_id(
 async def get_assignment_chats_by_user_id(
     user: UserModel = Depends(get_admin_or_instructor)
 ) -> Dict[str, List[ChatInfoResponse]]:
-    chats = []
+    results = {}
     if user.role == "admin":
-        chats = Chats.get_chats()
+        results = Chats.get_chat_info_lists_by_user()
     elif user.role == "instructor":
-        chats = Classes.get_chats_by_instructor(user.id)
+        results = Classes.get_chat_info_lists_by_instructor(user.id)
 
-    results = defaultdict(lambda: [])
-    for chat in chats:
-        token_count = 0
-        usage = json.loads(chat.chat).get("usage")
-        if usage is not None:
-            token_count = usage.get("total_tokens", 0)
+    return results
 
-        results[chat.user_id].append(ChatInfoResponse(**{**chat.model_dump(), "token_count": token_count}))
 
-    return results
+############################
+# Raw JSON responses
+############################
+
+
+# The chat JSON is stored serialized; these responses splice it into the
+# ChatResponse envelope instead of decoding, validating and re-encoding it.
+def chat_json_response(chat: ChatModel) -> Response:
+    return Response(content=chat_response_json(chat), media_type="application/json")
+
+
+def chats_json_response(chats: List[ChatModel]) -> Response:
+    content = "[" + ", ".join(chat_response_json(chat) for chat in chats) + "]"
+    return Response(content=content, media_type="application/json")
 
 
 ############################
@@ -156,10 +194,7 @@ async def create_new_chat(form_data: ChatForm, user: UserModel = Depends(get_cur
 
 @router.get("/all", response_model=List[ChatResponse])
 async def get_user_chats(user: UserModel = Depends(get_current_user)) -> List[ChatResponse]:
-    return [
-        ChatResponse(**{**chat.model_dump(), "chat": json.loads(chat.chat)})
-        for chat in Chats.get_chats_by_user_id(user.id)
-    ]
+    return chats_json_response(Chats.get_chats_by_user_id(user.id))
 
 
 ############################
@@ -169,10 +204,7 @@ async def get_user_chats(user: UserModel = Depends(get_current_user)) -> List[Ch
 
 @router.get("/all/archived", response_model=List[ChatResponse])
 async def get_archived_user_chats(user: UserModel = Depends(get_current_user)) -> List[ChatResponse]:
-    return [
-        ChatResponse(**{**chat.model_dump(), "chat": json.loads(chat.chat)})
-        for chat in Chats.get_archived_chats_by_user_id(user.id)
-    ]
+    return chats_json_response(Chats.get_archived_chats_by_user_id(user.id))
 
 
 ############################
@@ -181,23 +213,31 @@ async def get_archived_user_chats(user: UserModel = Depends(get_current_user)) -
 
 
 @router.get("/all/db", response_model=List[ChatResponse])
-async def get_all_user_chats_in_db(user: UserModel = Depends(get_admin_or_instructor)) -> List[ChatResponse]:
+async def get_all_user_chats_in_db(
+    format: ExportFormat = "json", user: UserModel = Depends(get_admin_or_instructor)
+) -> List[ChatResponse]:
     if not ENABLE_ADMIN_EXPORT:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=ERROR_MESSAGES.ACCESS_PROHIBITED,
         )
 
+    if format != "json":
+        chats = Chats.iter_chats() if user.role == "admin" else Classes.iter_chats_by_instructor(user.id)
+        if format == "ndjson":
+            return ndjson_response(
+                ([chat_response_json(chat) for chat in batch] for batch in chats), "chats"
+            )
+        rows = (
+            [{**chat.model_dump(include=CHAT_RESPONSE_FIELDS), "chat": chat.chat} for chat in batch]
+            for batch in chats
+        )
+        return csv_response(rows, list(ChatResponse.model_fields), "chats")
+
     if user.role == "admin":
-        return [
-            ChatResponse(**{**chat.model_dump(), "chat": json.loads(chat.chat)})
-            for chat in Chats.get_chats()
-        ]
+        return chats_json_response(Chats.get_chats())
     else:
-        return [
-            ChatResponse(**{**chat.model_dump(), "chat": json.loads(chat.chat)})
-            for chat in Classes.get_chats_by_instructor(user.id)
-        ]
+        return chats_json_response(Classes.get_chats_by_instructor(user.id))
 
 
 ############################
@@ -206,17 +246,19 @@ async def get_all_user_chats_in_db(user: UserModel = Depends(get_admin_or_instru
 
 
 @router.get("/all/db/abridged", response_model=List[ChatTitleIdResponse])
-async def get_all_user_chats_in_db_abridged(user: UserModel = Depends(get_admin_or_instructor)) -> List[ChatTitleIdResponse]:
+async def get_all_user_chats_in_db_abridged(
+    response: Response,
+    cursor: Optional[Tuple[int, str]] = Depends(get_chat_cursor),
+    limit: int = Query(50, ge=1, le=MAX_CHAT_PAGE_SIZE),
+    user: UserModel = Depends(get_admin_or_instructor),
+) -> List[ChatTitleIdResponse]:
     if user.role == "admin":
-        return [
-            ChatTitleIdResponse(**{**chat.model_dump()})
-            for chat in Chats.get_chats()
-        ]
+        chats = Chats.get_chat_list(cursor=cursor, limit=limit)
     else:
-        return [
-            ChatTitleIdResponse(**{**chat.model_dump()})
-            for chat in Classes.get_chats_by_instructor(user.id)
-        ]
+        chats = Classes.get_chat_list_by_instructor(user.id, cursor=cursor, limit=limit)
+
+    set_next_cursor(response, chats, limit)
+    return chats
 
 
 ############################
@@ -226,10 +268,14 @@ async def get_all_user_chats_in_db_abridged(user: UserModel = Depends(get_admin_
 
 @router.get("/archived", response_model=List[ChatTitleIdResponse])
 async def get_archived_session_user_chat_list(
-    user: UserModel = Depends(get_current_user), skip: int = 0, limit: int = 50
+    response: Response,
+    cursor: Optional[Tuple[int, str]] = Depends(get_chat_cursor),
+    limit: int = Query(50, ge=1, le=MAX_CHAT_PAGE_SIZE),
+    user: UserModel = Depends(get_current_user),
 ) -> List[ChatTitleIdResponse]:
-    # fastapi filters output to conform to response_model
-    return Chats.get_archived_chat_list_by_user_id(user.id, skip, limit)
+    chats = Chats.get_archived_chat_list_by_user_id(user.id, cursor=cursor, limit=limit)
+    set_next_cursor(response, chats, limit)
+    return chats
 
 
 ############################
@@ -272,30 +318,22 @@ async def get_shared_chat_by_id(share_id: str, user: UserModel = Depends(get_cur
 
 class TagNameForm(BaseModel):
     name: str
-    skip: Optional[int] = 0
-    limit: Optional[int] = 50
+    cursor: Optional[str] = None
+    limit: int = Field(50, ge=1, le=MAX_CHAT_PAGE_SIZE)
 
 
 @router.post("/tags", response_model=List[ChatTitleIdResponse])
 async def get_user_chat_list_by_tag_name(
-    form_data: TagNameForm, user: UserModel = Depends(get_current_user)
+    form_data: TagNameForm, response: Response, user: UserModel = Depends(get_current_user)
 ) -> List[ChatTitleIdResponse]:
+    cursor = get_chat_cursor(form_data.cursor)
+    chats = Chats.get_chat_list_by_tag_name_and_user_id(form_data.name, user.id, cursor=cursor, limit=form_data.limit)
 
-    chat_ids = [
-        chat_id_tag.chat_id
-        for chat_id_tag in Tags.get_chat_ids_by_tag_name_and_user_id(
-            form_data.name, user.id
-        )
-    ]
-
-    chats = Chats.get_chat_list_by_chat_ids(chat_ids,
-                                            form_data.skip if form_data.skip is not None else 0,
-                                            form_data.limit if form_data.limit is not None else 50)
-
-    if len(chats) == 0:
+    # an empty first page means no unarchived chat has the tag anymore
+    if cursor is None and len(chats) == 0:
         Tags.delete_tag_by_tag_name_and_user_id(form_data.name, user.id)
 
-    # fastapi filters output to conform to response_model
+    set_next_cursor(response, chats, form_data.limit)
     return chats
 
 
@@ -327,7 +365,7 @@ async def get_chat_by_id(id: str, user: UserModel = Depends(get_current_user)) -
 
     if chat:
         Chats.increment_chat_visits(id, user.id)
-        return ChatResponse(**{**chat.model_dump(), "chat": json.loads(chat.chat)})
+        return chat_json_response(chat)
     else:
         raise HTTPException(status_code=404, detail=ERROR_MESSAGES.NOT_FOUND)
 
@@ -341,11 +379,8 @@ async def get_chat_by_id(id: str, user: UserModel = Depends(get_current_user)) -
 async def update_chat_by_id(
     id: str, form_data: ChatForm, user: UserModel = Depends(get_current_user)
 ) -> Optional[ChatResponse]:
-    chat = Chats.get_chat_by_id_and_user_id(id, user.id)
-    if chat:
-        updated_chat = {**json.loads(chat.chat), **form_data.chat}
-
-        chat = Chats.update_chat_by_id(id, updated_chat)
+    if Chats.is_chat_owned_by_user(id, user.id):
+        chat = Chats.update_chat_by_id(id, form_data.chat)
         if chat is None:
             raise HTTPException(status_code=404, detail=ERROR_MESSAGES.NOT_FOUND)
 
@@ -357,6 +392,32 @@ async def update_chat_by_id(
         )
 
 
+############################
+# UpsertChatMessage
+############################
+
+
+@router.post("/{id}/messages", response_model=dict[str, object])
+async def upsert_chat_message(
+    id: str, form_data: ChatMessageForm, user: UserModel = Depends(get_current_user)
+) -> dict[str, object]:
+    if not isinstance(form_data.message.get("id"), str):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=ERROR_MESSAGES.INVALID_MESSAGE
+        )
+
+    if not Chats.is_chat_owned_by_user(id, user.id):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=ERROR_MESSAGES.ACCESS_PROHIBITED,
+        )
+
+    message = Chats.upsert_chat_message(id, user.id, form_data.message)
+    if message is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=ERROR_MESSAGES.DEFAULT())
+    return message
+
+
 ############################
 # UpdateChatSessionTimes
 ############################
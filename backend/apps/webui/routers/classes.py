@@ -8,7 +8,7 @@ from typing import Dict, List, Optional
 from fastapi import APIRouter
 from fastapi.responses import FileResponse
 
-from apps.webui.models.prompts_classes import ClassForm, ClassModel, ClassPrompts, Classes
+from apps.webui.models.prompts_classes import ClassForm, ClassModel, ClassPrompts, Classes, StudentAnalytics
 from apps.webui.models.users import Users, UserModel
 from apps.webui.models.chats import ChatModel
 from utils.utils import get_admin_or_instructor, get_current_user
@@ -70,6 +70,27 @@ async def get_class_by_id(class_id: int, user: UserModel = Depends(get_admin_or_
     )
 
 
+############################
+# GetClassAnalytics
+############################
+
+
+@router.get("/{class_id}/analytics", response_model=Dict[str, StudentAnalytics])
+async def get_class_analytics(
+    class_id: int, user: UserModel = Depends(get_admin_or_instructor)
+) -> Dict[str, StudentAnalytics]:
+    # check if authorized
+    class_ = Classes.get_class_by_id(user.id, user.role, class_id)
+    if class_ is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=ERROR_MESSAGES.ACCESS_PROHIBITED,
+        )
+
+    result: Dict[str, StudentAnalytics] = Classes.get_class_analytics(class_id)
+    return result
+
+
 ############################
 # getAssignmentSubmissions
 ############################
@@ -1,12 +1,15 @@
-from fastapi import Depends
-from typing import List, Optional, Dict
+from fastapi import Depends, HTTPException, status
+from typing import List, Literal, Optional, Dict
+import datetime
 
 from fastapi import APIRouter
 
-from apps.webui.models.metrics import Metrics, MetricModel, ChatMetricModel
+from apps.webui.models.metrics import Metrics, MetricModel, ChatMetricModel, RollupMetricModel
 from apps.webui.models.users import UserModel
 
 from utils.utils import get_admin_user, get_admin_or_instructor
+from constants import ERROR_MESSAGES
+from utils.export import ExportFormat, csv_response, ndjson_response
 
 router = APIRouter()
 
@@ -16,8 +19,39 @@ router = APIRouter()
 
 
 @router.get("/", response_model=List[MetricModel])
-async def get_metrics(user: UserModel = Depends(get_admin_user)) -> List[MetricModel]:
-    result: List[MetricModel] = Metrics.get_metrics()
+async def get_metrics(start: Optional[datetime.date] = None,
+                      end: Optional[datetime.date] = None,
+                      format: ExportFormat = "json",
+                      user: UserModel = Depends(get_admin_user)) -> List[MetricModel]:
+    if format == "ndjson":
+        return ndjson_response(
+            ([metric.model_dump_json() for metric in batch] for batch in Metrics.iter_metrics(start, end)),
+            "metrics",
+        )
+    if format == "csv":
+        return csv_response(
+            ([metric.model_dump(mode="json") for metric in batch] for batch in Metrics.iter_metrics(start, end)),
+            list(MetricModel.model_fields),
+            "metrics",
+        )
+
+    result: List[MetricModel] = Metrics.get_metrics(start, end)
+    return result
+
+
+@router.get("/rollup", response_model=List[RollupMetricModel])
+async def get_metrics_rollup(start: datetime.date,
+                             end: datetime.date,
+                             group_by: Literal["user", "class", "prompt", "model"],
+                             period: Literal["day", "week"] = "day",
+                             user: UserModel = Depends(get_admin_user)) -> List[RollupMetricModel]:
+    if start > end:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=ERROR_MESSAGES.INVALID_DATE_RANGE,
+        )
+
+    result: List[RollupMetricModel] = Metrics.get_rollup(start, end, group_by, period)
     return result
 
 
@@ -6,6 +6,7 @@ from apps.webui.models.models import Models, ModelModel, ModelForm, ModelRespons
 from apps.webui.models.users import UserModel
 
 from utils.utils import get_verified_user, get_admin_user
+from utils.models import AvailableModels
 from constants import ERROR_MESSAGES
 
 router = APIRouter()
@@ -38,6 +39,7 @@ async def add_new_model(
         model: Optional[ModelModel] = Models.insert_new_model(form_data, user.id)
 
         if model:
+            AvailableModels.invalidate()
             return model
         else:
             raise HTTPException(
@@ -76,11 +78,13 @@ async def update_model_by_id(
     model: Optional[ModelModel] = Models.get_model_by_id(id)
     if model:
         model = Models.update_model_by_id(id, form_data)
+        AvailableModels.invalidate()
         return model
     else:
         if form_data.id in request.app.state.MODELS:
             model = Models.insert_new_model(form_data, user.id)
             if model:
+                AvailableModels.invalidate()
                 return model
             else:
                 raise HTTPException(
@@ -102,4 +106,5 @@ async def update_model_by_id(
 @router.delete("/delete", response_model=bool)
 async def delete_model_by_id(id: str, user: UserModel = Depends(get_admin_user)) -> bool:
     result: bool = Models.delete_model_by_id(id)
+    AvailableModels.invalidate()
     return result
@@ -1,5 +1,6 @@
 import asyncio
 from email.mime.text import MIMEText
+import json
 import time
 from fastapi import Request
 from fastapi import Depends, HTTPException, status
@@ -32,6 +33,7 @@ from apps.webui.models.prompts_classes import Classes, StudentClasses
 from utils.misc import validate_email_format
 from utils.utils import get_admin_or_instructor, get_verified_user, get_password_hash, get_admin_user
 from constants import ERROR_MESSAGES
+from utils.export import ExportFormat, csv_response, ndjson_response
 
 from config import GMAIL_ADDRESS, GMAIL_APP_PASSWORD, SITE_LINK, SRC_LOG_LEVELS
 
@@ -46,7 +48,20 @@ router = APIRouter()
 
 
 @router.get("/", response_model=List[UserModel])
-async def get_users(user: UserModel = Depends(get_admin_or_instructor)) -> List[UserModel]:
+async def get_users(
+    format: ExportFormat = "json", user: UserModel = Depends(get_admin_or_instructor)
+) -> List[UserModel]:
+    if format == "ndjson":
+        return ndjson_response(
+            ([user.model_dump_json() for user in batch] for batch in Users.iter_users()), "users"
+        )
+    if format == "csv":
+        return csv_response(
+            ([user.model_dump(mode="json") for user in batch] for batch in Users.iter_users()),
+            list(UserModel.model_fields),
+            "users",
+        )
+
     result: List[UserModel] = Users.get_users()
     return result
 
@@ -68,7 +83,18 @@ async def get_user_profiles(user: UserModel = Depends(get_admin_or_instructor))
 
 
 @router.get("/statistics", response_model=Dict[str, UserStatistics])
-async def get_user_statistics(user: UserModel = Depends(get_admin_or_instructor)) -> Dict[str, UserStatistics]:
+async def get_user_statistics(
+    format: ExportFormat = "json", user: UserModel = Depends(get_admin_or_instructor)
+) -> Dict[str, UserStatistics]:
+    if format != "json":
+        rows = (
+            [{"user_id": user_id, **statistics.model_dump()} for user_id, statistics in batch]
+            for batch in Users.iter_user_statistics()
+        )
+        if format == "ndjson":
+            return ndjson_response(([json.dumps(row) for row in batch] for batch in rows), "user-statistics")
+        return csv_response(rows, ["user_id", *UserStatistics.model_fields], "user-statistics")
+
     result: Dict[str, UserStatistics] = Users.get_user_statistics()
     return result
 
@@ -442,6 +442,21 @@ OLLAMA_BASE_URLS = PersistentConfig(
     "OLLAMA_BASE_URLS", "ollama.base_urls", OLLAMA_BASE_URLS
 )
 
+OLLAMA_LOAD_BALANCER_POLICY = PersistentConfig(
+    "OLLAMA_LOAD_BALANCER_POLICY",
+    "ollama.load_balancer.policy",
+    os.environ.get("OLLAMA_LOAD_BALANCER_POLICY", "least_connections"),
+)
+
+# Weights for weighted_round_robin, in the same order as OLLAMA_BASE_URLS (default 1)
+OLLAMA_BASE_URL_WEIGHTS = os.environ.get("OLLAMA_BASE_URL_WEIGHTS", "")
+OLLAMA_BASE_URL_WEIGHTS = [
+    int(weight.strip()) for weight in OLLAMA_BASE_URL_WEIGHTS.split(";") if weight
+]
+OLLAMA_BASE_URL_WEIGHTS = PersistentConfig(
+    "OLLAMA_BASE_URL_WEIGHTS", "ollama.load_balancer.weights", OLLAMA_BASE_URL_WEIGHTS
+)
+
 ####################################
 # OPENAI_API
 ####################################
@@ -546,6 +561,66 @@ except:
 CLAUDE_API_BASE_URL = "https://api.anthropic.com/v1"
 
 
+####################################
+# UPSTREAM HTTP CLIENT
+####################################
+
+
+AIOHTTP_CLIENT_LIMIT = int(os.environ.get("AIOHTTP_CLIENT_LIMIT", "0"))
+AIOHTTP_CLIENT_LIMIT_PER_HOST = int(
+    os.environ.get("AIOHTTP_CLIENT_LIMIT_PER_HOST", "100")
+)
+AIOHTTP_CLIENT_KEEPALIVE_TIMEOUT = float(
+    os.environ.get("AIOHTTP_CLIENT_KEEPALIVE_TIMEOUT", "30")
+)
+AIOHTTP_CLIENT_DNS_CACHE_TTL = int(
+    os.environ.get("AIOHTTP_CLIENT_DNS_CACHE_TTL", "300")
+)
+
+# Timeout budgets (seconds) for upstream LLM requests. first_byte covers connecting
+# and waiting for the response headers, read is the longest allowed gap between chunks.
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "10"))
+UPSTREAM_FIRST_BYTE_TIMEOUT = float(
+    os.environ.get("UPSTREAM_FIRST_BYTE_TIMEOUT", "120")
+)
+UPSTREAM_READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", "120"))
+
+# Per-upstream overrides, e.g. {"http://gpu-1:11434": {"first_byte": 300}}
+try:
+    UPSTREAM_TIMEOUT_OVERRIDES = json.loads(
+        os.environ.get("UPSTREAM_TIMEOUT_OVERRIDES", "{}")
+    )
+except Exception as e:
+    log.exception(f"Error loading UPSTREAM_TIMEOUT_OVERRIDES: {e}")
+    UPSTREAM_TIMEOUT_OVERRIDES = {}
+
+UPSTREAM_HEALTH_CHECK_INTERVAL = float(
+    os.environ.get("UPSTREAM_HEALTH_CHECK_INTERVAL", "30")
+)
+UPSTREAM_HEALTH_CHECK_TIMEOUT = float(
+    os.environ.get("UPSTREAM_HEALTH_CHECK_TIMEOUT", "5")
+)
+UPSTREAM_CIRCUIT_BREAKER_THRESHOLD = int(
+    os.environ.get("UPSTREAM_CIRCUIT_BREAKER_THRESHOLD", "3")
+)
+UPSTREAM_CIRCUIT_BREAKER_RESET_TIMEOUT = float(
+    os.environ.get("UPSTREAM_CIRCUIT_BREAKER_RESET_TIMEOUT", "30")
+)
+
+# Saturation signal for autoscaling: an upstream is saturated when its open streams
+# plus requests still waiting for response headers, summed over all workers, reach
+# UPSTREAM_STREAM_CAPACITY, or when every response in the last
+# UPSTREAM_THROTTLE_WINDOW seconds was a 429
+UPSTREAM_STREAM_CAPACITY = int(os.environ.get("UPSTREAM_STREAM_CAPACITY", "32"))
+UPSTREAM_THROTTLE_WINDOW = float(os.environ.get("UPSTREAM_THROTTLE_WINDOW", "60"))
+
+# How long the merged model list is reused before it is refreshed in the background
+MODELS_CACHE_TTL = float(os.environ.get("MODELS_CACHE_TTL", "60"))
+
+# Longest a single pipeline inlet/outlet filter call may take before it is skipped
+PIPELINE_FILTER_TIMEOUT = float(os.environ.get("PIPELINE_FILTER_TIMEOUT", "30"))
+
+
 ####################################
 # ELEVENLABS
 ####################################
@@ -612,6 +687,13 @@ WEBHOOK_URL = PersistentConfig(
 
 ENABLE_ADMIN_EXPORT = os.environ.get("ENABLE_ADMIN_EXPORT", "True").lower() == "true"
 
+# Compress stored chat JSON, see CompressedTextField in apps/webui/internal/db.py
+ENABLE_CHAT_COMPRESSION = (
+    os.environ.get("ENABLE_CHAT_COMPRESSION", "False").lower() == "true"
+)
+# Shorter values are stored as they are; they gain little after base64
+CHAT_COMPRESSION_MIN_SIZE = int(os.environ.get("CHAT_COMPRESSION_MIN_SIZE", "512"))
+
 ENABLE_COMMUNITY_SHARING = PersistentConfig(
     "ENABLE_COMMUNITY_SHARING",
     "ui.enable_community_sharing",
@@ -974,6 +1056,33 @@ AUDIO_OPENAI_API_VOICE = PersistentConfig(
 
 DATABASE_URL = os.environ.get("DATABASE_URL", f"sqlite:///{DATA_DIR}/webui.db")
 
+# How often (seconds) each worker compares its cached prompt/evaluation/model rows
+# against the shared version stamps, i.e. how stale another worker's cache can get
+CACHE_VERSION_CHECK_INTERVAL = float(
+    os.environ.get("CACHE_VERSION_CHECK_INTERVAL", "2")
+)
+
+# Token usage is aggregated in memory and written every TOKEN_ACCOUNTING_FLUSH_INTERVAL
+# seconds, or as soon as TOKEN_ACCOUNTING_FLUSH_SIZE usage events are pending
+TOKEN_ACCOUNTING_FLUSH_INTERVAL = float(
+    os.environ.get("TOKEN_ACCOUNTING_FLUSH_INTERVAL", "1")
+)
+TOKEN_ACCOUNTING_FLUSH_SIZE = int(os.environ.get("TOKEN_ACCOUNTING_FLUSH_SIZE", "500"))
+# Usage that fails to be written this many flushes in a row is logged and dropped
+TOKEN_ACCOUNTING_MAX_RETRIES = int(os.environ.get("TOKEN_ACCOUNTING_MAX_RETRIES", "5"))
+
+
+####################################
+# Telemetry
+####################################
+
+# Bearer token required by GET /metrics; when empty, an admin's token or API key is.
+# With several uvicorn workers also set PROMETHEUS_MULTIPROC_DIR (see start.sh).
+METRICS_API_KEY = os.environ.get("METRICS_API_KEY", "")
+
+# How often (seconds) each worker measures how late the event loop wakes up
+EVENT_LOOP_LAG_INTERVAL = float(os.environ.get("EVENT_LOOP_LAG_INTERVAL", "0.5"))
+
 
 ####################################
 # Email
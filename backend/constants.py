@@ -52,6 +52,10 @@ class ERROR_MESSAGES(str, Enum):
     DUPLICATE_ROLES = "Roles must be unique."
     EXISTING_USERS = "You can't turn off authentication because there are existing users. If you want to disable WEBUI_AUTH, make sure your web interface doesn't have any existing users and is a fresh installation."
     INVALID_DURATION = "Invalid duration format."
+    INVALID_DATE_RANGE = "The start date must not be after the end date."
+    INVALID_CURSOR = "Invalid page cursor."
+    INVALID_MESSAGE = "A message needs a string \"id\"."
+    INVALID_WEIGHTS = "There can be at most one weight per Ollama base URL."
 
     UNAUTHORIZED = "401 Unauthorized"
     ACCESS_PROHIBITED = "You do not have permission to access this resource. Please contact your administrator for assistance."
@@ -85,6 +89,7 @@ class ERROR_MESSAGES(str, Enum):
     OPENAI_NOT_FOUND = lambda name="": "OpenAI API was not found"
     CLAUDE_NOT_FOUND = lambda name="": "Claude API was not found"
     OLLAMA_NOT_FOUND = "WebUI could not connect to Ollama"
+    UPSTREAM_UNAVAILABLE = "All backends serving this model are currently unavailable. Please try again shortly."
     CREATE_API_KEY_ERROR = "Oops! Something went wrong while creating your API key. Please try again later. If the issue persists, contact support for assistance."
 
     EMPTY_CONTENT = "The content provided is empty. Please ensure that there is text or data present before proceeding."
@@ -13,12 +13,15 @@ import mimetypes
 from fastapi import FastAPI, Request, Depends, status
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
 from fastapi.middleware.wsgi import WSGIMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.exceptions import HTTPException as StarletteHTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import StreamingResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from starlette.responses import Response
 
 from apps.ollama.main import app as ollama_app, get_all_models as get_ollama_models
 from apps.openai.main import app as openai_app, get_all_models as get_openai_models
@@ -39,11 +42,26 @@ from utils.utils import (
     get_verified_user,
     get_current_user,
     get_http_authorization_cred,
+    bearer_security,
 )
 from apps.rag.utils import rag_messages
+from utils.http_client import get_session, close_sessions
+from utils.health import UpstreamHealth
+from utils.saturation import UpstreamLoad
+from utils.latency import UpstreamLatency
+from utils.telemetry import (
+    CONTENT_TYPE_LATEST,
+    TelemetryMiddleware,
+    EventLoopLag,
+    render_metrics,
+)
+from utils.accounting import TokenAccounting
+from utils.models import AvailableModels, ModelIndex
+from utils.payload import is_chat_completion_request, read_json_body
 
 from config import (
     CONFIG_DATA,
+    METRICS_API_KEY,
     WEBUI_NAME,
     WEBUI_URL,
     WEBUI_AUTH,
@@ -62,6 +80,7 @@ from config import (
     SRC_LOG_LEVELS,
     WEBHOOK_URL,
     ENABLE_ADMIN_EXPORT,
+    PIPELINE_FILTER_TIMEOUT,
     AppConfig,
     WEBUI_BUILD_HASH,
 )
@@ -102,7 +121,16 @@ https://github.com/open-webui/open-webui
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    UpstreamHealth.start()
+    TokenAccounting.start()
+    EventLoopLag.start()
+    UpstreamLoad.start()
     yield
+    await UpstreamLoad.stop()
+    await EventLoopLag.stop()
+    await TokenAccounting.stop()
+    await UpstreamHealth.stop()
+    await close_sessions()
 
 
 app = FastAPI(
@@ -122,8 +150,6 @@ app.state.config.MODEL_FILTER_LIST = MODEL_FILTER_LIST
 app.state.config.WEBHOOK_URL = WEBHOOK_URL
 
 
-app.state.MODELS = {}
-
 origins = ["*"]
 
 # Custom middleware to add security headers
@@ -138,219 +164,178 @@ origins = ["*"]
 # app.add_middleware(SecurityHeadersMiddleware)
 
 
-class RAGMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        return_citations = False
+class RAGMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-        if request.method == "POST" and (
-            "/ollama/api/chat" in request.url.path
-            or "/chat/completions" in request.url.path
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not is_chat_completion_request(
+            Request(scope)
         ):
-            log.debug(f"request.url.path: {request.url.path}")
-
-            # Read the original request body
-            body = await request.body()
-            # Decode body to string
-            body_str = body.decode("utf-8")
-            # Parse string to JSON
-            data = json.loads(body_str) if body_str else {}
-
-            return_citations = data.get("citations", False)
-            if "citations" in data:
-                del data["citations"]
-
-            # Example: Add a new key-value pair or modify existing ones
-            # data["modified"] = True  # Example modification
-            if "docs" in data:
-                data = {**data}
-                data["messages"], citations = rag_messages(
-                    docs=data["docs"],
-                    messages=data["messages"],
-                    template=rag_app.state.config.RAG_TEMPLATE,
-                    embedding_function=rag_app.state.EMBEDDING_FUNCTION,
-                    k=rag_app.state.config.TOP_K,
-                    reranking_function=rag_app.state.sentence_transformer_rf,
-                    r=rag_app.state.config.RELEVANCE_THRESHOLD,
-                    hybrid_search=rag_app.state.config.ENABLE_RAG_HYBRID_SEARCH,
-                )
-                del data["docs"]
+            return await self.app(scope, receive, send)
+
+        log.debug(f"request.url.path: {scope['path']}")
+
+        # Parsed once and shared with the later stages through request.state
+        data, receive = await read_json_body(scope, receive)
+
+        return_citations = data.get("citations", False)
+        if "citations" in data:
+            del data["citations"]
+
+        citations = []
+
+        # Example: Add a new key-value pair or modify existing ones
+        # data["modified"] = True  # Example modification
+        if "docs" in data:
+            data["messages"], citations = rag_messages(
+                docs=data["docs"],
+                messages=data["messages"],
+                template=rag_app.state.config.RAG_TEMPLATE,
+                embedding_function=rag_app.state.EMBEDDING_FUNCTION,
+                k=rag_app.state.config.TOP_K,
+                reranking_function=rag_app.state.sentence_transformer_rf,
+                r=rag_app.state.config.RELEVANCE_THRESHOLD,
+                hybrid_search=rag_app.state.config.ENABLE_RAG_HYBRID_SEARCH,
+            )
+            del data["docs"]
 
-                log.debug(
-                    f"data['messages']: {data['messages']}, citations: {citations}"
-                )
+            log.debug(f"data['messages']: {data['messages']}, citations: {citations}")
 
-            modified_body_bytes = json.dumps(data).encode("utf-8")
+        if not return_citations:
+            return await self.app(scope, receive, send)
 
-            # Replace the request body with the modified one
-            request._body = modified_body_bytes
+        async def send_with_citations(message: Message):
+            # Inject the citations into a streaming response as the first SSE event or NDJSON line
+            if message["type"] != "http.response.start":
+                return await send(message)
 
-            # Set custom header to ensure content-length matches new body length
-            request.headers.__dict__["_list"] = [
-                (b"content-length", str(len(modified_body_bytes)).encode("utf-8")),
-                *[
-                    (k, v)
-                    for k, v in request.headers.raw
-                    if k.lower() != b"content-length"
-                ],
-            ]
+            headers = MutableHeaders(scope=message)
+            content_type = headers.get("content-type", "")
 
-        # fix for RuntimeError: No response returned when disconnecting
-        # https://stackoverflow.com/a/72677699
-        response = None
-        try:
-            response = await call_next(request)
-        except RuntimeError as exc:
-            if str(exc) == 'No response returned.' and await request.is_disconnected():
-                return Response(status_code=status.HTTP_204_NO_CONTENT)
-            raise
-
-        if return_citations:
-            # Inject the citations into the response
-            if isinstance(response, StreamingResponse):
-                # If it's a streaming response, inject it as SSE event or NDJSON line
-                content_type = response.headers.get("Content-Type")
-                if "text/event-stream" in content_type:
-                    return StreamingResponse(
-                        self.openai_stream_wrapper(response.body_iterator, citations),
-                    )
-                if "application/x-ndjson" in content_type:
-                    return StreamingResponse(
-                        self.ollama_stream_wrapper(response.body_iterator, citations),
-                    )
-
-        return response
+            citations_chunk = None
+            if "text/event-stream" in content_type:
+                citations_chunk = f"data: {json.dumps({'citations': citations})}\n\n"
+            elif "application/x-ndjson" in content_type:
+                citations_chunk = f"{json.dumps({'citations': citations})}\n"
 
-    async def _receive(self, body: bytes):
-        return {"type": "http.request", "body": body, "more_body": False}
+            if citations_chunk is None:
+                return await send(message)
 
-    async def openai_stream_wrapper(self, original_generator, citations):
-        yield f"data: {json.dumps({'citations': citations})}\n\n"
-        async for data in original_generator:
-            yield data
+            del headers["content-length"]
+            await send(message)
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": citations_chunk.encode("utf-8"),
+                    "more_body": True,
+                }
+            )
 
-    async def ollama_stream_wrapper(self, original_generator, citations):
-        yield f"{json.dumps({'citations': citations})}\n"
-        async for data in original_generator:
-            yield data
+        await self.app(scope, receive, send_with_citations)
 
 
 app.add_middleware(RAGMiddleware)
 
 
-class PipelineMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        if request.method == "POST" and (
-            "/ollama/api/chat" in request.url.path
-            or "/chat/completions" in request.url.path
+async def run_pipeline_filters(
+    filters: List[dict], stage: str, user: Optional[dict], data: dict
+):
+    """
+    Passes `data` through the inlet or outlet (`stage`) of each filter pipeline in turn.
+
+    A filter that errors out or exceeds PIPELINE_FILTER_TIMEOUT is skipped, so one slow
+    pipeline server cannot stall the chain. A filter rejecting the request with a
+    `detail` is returned as a JSONResponse for the caller to pass on.
+    """
+    timeout = aiohttp.ClientTimeout(total=PIPELINE_FILTER_TIMEOUT)
+
+    for filter in filters:
+        try:
+            urlIdx = filter["urlIdx"]
+
+            url = openai_app.state.config.OPENAI_API_BASE_URLS[urlIdx]
+            key = openai_app.state.config.OPENAI_API_KEYS[urlIdx]
+
+            if key == "":
+                continue
+
+            headers = {"Authorization": f"Bearer {key}"}
+            session = get_session(url)
+            async with session.post(
+                f"{url}/{filter['id']}/filter/{stage}",
+                headers=headers,
+                json={"user": user, "body": data},
+                timeout=timeout,
+            ) as r:
+                if r.status >= 400:
+                    try:
+                        res = await r.json()
+                        if "detail" in res:
+                            return JSONResponse(status_code=r.status, content=res)
+                    except:
+                        pass
+
+                r.raise_for_status()
+                data = await r.json()
+        except asyncio.TimeoutError:
+            log.warning(f"Pipeline filter '{filter['id']}' {stage} timed out, skipping")
+        except Exception as e:
+            # Handle connection error here
+            log.warning(f"Pipeline filter '{filter['id']}' {stage} failed, skipping: {e}")
+
+    return data
+
+
+class PipelineMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not is_chat_completion_request(
+            Request(scope)
         ):
-            log.debug(f"request.url.path: {request.url.path}")
-
-            # Read the original request body
-            body = await request.body()
-            # Decode body to string
-            body_str = body.decode("utf-8")
-            # Parse string to JSON
-            data = json.loads(body_str) if body_str else {}
-
-            model_id = data["model"]
-            filters = [
-                model
-                for model in app.state.MODELS.values()
-                if "pipeline" in model
-                and "type" in model["pipeline"]
-                and model["pipeline"]["type"] == "filter"
-                and (
-                    model["pipeline"]["pipelines"] == ["*"]
-                    or any(
-                        model_id == target_model_id
-                        for target_model_id in model["pipeline"]["pipelines"]
+            return await self.app(scope, receive, send)
+
+        log.debug(f"request.url.path: {scope['path']}")
+
+        # Parsed once and shared with the later stages through request.state
+        data, receive = await read_json_body(scope, receive)
+
+        model_id = data["model"]
+        sorted_filters = list(AvailableModels.index.get_filters(model_id))
+
+        user = None
+        if len(sorted_filters) > 0:
+            try:
+                user = get_current_user(
+                    get_http_authorization_cred(
+                        Headers(scope=scope).get("Authorization")
                     )
                 )
-            ]
-            sorted_filters = sorted(filters, key=lambda x: x["pipeline"]["priority"])
-
-            user = None
-            if len(sorted_filters) > 0:
-                try:
-                    user = get_current_user(
-                        get_http_authorization_cred(
-                            request.headers.get("Authorization")
-                        )
-                    )
-                    user = {"id": user.id, "name": user.name, "role": user.role}
-                except:
-                    pass
-
-            model = app.state.MODELS[model_id]
-
-            if "pipeline" in model:
-                sorted_filters.append(model)
-
-            for filter in sorted_filters:
-                r = None
-                try:
-                    urlIdx = filter["urlIdx"]
-
-                    url = openai_app.state.config.OPENAI_API_BASE_URLS[urlIdx]
-                    key = openai_app.state.config.OPENAI_API_KEYS[urlIdx]
-
-                    if key != "":
-                        headers = {"Authorization": f"Bearer {key}"}
-                        r = requests.post(
-                            f"{url}/{filter['id']}/filter/inlet",
-                            headers=headers,
-                            json={
-                                "user": user,
-                                "body": data,
-                            },
-                        )
-
-                        r.raise_for_status()
-                        data = r.json()
-                except Exception as e:
-                    # Handle connection error here
-                    print(f"Connection error: {e}")
-
-                    if r is not None:
-                        try:
-                            res = r.json()
-                            if "detail" in res:
-                                return JSONResponse(
-                                    status_code=r.status_code,
-                                    content=res,
-                                )
-                        except:
-                            pass
-
-                    else:
-                        pass
+                user = {"id": user.id, "name": user.name, "role": user.role}
+            except:
+                pass
+
+        model = app.state.MODELS[model_id]
 
-            if "pipeline" not in app.state.MODELS[model_id]:
-                if "title" in data:
-                    del data["title"]
-
-            modified_body_bytes = json.dumps(data).encode("utf-8")
-            # Replace the request body with the modified one
-            request._body = modified_body_bytes
-            # Set custom header to ensure content-length matches new body length
-            request.headers.__dict__["_list"] = [
-                (b"content-length", str(len(modified_body_bytes)).encode("utf-8")),
-                *[
-                    (k, v)
-                    for k, v in request.headers.raw
-                    if k.lower() != b"content-length"
-                ],
-            ]
+        if "pipeline" in model:
+            sorted_filters.append(model)
 
-        try:
-            return await call_next(request)
-        except RuntimeError as exc:
-            if str(exc) == 'No response returned.' and await request.is_disconnected():
-                return Response(status_code=status.HTTP_204_NO_CONTENT)
-            raise
+        filtered = await run_pipeline_filters(sorted_filters, "inlet", user, data)
+        if isinstance(filtered, JSONResponse):
+            return await filtered(scope, receive, send)
 
-    async def _receive(self, body: bytes):
-        return {"type": "http.request", "body": body, "more_body": False}
+        if filtered is not data:
+            # filters return a new body, swap it in for the later stages
+            data.clear()
+            data.update(filtered)
+
+        if "pipeline" not in app.state.MODELS[model_id]:
+            if "title" in data:
+                del data["title"]
+
+        await self.app(scope, receive, send)
 
 
 app.add_middleware(PipelineMiddleware)
@@ -365,39 +350,49 @@ app.add_middleware(
 )
 
 
-@app.middleware("http")
-async def check_url(request: Request, call_next):
-    if len(app.state.MODELS) == 0:
-        await get_all_models()
-    else:
-        pass
+class CheckUrlMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-    try:
-        start_time = int(time.time())
-        response = await call_next(request)
-        process_time = int(time.time()) - start_time
-        response.headers["X-Process-Time"] = str(process_time)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        if len(app.state.MODELS) == 0:
+            await get_all_models()
+        else:
+            pass
 
-        return response
-    except RuntimeError as exc:
-        if str(exc) == 'No response returned.' and await request.is_disconnected():
-            return Response(status_code=status.HTTP_204_NO_CONTENT)
-        raise
+        start_time = time.perf_counter()
+        # the proxies measure queue time and TTFT from here
+        scope.setdefault("state", {})["received_at"] = start_time
 
+        async def send_with_process_time(message: Message):
+            if message["type"] == "http.response.start":
+                process_time = time.perf_counter() - start_time
+                MutableHeaders(scope=message)["X-Process-Time"] = f"{process_time:.3f}"
+            await send(message)
+
+        await self.app(scope, receive, send_with_process_time)
+
+
+app.add_middleware(CheckUrlMiddleware)
 
-@app.middleware("http")
-async def update_embedding_function(request: Request, call_next):
-    response = None
-    try:
-        response = await call_next(request)
-    except RuntimeError as exc:
-        if str(exc) == 'No response returned.' and await request.is_disconnected():
-            return Response(status_code=status.HTTP_204_NO_CONTENT)
-        raise
 
-    if "/embedding/update" in request.url.path:
-        webui_app.state.EMBEDDING_FUNCTION = rag_app.state.EMBEDDING_FUNCTION
-    return response
+class UpdateEmbeddingFunctionMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await self.app(scope, receive, send)
+
+        if scope["type"] == "http" and "/embedding/update" in scope["path"]:
+            webui_app.state.EMBEDDING_FUNCTION = rag_app.state.EMBEDDING_FUNCTION
+
+
+app.add_middleware(UpdateEmbeddingFunctionMiddleware)
+# outermost, so route timings include every other middleware
+app.add_middleware(TelemetryMiddleware)
 
 
 app.mount("/ollama", ollama_app)
@@ -413,7 +408,7 @@ app.mount("/api/v1", webui_app)
 webui_app.state.EMBEDDING_FUNCTION = rag_app.state.EMBEDDING_FUNCTION
 
 
-async def get_all_models():
+async def fetch_all_models():
     openai_models = []
     ollama_models = []
     claude_models = []
@@ -446,24 +441,19 @@ async def get_all_models():
     models = openai_models + ollama_models + claude_models
     custom_models = Models.get_all_models()
 
+    # index upstream models by id and base id so merging is a lookup per custom model
+    index = ModelIndex(models)
+
     for custom_model in custom_models:
         if custom_model.base_model_id == None:
-            for model in models:
-                if (
-                    custom_model.id == model["id"]
-                    or custom_model.id == model["id"].split(":")[0]
-                ):
-                    model["name"] = custom_model.name
-                    model["info"] = custom_model.model_dump()
+            for model in index.find(custom_model.id):
+                model["name"] = custom_model.name
+                model["info"] = custom_model.model_dump()
         else:
             owned_by = "openai"
-            for model in models:
-                if (
-                    custom_model.base_model_id == model["id"]
-                    or custom_model.base_model_id == model["id"].split(":")[0]
-                ):
-                    owned_by = model["owned_by"]
-                    break
+            base_models = index.find(custom_model.base_model_id)
+            if len(base_models) > 0:
+                owned_by = base_models[0]["owned_by"]
 
             models.append(
                 {
@@ -477,11 +467,18 @@ async def get_all_models():
                 }
             )
 
-    app.state.MODELS = {model["id"]: model for model in models}
+    return models
 
-    webui_app.state.MODELS = app.state.MODELS
 
-    return models
+AvailableModels.register_loader(fetch_all_models)
+
+# kept up to date in place by the registry on every refresh
+app.state.MODELS = AvailableModels.index.by_id
+webui_app.state.MODELS = AvailableModels.index.by_id
+
+
+async def get_all_models(force: bool = False):
+    return await AvailableModels.get_models(force=force)
 
 
 @app.get("/api/models")
@@ -513,69 +510,19 @@ async def chat_completed(form_data: dict, user=Depends(get_verified_user)):
     data = form_data
     model_id = data["model"]
 
-    filters = [
-        model
-        for model in app.state.MODELS.values()
-        if "pipeline" in model
-        and "type" in model["pipeline"]
-        and model["pipeline"]["type"] == "filter"
-        and (
-            model["pipeline"]["pipelines"] == ["*"]
-            or any(
-                model_id == target_model_id
-                for target_model_id in model["pipeline"]["pipelines"]
-            )
-        )
-    ]
-    sorted_filters = sorted(filters, key=lambda x: x["pipeline"]["priority"])
-
-    print(model_id)
+    sorted_filters = list(AvailableModels.index.get_filters(model_id))
 
     if model_id in app.state.MODELS:
         model = app.state.MODELS[model_id]
         if "pipeline" in model:
             sorted_filters = [model] + sorted_filters
 
-    for filter in sorted_filters:
-        r = None
-        try:
-            urlIdx = filter["urlIdx"]
-
-            url = openai_app.state.config.OPENAI_API_BASE_URLS[urlIdx]
-            key = openai_app.state.config.OPENAI_API_KEYS[urlIdx]
-
-            if key != "":
-                headers = {"Authorization": f"Bearer {key}"}
-                r = requests.post(
-                    f"{url}/{filter['id']}/filter/outlet",
-                    headers=headers,
-                    json={
-                        "user": {"id": user.id, "name": user.name, "role": user.role},
-                        "body": data,
-                    },
-                )
-
-                r.raise_for_status()
-                data = r.json()
-        except Exception as e:
-            # Handle connection error here
-            print(f"Connection error: {e}")
-
-            if r is not None:
-                try:
-                    res = r.json()
-                    if "detail" in res:
-                        return JSONResponse(
-                            status_code=r.status_code,
-                            content=res,
-                        )
-                except:
-                    pass
-
-            else:
-                pass
-
-    return data
+    return await run_pipeline_filters(
+        sorted_filters,
+        "outlet",
+        {"id": user.id, "name": user.name, "role": user.role},
+        data,
+    )
 
 
 @app.get("/api/pipelines/list")
@@ -623,6 +570,7 @@ async def add_pipeline(form_data: AddPipelineForm, user=Depends(get_admin_user))
         r.raise_for_status()
         data = r.json()
 
+        AvailableModels.invalidate()
         return {**data}
     except Exception as e:
         # Handle connection error here
@@ -666,6 +614,7 @@ async def delete_pipeline(form_data: DeletePipelineForm, user=Depends(get_admin_
         r.raise_for_status()
         data = r.json()
 
+        AvailableModels.invalidate()
         return {**data}
     except Exception as e:
         # Handle connection error here
@@ -994,6 +943,35 @@ async def healthcheck():
     return {"status": True}
 
 
+@app.get("/api/upstreams/health")
+async def get_upstreams_health(user=Depends(get_admin_user)):
+    return {"data": UpstreamHealth.get_status()}
+
+
+@app.get("/api/upstreams/latency")
+async def get_upstreams_latency(user=Depends(get_admin_user)):
+    return {"data": UpstreamLatency.get_stats()}
+
+
+@app.get("/metrics")
+async def get_prometheus_metrics(
+    auth_token: HTTPAuthorizationCredentials = Depends(bearer_security),
+):
+    if METRICS_API_KEY:
+        if auth_token.credentials != METRICS_API_KEY:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail=ERROR_MESSAGES.UNAUTHORIZED,
+            )
+    else:
+        # without a scrape key only admins may read the metrics
+        get_admin_user(get_current_user(auth_token))
+
+    # merging the workers' files reads from disk
+    content = await run_in_threadpool(render_metrics)
+    return Response(content=content, media_type=CONTENT_TYPE_LATEST)
+
+
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 app.mount("/cache", StaticFiles(directory=CACHE_DIR), name="cache")
 
@@ -55,4 +55,15 @@ if [ -n "$SPACE_ID" ]; then
   export WEBUI_URL=${SPACE_HOST}
 fi
 
-WEBUI_SECRET_KEY="$WEBUI_SECRET_KEY" exec uvicorn main:app --host "$HOST" --port "$PORT" --forwarded-allow-ips '*'
+UVICORN_WORKERS="${UVICORN_WORKERS:-1}"
+if [ "$UVICORN_WORKERS" -gt 1 ]; then
+  # Workers share their Prometheus metrics through files in this directory
+  export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/open-webui-metrics}"
+fi
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+  # Stale files from a previous run would be merged into the new counters
+  rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+  mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
+WEBUI_SECRET_KEY="$WEBUI_SECRET_KEY" exec uvicorn main:app --host "$HOST" --port "$PORT" --forwarded-allow-ips '*' --workers "$UVICORN_WORKERS"
@@ -0,0 +1,50 @@
+import pytest
+
+from apps.webui.internal.db import DB
+from apps.webui.models.chats import Chat, CHAT_LIST_FIELDS, paginate_chats
+from apps.webui.models.prompts_classes import ClassPrompt, StudentClass
+from apps.webui.models.tags import ChatIdTag
+
+
+# the hot queries migration 042 added composite indexes for
+HOT_QUERIES = {
+    "sidebar": lambda: paginate_chats(
+        Chat.select(*CHAT_LIST_FIELDS).where(Chat.user_id == "user").where(Chat.archived == False),
+        (0, "chat"),
+        50,
+    ),
+    "archived chats": lambda: paginate_chats(
+        Chat.select(*CHAT_LIST_FIELDS).where(Chat.archived == True).where(Chat.user_id == "user"),
+        None,
+        50,
+    ),
+    "admin chat list": lambda: paginate_chats(Chat.select(*CHAT_LIST_FIELDS), (0, "chat"), 50),
+    "submission check": lambda: Chat.select(Chat.id).where(
+        (Chat.user_id == "user") & (Chat.is_submitted == True) & (Chat.class_id == 1) & (Chat.prompt_id == 1)
+    ),
+    "class chats": lambda: Chat.select().where(Chat.class_id == 1),
+    "chats by tag": lambda: paginate_chats(
+        Chat.select(*CHAT_LIST_FIELDS)
+        .join(ChatIdTag, on=(ChatIdTag.chat_id == Chat.id))
+        .where((ChatIdTag.user_id == "user") & (ChatIdTag.tag_name == "tag"))
+        .where(Chat.archived == False),
+        None,
+        50,
+    ),
+    "tags of chat": lambda: ChatIdTag.select().where((ChatIdTag.user_id == "user") & (ChatIdTag.chat_id == "chat")),
+    "students of class": lambda: StudentClass.select(StudentClass.student_id, StudentClass.class_id)
+    .where(StudentClass.class_id == 1),
+    "classes of student": lambda: StudentClass.select(StudentClass.student_id, StudentClass.class_id)
+    .where(StudentClass.student_id == "user"),
+    "class assignment": lambda: ClassPrompt.select()
+    .where((ClassPrompt.class_id == 1) & (ClassPrompt.prompt_id == 1)),
+}
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_query_uses_an_index(name):
+    sql, params = HOT_QUERIES[name]().sql()
+    plan = [row[-1] for row in DB.execute_sql("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+    full_scans = [step for step in plan if step.startswith("SCAN") and "INDEX" not in step]
+    assert not full_scans, f"{name}: {' | '.join(plan)}"
@@ -0,0 +1,93 @@
+import base64
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from apps.webui.models.chats import Chat, ChatForm, Chats, encode_chat_cursor
+from apps.webui.models.users import UserModel
+from apps.webui.routers.chats import router
+from constants import ERROR_MESSAGES
+from utils.utils import get_current_user
+
+USER_ID = "paging-user"
+
+
+def create_chats(count: int, updated_at: int) -> list:
+    ids = [Chats.insert_new_chat(USER_ID, ChatForm(chat={"title": f"Chat {i}"})).id for i in range(count)]
+    # every chat updated in the same second, so only the id orders them
+    Chat.update(updated_at=updated_at).where(Chat.id.in_(ids)).execute()
+    return sorted(ids, reverse=True)
+
+
+@pytest.fixture(scope="module")
+def chat_ids():
+    ids = create_chats(7, 1700000000)
+    yield ids
+    Chats.delete_chats_by_user_id(USER_ID)
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(router, prefix="/chats")
+    app.dependency_overrides[get_current_user] = lambda: UserModel(
+        id=USER_ID,
+        name="Paging",
+        email="paging@example.com",
+        role="user",
+        profile_image_url="",
+        last_active_at=0,
+        updated_at=0,
+        created_at=0,
+    )
+    return TestClient(app)
+
+
+def test_pages_break_updated_at_ties_by_id(chat_ids):
+    pages = []
+    cursor = None
+    while True:
+        page = Chats.get_chat_list_by_user_id(USER_ID, cursor=cursor, limit=3)
+        pages.append([chat.id for chat in page])
+        if len(page) < 3:
+            break
+        cursor = (page[-1].updated_at, page[-1].id)
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [id for page in pages for id in page] == chat_ids
+
+
+def test_last_page_has_no_next_cursor(client, chat_ids):
+    ids = []
+    cursor = None
+    for _ in range(len(chat_ids)):
+        response = client.get("/chats/list", params={"limit": 3, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        ids += [chat["id"] for chat in response.json()]
+
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert ids == chat_ids
+    assert "X-Next-Cursor" not in response.headers
+    assert len(response.json()) == 1
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"no separator").decode(),
+    base64.urlsafe_b64encode(b"yesterday:id").decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_malformed_cursor_is_rejected(client, cursor):
+    response = client.get("/chats/list", params={"cursor": cursor})
+    assert response.status_code == 400
+    assert response.json() == {"detail": ERROR_MESSAGES.INVALID_CURSOR}
+
+
+def test_cursor_round_trip(client, chat_ids):
+    response = client.get("/chats/list", params={"cursor": encode_chat_cursor(1700000000, chat_ids[4])})
+    assert [chat["id"] for chat in response.json()] == chat_ids[5:]
+    assert "X-Next-Cursor" not in response.headers
@@ -0,0 +1,125 @@
+import json
+
+import peewee as pw
+import pytest
+
+import apps.webui.models.chats as chats_module
+from apps.webui.models.chats import Chats, ChatForm, ChatMessage
+
+
+def make_chat(count: int) -> dict:
+    messages = {}
+    parent_id = None
+    for i in range(count):
+        message_id = f"m{i}"
+        messages[message_id] = {"id": message_id, "parentId": parent_id, "childrenIds": [], "content": str(i)}
+        if parent_id is not None:
+            messages[parent_id]["childrenIds"].append(message_id)
+        parent_id = message_id
+
+    return {
+        "title": "Chat",
+        "history": {"messages": messages, "currentId": parent_id},
+        "messages": [messages[f"m{i}"] for i in range(count)],
+    }
+
+
+def read_chat(id: str) -> dict:
+    return json.loads(Chats.get_chat_by_id(id).chat)
+
+
+def test_insert_round_trip():
+    chat = make_chat(3)
+    created = Chats.insert_new_chat("user", ChatForm(chat=chat))
+
+    assert read_chat(created.id) == chat
+    assert ChatMessage.select().where(ChatMessage.chat_id == created.id).count() == 3
+
+
+def test_update_with_empty_history_removes_messages():
+    created = Chats.insert_new_chat("user", ChatForm(chat=make_chat(2)))
+
+    Chats.update_chat_by_id(created.id, {"history": {"messages": {}, "currentId": None}, "messages": []})
+
+    assert read_chat(created.id) == {
+        "title": "Chat",
+        "history": {"messages": {}, "currentId": None},
+        "messages": [],
+    }
+    assert ChatMessage.select().where(ChatMessage.chat_id == created.id).count() == 0
+
+
+def test_empty_chat_keeps_messages_keys():
+    chat = {"history": {"messages": {}, "currentId": None}, "messages": []}
+    created = Chats.insert_new_chat("user", ChatForm(chat=chat))
+
+    assert read_chat(created.id) == chat
+
+
+def test_messages_list_is_rebuilt_from_current_id():
+    chat = make_chat(3)
+    del chat["messages"]
+    created = Chats.insert_new_chat("user", ChatForm(chat=chat))
+
+    assert [message["id"] for message in read_chat(created.id)["messages"]] == ["m0", "m1", "m2"]
+
+
+def test_messages_list_off_the_chain_is_kept():
+    chat = make_chat(3)
+    chat["messages"] = chat["messages"][:1]
+    created = Chats.insert_new_chat("user", ChatForm(chat=chat))
+    assert read_chat(created.id) == chat
+
+    # a later history update without a list goes back to the chain
+    update = make_chat(3)
+    del update["messages"]
+    Chats.update_chat_by_id(created.id, update)
+    assert [message["id"] for message in read_chat(created.id)["messages"]] == ["m0", "m1", "m2"]
+
+
+def test_upsert_chat_message():
+    created = Chats.insert_new_chat("user", ChatForm(chat=make_chat(2)))
+
+    Chats.upsert_chat_message(created.id, "user", {"id": "m2", "parentId": "m1", "content": "2"})
+    chat = read_chat(created.id)
+    assert chat["history"]["currentId"] == "m2"
+    assert chat["history"]["messages"]["m1"]["childrenIds"] == ["m2"]
+    assert [message["id"] for message in chat["messages"]] == ["m0", "m1", "m2"]
+
+    Chats.upsert_chat_message(created.id, "user", {"id": "m2", "content": "edited"})
+    assert read_chat(created.id)["history"]["messages"]["m2"] == {
+        "id": "m2", "parentId": "m1", "content": "edited", "childrenIds": []
+    }
+
+    assert Chats.upsert_chat_message(created.id, "someone else", {"id": "m3"}) is None
+
+
+def test_upsert_chat_message_keeps_children():
+    # a turn as Chat.svelte saves it: the prompt, then the response of every model
+    created = Chats.insert_new_chat("user", ChatForm(chat=make_chat(2)))
+
+    Chats.upsert_chat_message(created.id, "user", {"id": "prompt", "parentId": "m1", "content": "?"})
+    Chats.upsert_chat_message(created.id, "user", {"id": "a", "parentId": "prompt", "content": "a"})
+    Chats.upsert_chat_message(created.id, "user", {"id": "prompt", "parentId": "m1", "content": "?!"})
+    Chats.upsert_chat_message(created.id, "user", {"id": "b", "parentId": "prompt", "content": "b"})
+
+    chat = read_chat(created.id)
+    assert chat["history"]["messages"]["m1"]["childrenIds"] == ["prompt"]
+    assert chat["history"]["messages"]["prompt"]["childrenIds"] == ["a", "b"]
+    assert chat["history"]["messages"]["prompt"]["content"] == "?!"
+    assert chat["history"]["messages"]["b"]["childrenIds"] == []
+    assert chat["history"]["currentId"] == "b"
+
+
+def test_iter_chats_raises_database_errors(monkeypatch):
+    Chats.insert_new_chat("user", ChatForm(chat=make_chat(1)))
+
+    def iter_batches(query, key, batch_size):
+        yield list(query.limit(1))
+        raise pw.OperationalError("database is locked")
+
+    monkeypatch.setattr(chats_module, "iter_batches", iter_batches)
+    batches = Chats.iter_chats()
+    assert len(next(batches)) == 1
+    with pytest.raises(pw.OperationalError):
+        next(batches)
@@ -0,0 +1,75 @@
+import datetime
+
+from apps.webui.models.chats import (
+    CLASS_ANALYTIC_FIELDS,
+    Chat,
+    ChatForm,
+    ChatTimingForm,
+    Chats,
+    ClassAnalytic,
+    select_class_analytics,
+)
+from apps.webui.models.metrics import Metrics
+
+CLASS_IDS = (9001, 9002)
+
+
+def create_chat(user_id: str, class_id: int, prompt_id: int) -> str:
+    chat = {"title": "Assignment", "class_id": class_id, "prompt_id": prompt_id, "history": {"messages": {}}}
+    return Chats.insert_new_chat(user_id, ChatForm(chat=chat)).id
+
+
+def assert_analytics_match():
+    stored = {
+        (row.class_id, row.user_id, row.prompt_id): tuple(getattr(row, field) for field in CLASS_ANALYTIC_FIELDS)
+        for row in ClassAnalytic.select().where(ClassAnalytic.class_id.in_(CLASS_IDS))
+    }
+    computed = {
+        (row["class_id"], row["user_id"], row["prompt_id"]): tuple(row[field] for field in CLASS_ANALYTIC_FIELDS)
+        for row in select_class_analytics(Chat.class_id.in_(CLASS_IDS)).dicts()
+    }
+    assert stored == computed
+
+
+def test_class_analytics_follow_every_write_path():
+    today = datetime.date.today()
+
+    first = create_chat("student-a", 9001, 1)
+    second = create_chat("student-a", 9001, 1)
+    other = create_chat("student-b", 9001, 2)
+    moved = create_chat("student-b", 9002, 1)
+    create_chat("student-b", 9002, 1)
+    assert_analytics_match()
+
+    # shared copies are left out of the totals
+    Chats.insert_shared_chat_by_chat_id(first)
+    assert_analytics_match()
+
+    assert Chats.update_chat_session_times("student-a", ChatTimingForm(timings={first: 30, second: 12}))
+    assert Chats.update_chat_session_times("student-b", ChatTimingForm(timings={other: 5, moved: 7}))
+    assert_analytics_match()
+
+    Metrics._write_deltas({
+        ("student-a", first, "model", today): [10, 20, 1],
+        ("student-a", second, "model", today): [1, 2, 1],
+        ("student-b", other, "model", today): [3, 4, 1],
+    })
+    assert_analytics_match()
+
+    assert Chats.submit_chat_by_id("student-a", first)
+    assert Chats.submit_chat_by_id("student-a", first)
+    assert Chats.submit_chat_by_id("student-b", other)
+    assert_analytics_match()
+
+    # both return False for chats that were never shared
+    Chats.delete_chat_by_id(second)
+    Chats.delete_chat_by_id_and_user_id(other, "student-b")
+    assert Chat.select().where(Chat.id.in_([second, other])).count() == 0
+    assert_analytics_match()
+
+    assert Chats.remove_class_reference(9002)
+    assert_analytics_match()
+
+    assert Chats.delete_chats_by_user_id("student-a")
+    assert_analytics_match()
+    assert ClassAnalytic.select().where(ClassAnalytic.class_id.in_(CLASS_IDS)).count() == 0
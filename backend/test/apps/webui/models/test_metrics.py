@@ -0,0 +1,45 @@
+import datetime
+import threading
+
+from apps.webui.internal.db import DB
+from apps.webui.models.metrics import Metric, MetricRollup, Metrics
+
+
+def test_parallel_writers_lose_no_increments():
+    threads, writes, chats = 8, 60, 3
+    today = datetime.date.today()
+    results = []
+
+    def write():
+        try:
+            for n in range(writes):
+                # every writer hits the same metric and rollup rows
+                key = ("stress-user", f"stress-chat-{n % chats}", "stress-model", today)
+                results.append(Metrics.apply_metric_deltas({key: [1, 2, 1]}))
+        finally:
+            DB.close()
+
+    workers = [threading.Thread(target=write) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert results == [True] * threads * writes
+
+    metrics = Metric.select().where(Metric.user_id == "stress-user")
+    assert metrics.count() == chats
+    per_chat = threads * writes // chats
+    assert [(m.input_tokens, m.output_tokens, m.message_count) for m in metrics] == [
+        (per_chat, 2 * per_chat, per_chat)
+    ] * chats
+
+    for period in ("day", "week"):
+        rollup = MetricRollup.select().where(
+            (MetricRollup.period == period)
+            & (MetricRollup.group_by == "user")
+            & (MetricRollup.group_key == "stress-user")
+        )
+        assert [(r.input_tokens, r.output_tokens, r.message_count) for r in rollup] == [
+            (threads * writes, 2 * threads * writes, threads * writes)
+        ]
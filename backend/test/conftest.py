@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# config.py reads DATA_DIR and DATABASE_URL on import and apps.webui.internal.db
+# migrates that database, so point both at a scratch directory first
+DATA_DIR = tempfile.mkdtemp(prefix="open-webui-test-")
+os.environ["DATA_DIR"] = DATA_DIR
+os.environ["DATABASE_URL"] = f"sqlite:///{DATA_DIR}/webui.db"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
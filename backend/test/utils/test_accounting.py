@@ -0,0 +1,69 @@
+import asyncio
+import datetime
+
+from apps.webui.models.metrics import MetricForm
+from utils import accounting
+from utils.accounting import TokenAccountingQueue
+
+
+def record(queue: TokenAccountingQueue, chat_id: str):
+    queue.record(MetricForm(
+        user_id="user",
+        chat_id=chat_id,
+        selected_model_id="model",
+        input_tokens=1,
+        output_tokens=2,
+        message_count=1,
+    ))
+
+
+def key(chat_id: str) -> tuple:
+    return ("user", chat_id, "model", datetime.date.today())
+
+
+def test_failing_usage_is_dropped_after_max_retries(monkeypatch):
+    written = {}
+
+    def apply_metric_deltas(deltas):
+        if key("deleted") in deltas:
+            return False
+        for k, delta in deltas.items():
+            written[k] = [a + b for a, b in zip(written.get(k, [0, 0, 0]), delta)]
+        return True
+
+    monkeypatch.setattr(accounting.Metrics, "apply_metric_deltas", apply_metric_deltas)
+    queue = TokenAccountingQueue(flush_interval=1, flush_size=100, max_retries=3)
+
+    record(queue, "deleted")
+    record(queue, "chat")
+    asyncio.run(queue.flush())
+
+    # the failing key does not hold back the others
+    assert written == {key("chat"): [1, 2, 1]}
+    assert queue.deltas == {key("deleted"): [1, 2, 1]}
+
+    asyncio.run(queue.flush())
+    assert queue.failures == {key("deleted"): 2}
+
+    asyncio.run(queue.flush())
+    assert queue.deltas == {}
+    assert queue.failures == {}
+    assert written == {key("chat"): [1, 2, 1]}
+
+
+def test_usage_is_kept_while_writes_fail(monkeypatch):
+    results = [False, False, True]
+    monkeypatch.setattr(accounting.Metrics, "apply_metric_deltas", lambda deltas: results.pop(0))
+    queue = TokenAccountingQueue(flush_interval=1, flush_size=100, max_retries=3)
+
+    record(queue, "chat")
+    asyncio.run(queue.flush())
+    record(queue, "chat")
+    asyncio.run(queue.flush())
+
+    assert queue.deltas == {key("chat"): [2, 4, 2]}
+    assert queue.failures == {key("chat"): 2}
+
+    asyncio.run(queue.flush())
+    assert queue.deltas == {}
+    assert queue.failures == {}
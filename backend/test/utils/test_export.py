@@ -0,0 +1,39 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from utils.export import csv_response, ndjson_response
+
+
+def failing_batches():
+    yield [{"id": "1"}]
+    raise RuntimeError("database went away")
+
+
+app = FastAPI()
+
+
+@app.get("/ndjson")
+def get_ndjson():
+    return ndjson_response(([str(row)] for batch in failing_batches() for row in batch), "export")
+
+
+@app.get("/csv")
+def get_csv():
+    return csv_response(failing_batches(), ["id"], "export")
+
+
+@pytest.mark.parametrize("path", ["/ndjson", "/csv"])
+def test_failed_export_is_not_completed(path):
+    # the error reaches the server instead of the stream ending cleanly
+    with pytest.raises(Exception):
+        TestClient(app).get(path)
+
+
+def test_csv_export():
+    app = FastAPI()
+    app.get("/csv")(lambda: csv_response(iter([[{"id": 1, "tags": ["a"]}], [{"id": 2, "tags": []}]]), ["id", "tags"], "export"))
+
+    response = TestClient(app).get("/csv")
+    assert response.headers["content-disposition"] == 'attachment; filename="export.csv"'
+    assert response.text.splitlines() == ["id,tags", '1,"[""a""]"', "2,[]"]
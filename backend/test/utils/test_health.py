@@ -0,0 +1,77 @@
+from utils import health
+from utils.health import CircuitBreaker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def open_breaker(monkeypatch) -> tuple:
+    clock = Clock()
+    monkeypatch.setattr(health.time, "monotonic", clock)
+
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    breaker.record_failure("refused")
+    breaker.record_failure("refused")
+    assert breaker.state == CircuitBreaker.OPEN
+    return breaker, clock
+
+
+def test_half_open_admits_a_single_probe(monkeypatch):
+    breaker, clock = open_breaker(monkeypatch)
+    assert not breaker.allow_request()
+
+    clock.now += 30
+    assert breaker.is_available()
+    assert breaker.allow_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # the rest of the traffic waits for the probe
+    assert not breaker.is_available()
+    assert not breaker.allow_request()
+    assert not breaker.allow_request()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow_request()
+    assert breaker.allow_request()
+
+
+def test_failed_probe_reopens_the_circuit(monkeypatch):
+    breaker, clock = open_breaker(monkeypatch)
+
+    clock.now += 30
+    assert breaker.allow_request()
+    breaker.record_failure("refused")
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow_request()
+
+    clock.now += 30
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+
+def test_is_available_does_not_claim_the_probe(monkeypatch):
+    breaker, clock = open_breaker(monkeypatch)
+
+    clock.now += 30
+    assert breaker.is_available()
+    assert breaker.is_available()
+    assert breaker.allow_request()
+
+
+def test_abandoned_probe_is_given_up_after_reset_timeout(monkeypatch):
+    breaker, clock = open_breaker(monkeypatch)
+
+    clock.now += 30
+    assert breaker.allow_request()
+
+    clock.now += 29
+    assert not breaker.allow_request()
+    clock.now += 1
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
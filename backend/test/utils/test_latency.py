@@ -0,0 +1,31 @@
+from utils import latency
+from utils.latency import (
+    OLLAMA_TOKEN_MARKERS,
+    UNKNOWN_MODEL,
+    LatencyRegistry,
+    StreamTimer,
+)
+from utils.models import ModelIndex
+
+
+def test_models_outside_the_model_list_share_one_label(monkeypatch):
+    monkeypatch.setattr(
+        latency.AvailableModels, "index", ModelIndex([{"id": "llama3:latest"}])
+    )
+    registry = LatencyRegistry()
+    monkeypatch.setattr(latency, "UpstreamLatency", registry)
+
+    for model in ["llama3:latest", "llama3", "made-up-1", "made-up-2", None]:
+        timer = StreamTimer(None, model, OLLAMA_TOKEN_MARKERS)
+        timer.dispatched()
+        timer.connected("http://ollama:11434")
+
+    assert {model for (_, _, model) in registry.histograms} == {
+        "llama3:latest",
+        "llama3",
+        UNKNOWN_MODEL,
+    }
+    stats = {
+        (stat["metric"], stat["model"]): stat["count"] for stat in registry.get_stats()
+    }
+    assert stats[("connect_seconds", UNKNOWN_MODEL)] == 3
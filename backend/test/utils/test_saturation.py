@@ -0,0 +1,40 @@
+import re
+
+import pytest
+from prometheus_client import CollectorRegistry, Gauge
+
+from utils.saturation import SaturationCollector, get_upstream_host
+
+# Kubernetes label values
+LABEL_VALUE = re.compile(r"^(([A-Za-z0-9][-A-Za-z0-9_.]*)?[A-Za-z0-9])?$")
+
+
+@pytest.mark.parametrize("upstream, host", [
+    ("http://ollama-service.open-webui.svc.cluster.local:11434", "ollama-service.open-webui.svc.cluster.local_11434"),
+    ("https://api.openai.com/v1", "api.openai.com"),
+    ("http://10.0.0.5:11434", "10.0.0.5_11434"),
+    ("http://host:port", "host"),
+])
+def test_upstream_host(upstream, host):
+    assert get_upstream_host(upstream) == host
+
+
+def test_long_upstream_hosts_stay_valid_and_distinct():
+    first = get_upstream_host(f"http://{'a' * 70}.example.com:1")
+    second = get_upstream_host(f"http://{'a' * 70}.example.com:2")
+
+    assert first != second
+    for value in (first, second):
+        assert len(value) <= 63
+        assert LABEL_VALUE.match(value)
+
+
+def test_saturation_is_labelled_by_upstream_host():
+    registry = CollectorRegistry()
+    streams = Gauge("upstream_streams_open", "", ["upstream"], registry=registry)
+    streams.labels("http://ollama:11434").set(16)
+
+    saturation = next(SaturationCollector(registry).collect())
+    assert [(sample.labels, sample.value) for sample in saturation.samples] == [
+        ({"upstream": "http://ollama:11434", "upstream_host": "ollama_11434"}, 0.5)
+    ]
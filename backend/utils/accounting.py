@@ -0,0 +1,150 @@
+import asyncio
+import datetime
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from apps.webui.models.metrics import Metrics, MetricForm
+from config import (
+    SRC_LOG_LEVELS,
+    TOKEN_ACCOUNTING_FLUSH_INTERVAL,
+    TOKEN_ACCOUNTING_FLUSH_SIZE,
+    TOKEN_ACCOUNTING_MAX_RETRIES,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+class TokenAccountingQueue:
+    """
+    Write-behind sink for token usage.
+
+    Usage events are summed in memory per (user, chat, model, date) and written in
+    one transaction every TOKEN_ACCOUNTING_FLUSH_INTERVAL seconds or once
+    TOKEN_ACCOUNTING_FLUSH_SIZE events are pending, instead of two or three
+    synchronous writes per event on the event loop. Usage that cannot be written
+    is kept for the next flush, up to TOKEN_ACCOUNTING_MAX_RETRIES times.
+    """
+
+    def __init__(self, flush_interval: float, flush_size: int, max_retries: int):
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_retries = max_retries
+
+        # (user_id, chat_id, model_id, date) -> [input_tokens, output_tokens, message_count]
+        self.deltas: Dict[tuple, List[int]] = {}
+        self.pending = 0
+        # key -> number of flushes in a row that failed to write it
+        self.failures: Dict[tuple, int] = {}
+        self.lock = threading.Lock()
+
+        self.flush_event: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def record(self, form: MetricForm):
+        key = (
+            form.user_id,
+            form.chat_id,
+            form.selected_model_id,
+            datetime.date.today(),
+        )
+
+        with self.lock:
+            self._merge(key, [form.input_tokens, form.output_tokens, form.message_count])
+            self.pending += 1
+            pending = self.pending
+
+        if pending >= self.flush_size and self.flush_event is not None:
+            self.flush_event.set()
+
+    def _merge(self, key: tuple, delta: List[int]):
+        totals = self.deltas.get(key)
+        if totals is None:
+            self.deltas[key] = list(delta)
+        else:
+            for i, value in enumerate(delta):
+                totals[i] += value
+
+    def _apply(self, deltas: Dict[tuple, List[int]]) -> List[tuple]:
+        """Writes the deltas and returns the keys that could not be written."""
+        if Metrics.apply_metric_deltas(deltas):
+            return []
+        if len(deltas) == 1:
+            return list(deltas)
+
+        # the transaction was rolled back; write the keys one by one so a key that
+        # always fails does not hold back the others
+        return [
+            key
+            for key, delta in deltas.items()
+            if not Metrics.apply_metric_deltas({key: delta})
+        ]
+
+    async def flush(self):
+        with self.lock:
+            deltas, self.deltas = self.deltas, {}
+            self.pending = 0
+
+        if len(deltas) == 0:
+            return
+
+        failed = set(await run_in_threadpool(self._apply, deltas))
+
+        with self.lock:
+            for key, delta in deltas.items():
+                if key not in failed:
+                    self.failures.pop(key, None)
+                    continue
+
+                attempts = self.failures.get(key, 0) + 1
+                if attempts < self.max_retries:
+                    # keep the deltas for the next flush
+                    self.failures[key] = attempts
+                    self._merge(key, delta)
+                else:
+                    self.failures.pop(key, None)
+                    log.error(
+                        f"Dropping token usage {delta} of {key} after {attempts} failed writes"
+                    )
+
+    async def _run_forever(self):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self.flush_event.wait(), timeout=self.flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+
+            self.flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                log.exception(f"Error flushing token accounting: {e}")
+
+    def start(self):
+        if self.task is None:
+            self.flush_event = asyncio.Event()
+            self.task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+        # write whatever is still pending before the process exits
+        await self.flush()
+
+
+TokenAccounting = TokenAccountingQueue(
+    TOKEN_ACCOUNTING_FLUSH_INTERVAL,
+    TOKEN_ACCOUNTING_FLUSH_SIZE,
+    TOKEN_ACCOUNTING_MAX_RETRIES,
+)
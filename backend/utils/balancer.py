@@ -0,0 +1,142 @@
+import random
+import threading
+import time
+from typing import Dict, List, Optional
+
+
+LOAD_BALANCER_POLICIES = ["least_connections", "weighted_round_robin", "ewma_latency"]
+
+
+class UpstreamStats:
+    def __init__(self):
+        self.in_flight = 0
+        self.total_requests = 0
+        self.failed_requests = 0
+        self.ewma_latency: Optional[float] = None
+        self.current_weight = 0  # smooth weighted round-robin state
+
+
+class LoadBalancer:
+    """
+    Picks one of several upstream urls serving the same model.
+
+    Requests sent to an upstream are tracked with `acquire`/`release` (see
+    BalancedRequest), which feed the in-flight counts and the decayed average
+    of response latency used by the policies.
+    """
+
+    def __init__(self, policy: str = "least_connections", decay: float = 0.3):
+        self.set_policy(policy)
+        self.decay = decay
+        self.stats: Dict[str, UpstreamStats] = {}
+        self.lock = threading.Lock()
+
+    def set_policy(self, policy: str):
+        if policy not in LOAD_BALANCER_POLICIES:
+            raise ValueError(f"Unknown load balancer policy: {policy}")
+        self.policy = policy
+
+    def _get_stats(self, url: str) -> UpstreamStats:
+        if url not in self.stats:
+            self.stats[url] = UpstreamStats()
+        return self.stats[url]
+
+    def select(self, urls: List[str], weights: Optional[List[int]] = None) -> int:
+        """Returns the index in `urls` of the upstream to use."""
+        if len(urls) == 1:
+            return 0
+
+        if weights is None:
+            weights = [1] * len(urls)
+
+        with self.lock:
+            stats = [self._get_stats(url) for url in urls]
+
+            if self.policy == "weighted_round_robin":
+                # nginx-style smooth weighted round-robin
+                total = sum(weights)
+                for stat, weight in zip(stats, weights):
+                    stat.current_weight += weight
+                idx = max(range(len(urls)), key=lambda i: stats[i].current_weight)
+                stats[idx].current_weight -= total
+            elif self.policy == "ewma_latency":
+                # unmeasured upstreams score 0 so they get probed first
+                scores = [
+                    (stat.ewma_latency or 0.0) * (stat.in_flight + 1) / max(weight, 1)
+                    for stat, weight in zip(stats, weights)
+                ]
+                idx = self._pick_min(scores)
+            else:
+                scores = [
+                    stat.in_flight / max(weight, 1)
+                    for stat, weight in zip(stats, weights)
+                ]
+                idx = self._pick_min(scores)
+
+        return idx
+
+    def _pick_min(self, scores: List[float]) -> int:
+        # break ties randomly so idle upstreams share the load
+        lowest = min(scores)
+        return random.choice([i for i, score in enumerate(scores) if score == lowest])
+
+    def acquire(self, url: str):
+        with self.lock:
+            stat = self._get_stats(url)
+            stat.in_flight += 1
+            stat.total_requests += 1
+
+    def release(
+        self, url: str, latency: Optional[float] = None, failed: bool = False
+    ):
+        with self.lock:
+            stat = self._get_stats(url)
+            stat.in_flight = max(stat.in_flight - 1, 0)
+
+            if failed:
+                stat.failed_requests += 1
+
+            if latency is not None:
+                if stat.ewma_latency is None:
+                    stat.ewma_latency = latency
+                else:
+                    stat.ewma_latency = (
+                        self.decay * latency + (1 - self.decay) * stat.ewma_latency
+                    )
+
+    def get_stats(self, urls: List[str]) -> List[dict]:
+        with self.lock:
+            return [
+                {
+                    "url": url,
+                    "in_flight": self._get_stats(url).in_flight,
+                    "total_requests": self._get_stats(url).total_requests,
+                    "failed_requests": self._get_stats(url).failed_requests,
+                    "ewma_latency": self._get_stats(url).ewma_latency,
+                }
+                for url in urls
+            ]
+
+
+class BalancedRequest:
+    """Marks one request to `url` as in-flight until `done` is called (at most once)."""
+
+    def __init__(self, balancer: LoadBalancer, url: str):
+        self.balancer = balancer
+        self.url = url
+        self.start_time = time.monotonic()
+        self.latency: Optional[float] = None
+        self.released = False
+
+        self.balancer.acquire(url)
+
+    def mark_response(self):
+        # latency is measured to the upstream's first response, not the end of the stream
+        if self.latency is None:
+            self.latency = time.monotonic() - self.start_time
+
+    def done(self, failed: bool = False):
+        if self.released:
+            return
+        self.released = True
+        self.balancer.release(self.url, latency=self.latency, failed=failed)
@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+from typing import Iterable, List, Literal
+
+from fastapi.responses import StreamingResponse
+
+# "json" is the endpoint's regular response, the others stream. Errors raised by
+# the batches are not caught: they abort the response, so an export that fails
+# half way is never received as a complete file.
+ExportFormat = Literal["json", "ndjson", "csv"]
+
+
+def get_attachment_headers(filename: str) -> dict:
+    return {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Access-Control-Expose-Headers": "Content-Disposition",
+    }
+
+
+def csv_value(value):
+    # nested values, e.g. user settings, are written as JSON
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def ndjson_response(lines: Iterable[List[str]], filename: str) -> StreamingResponse:
+    """Streams batches of JSON documents, one per line, as `filename`.ndjson."""
+
+    def generate():
+        for batch in lines:
+            yield "".join(f"{line}\n" for line in batch)
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers=get_attachment_headers(f"{filename}.ndjson"),
+    )
+
+
+def csv_response(rows: Iterable[List[dict]], fields: List[str], filename: str) -> StreamingResponse:
+    """Streams batches of rows as `filename`.csv with a header of `fields`."""
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+
+        def flush() -> str:
+            text = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return text
+
+        writer.writeheader()
+        yield flush()
+        for batch in rows:
+            writer.writerows({key: csv_value(value) for key, value in row.items()} for row in batch)
+            yield flush()
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/csv",
+        headers=get_attachment_headers(f"{filename}.csv"),
+    )
+
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import aiohttp
+
+from config import (
+    SRC_LOG_LEVELS,
+    UPSTREAM_CONNECT_TIMEOUT,
+    UPSTREAM_FIRST_BYTE_TIMEOUT,
+    UPSTREAM_READ_TIMEOUT,
+    UPSTREAM_TIMEOUT_OVERRIDES,
+    UPSTREAM_HEALTH_CHECK_INTERVAL,
+    UPSTREAM_HEALTH_CHECK_TIMEOUT,
+    UPSTREAM_CIRCUIT_BREAKER_THRESHOLD,
+    UPSTREAM_CIRCUIT_BREAKER_RESET_TIMEOUT,
+)
+from utils.http_client import get_origin, get_session
+from utils.latency import StreamTimer
+from utils.saturation import UpstreamLoad
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+# statuses worth retrying on another backend serving the same model
+FAILOVER_STATUSES = [502, 503, 504]
+
+
+class UpstreamUnavailableError(Exception):
+    def __init__(self, upstream: str, reason: str = ""):
+        super().__init__(f"Upstream {upstream} unavailable: {reason}")
+        self.upstream = upstream
+
+
+####################
+# Circuit breaker
+####################
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.in_probe = False
+        self.probe_started_at: Optional[float] = None
+
+    def _probe_pending(self) -> bool:
+        # a probe that never reported back (e.g. its request was cancelled) is
+        # given up after reset_timeout so the breaker cannot stay stuck
+        return (
+            self.in_probe
+            and time.monotonic() - self.probe_started_at < self.reset_timeout
+        )
+
+    def is_available(self) -> bool:
+        """Whether allow_request would admit a request, without claiming the probe."""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        if self.state == self.HALF_OPEN:
+            return not self._probe_pending()
+        return True
+
+    def allow_request(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+
+        if self.state == self.HALF_OPEN:
+            # a single request probes the upstream, the rest are rejected
+            # until it succeeds or fails
+            if self._probe_pending():
+                return False
+            self.in_probe = True
+            self.probe_started_at = time.monotonic()
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.in_probe = False
+
+    def record_failure(self, error: str = ""):
+        self.failures += 1
+        self.last_error = error
+        self.in_probe = False
+
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class UpstreamHealthRegistry:
+    def __init__(self):
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.checks: Dict[str, Callable[[], Awaitable]] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def get_breaker(self, upstream: str) -> CircuitBreaker:
+        if upstream not in self.breakers:
+            self.breakers[upstream] = CircuitBreaker(
+                UPSTREAM_CIRCUIT_BREAKER_THRESHOLD,
+                UPSTREAM_CIRCUIT_BREAKER_RESET_TIMEOUT,
+            )
+        return self.breakers[upstream]
+
+    def is_available(self, upstream: str) -> bool:
+        return self.get_breaker(upstream).is_available()
+
+    def allow_request(self, upstream: str) -> bool:
+        return self.get_breaker(upstream).allow_request()
+
+    def record_success(self, upstream: str):
+        self.get_breaker(upstream).record_success()
+
+    def record_failure(self, upstream: str, error: str = ""):
+        breaker = self.get_breaker(upstream)
+        was_open = breaker.state == CircuitBreaker.OPEN
+        breaker.record_failure(error)
+
+        if not was_open and breaker.state == CircuitBreaker.OPEN:
+            log.warning(f"Upstream {upstream} ejected: {error}")
+
+    def get_status(self) -> List[dict]:
+        return [
+            {
+                "url": upstream,
+                "state": breaker.state,
+                "failures": breaker.failures,
+                "last_error": breaker.last_error,
+            }
+            for upstream, breaker in self.breakers.items()
+        ]
+
+    ####################
+    # Background health checks
+    ####################
+
+    def register_check(self, name: str, check: Callable[[], Awaitable]):
+        self.checks[name] = check
+
+    async def run_checks(self):
+        results = await asyncio.gather(
+            *[check() for check in self.checks.values()], return_exceptions=True
+        )
+        for name, result in zip(self.checks.keys(), results):
+            if isinstance(result, Exception):
+                log.error(f"Health check '{name}' failed: {result}")
+
+    async def _run_forever(self):
+        while True:
+            await self.run_checks()
+            await asyncio.sleep(UPSTREAM_HEALTH_CHECK_INTERVAL)
+
+    def start(self):
+        if self.task is None and UPSTREAM_HEALTH_CHECK_INTERVAL > 0:
+            self.task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+UpstreamHealth = UpstreamHealthRegistry()
+
+
+async def probe_upstream(upstream: str, url: str, headers: Optional[dict] = None):
+    # any response below 500 means the upstream is up, even if it rejects the probe
+    timeout = aiohttp.ClientTimeout(total=UPSTREAM_HEALTH_CHECK_TIMEOUT)
+    try:
+        session = get_session(url)
+        async with session.get(url, headers=headers, timeout=timeout) as response:
+            if response.status < 500:
+                UpstreamHealth.record_success(upstream)
+            else:
+                UpstreamHealth.record_failure(upstream, f"HTTP {response.status}")
+    except Exception as e:
+        UpstreamHealth.record_failure(upstream, str(e) or e.__class__.__name__)
+
+
+####################
+# Timeout budgets
+####################
+
+
+def get_timeout_budget(upstream: str) -> dict:
+    budget = {
+        "connect": UPSTREAM_CONNECT_TIMEOUT,
+        "first_byte": UPSTREAM_FIRST_BYTE_TIMEOUT,
+        "read": UPSTREAM_READ_TIMEOUT,
+    }
+    overrides = UPSTREAM_TIMEOUT_OVERRIDES.get(
+        upstream, UPSTREAM_TIMEOUT_OVERRIDES.get(get_origin(upstream), {})
+    )
+    return {**budget, **overrides}
+
+
+async def request_upstream(
+    method: str,
+    url: str,
+    upstream: str,
+    timer: Optional[StreamTimer] = None,
+    **kwargs,
+) -> aiohttp.ClientResponse:
+    """
+    Sends a request to `url` (an endpoint of `upstream`) within the upstream's
+    timeout budget and records the outcome on its circuit breaker, and the
+    connect time on `timer` if given.
+
+    Raises UpstreamUnavailableError when the breaker is open or the upstream
+    cannot be reached in time, so callers can fail over to another backend.
+    """
+    if not UpstreamHealth.allow_request(upstream):
+        raise UpstreamUnavailableError(upstream, "circuit open")
+
+    budget = get_timeout_budget(upstream)
+    timeout = aiohttp.ClientTimeout(
+        total=None, sock_connect=budget["connect"], sock_read=budget["read"]
+    )
+
+    if timer is not None:
+        timer.dispatched()
+
+    status = None
+    UpstreamLoad.request_started(upstream)
+    try:
+        session = get_session(url)
+        response = await asyncio.wait_for(
+            session.request(method, url, timeout=timeout, **kwargs),
+            timeout=budget["first_byte"],
+        )
+        status = response.status
+    except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+        UpstreamHealth.record_failure(upstream, str(e) or e.__class__.__name__)
+        raise UpstreamUnavailableError(upstream, str(e)) from e
+    finally:
+        UpstreamLoad.request_finished(upstream, status)
+
+    if response.status in FAILOVER_STATUSES:
+        UpstreamHealth.record_failure(upstream, f"HTTP {response.status}")
+    else:
+        UpstreamHealth.record_success(upstream)
+
+    if timer is not None:
+        timer.connected(upstream)
+
+    return response
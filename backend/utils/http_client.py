@@ -0,0 +1,106 @@
+import asyncio
+import logging
+from typing import Dict
+from urllib.parse import urlparse
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    SRC_LOG_LEVELS,
+    AIOHTTP_CLIENT_LIMIT,
+    AIOHTTP_CLIENT_LIMIT_PER_HOST,
+    AIOHTTP_CLIENT_KEEPALIVE_TIMEOUT,
+    AIOHTTP_CLIENT_DNS_CACHE_TTL,
+)
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MAIN"])
+
+
+####################
+# Shared upstream HTTP clients
+####################
+
+
+def get_origin(url: str) -> str:
+    # sessions are pooled per scheme://host:port so every path on the same upstream
+    # (e.g. /v1/models and /v1/chat/completions) reuses the same keep-alive connections
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+class UpstreamClientPool:
+    def __init__(self):
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._sync_sessions: Dict[str, requests.Session] = {}
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=AIOHTTP_CLIENT_LIMIT,
+            limit_per_host=AIOHTTP_CLIENT_LIMIT_PER_HOST,
+            keepalive_timeout=AIOHTTP_CLIENT_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=AIOHTTP_CLIENT_DNS_CACHE_TTL,
+            use_dns_cache=True,
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    def get_session(self, url: str) -> aiohttp.ClientSession:
+        origin = get_origin(url)
+        session = self._sessions.get(origin)
+
+        if session is None or session.closed:
+            log.debug(f"creating pooled session for {origin}")
+            session = self._create_session()
+            self._sessions[origin] = session
+
+        return session
+
+    def get_sync_session(self, url: str) -> requests.Session:
+        # for the few callers that still run in a worker thread (e.g. embedding functions)
+        origin = get_origin(url)
+        session = self._sync_sessions.get(origin)
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=AIOHTTP_CLIENT_LIMIT_PER_HOST
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._sync_sessions[origin] = session
+
+        return session
+
+    async def close(self):
+        sessions = list(self._sessions.values())
+        self._sessions = {}
+        await asyncio.gather(
+            *[session.close() for session in sessions if not session.closed]
+        )
+
+        for session in self._sync_sessions.values():
+            session.close()
+        self._sync_sessions = {}
+
+
+UpstreamClients = UpstreamClientPool()
+
+
+def get_session(url: str) -> aiohttp.ClientSession:
+    return UpstreamClients.get_session(url)
+
+
+def get_sync_session(url: str) -> requests.Session:
+    return UpstreamClients.get_sync_session(url)
+
+
+async def close_sessions():
+    await UpstreamClients.close()
+
+
+async def release_response(response: aiohttp.ClientResponse):
+    # pooled sessions outlive the request, so only the response is released
+    if response:
+        response.release()
@@ -0,0 +1,180 @@
+import bisect
+import time
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_client import Histogram as PrometheusHistogram
+from starlette.requests import Request
+
+from utils.models import AvailableModels
+from utils.telemetry import UPSTREAM_STREAMS_OPEN
+
+# upper bounds of the histogram buckets, the last bucket is +Inf
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# byte patterns of stream lines that carry generated text
+OPENAI_TOKEN_MARKERS = (b'"delta"',)
+CLAUDE_TOKEN_MARKERS = (b'"content_block_delta"',)
+OLLAMA_TOKEN_MARKERS = (b'"done":false', b'"delta"')
+
+# label of models that are not in the model list
+UNKNOWN_MODEL = "unknown"
+
+LATENCY_METRICS = {
+    # request received -> first upstream request sent (middlewares, filters, RAG)
+    "queue_seconds": LATENCY_BUCKETS,
+    # upstream request sent -> response headers received
+    "connect_seconds": LATENCY_BUCKETS,
+    # request received -> first generated token
+    "ttft_seconds": LATENCY_BUCKETS,
+    "inter_token_seconds": LATENCY_BUCKETS,
+    # output tokens over the time between the first and last token
+    "tokens_per_second": THROUGHPUT_BUCKETS,
+}
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        # cumulative counts per upper bound, like Prometheus buckets
+        buckets = {}
+        total = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            buckets[str(bound)] = total
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+
+# the same histograms for GET /metrics, merged across workers
+PROMETHEUS_HISTOGRAMS = {
+    metric: PrometheusHistogram(
+        f"upstream_{metric}", f"Upstream {metric.replace('_', ' ')}", ["upstream", "model"],
+        buckets=buckets,
+    )
+    for metric, buckets in LATENCY_METRICS.items()
+}
+
+
+class LatencyRegistry:
+    def __init__(self):
+        # (metric, upstream, model) -> this worker's histogram and its Prometheus child
+        self.histograms: Dict[Tuple[str, str, str], tuple] = {}
+
+    def observe(self, metric: str, upstream: str, model: str, value: float):
+        key = (metric, upstream, model)
+        histograms = self.histograms.get(key)
+        if histograms is None:
+            histograms = self.histograms[key] = (
+                Histogram(LATENCY_METRICS[metric]),
+                PROMETHEUS_HISTOGRAMS[metric].labels(upstream, model),
+            )
+        for histogram in histograms:
+            histogram.observe(value)
+
+    def get_stats(self) -> List[dict]:
+        return [
+            {"metric": metric, "url": upstream, "model": model, **histogram.to_dict()}
+            for (metric, upstream, model), (histogram, _) in self.histograms.items()
+        ]
+
+
+UpstreamLatency = LatencyRegistry()
+
+
+def get_model_label(model: Optional[str]) -> str:
+    # the model comes from the request, labelling arbitrary names would let any
+    # caller add histograms (and Prometheus label sets) without bound
+    if model and AvailableModels.index.find(model):
+        return model
+    return UNKNOWN_MODEL
+
+
+class StreamTimer:
+    """
+    Timings of one proxied completion, recorded under the upstream that served it
+    and the model, or UNKNOWN_MODEL if it is not in the model list. Queue time and TTFT start when the request reached the app
+    (`request.state.received_at`, set by CheckUrlMiddleware in main.py).
+    """
+
+    def __init__(
+        self, request: Optional[Request], model: str, markers: Tuple[bytes, ...]
+    ):
+        self.model = get_model_label(model)
+        self.markers = markers
+        self.upstream = ""
+
+        received_at = getattr(request.state, "received_at", None) if request else None
+        self.received_at = received_at if received_at is not None else time.perf_counter()
+        self.queue_time: Optional[float] = None
+        self.queue_observed = False
+        self.dispatched_at: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.chunks = 0
+        self.stream_open = False
+
+    def observe(self, metric: str, value: float):
+        UpstreamLatency.observe(metric, self.upstream, self.model, value)
+
+    def dispatched(self):
+        # called per attempt; queue time only counts up to the first one
+        now = time.perf_counter()
+        if self.queue_time is None:
+            self.queue_time = now - self.received_at
+        self.dispatched_at = now
+
+    def connected(self, upstream: str):
+        self.upstream = upstream
+        if self.dispatched_at is None:
+            return
+
+        # a failed-over attempt also gets here; queue time is recorded once
+        if not self.queue_observed:
+            self.observe("queue_seconds", self.queue_time)
+            self.queue_observed = True
+        self.observe("connect_seconds", time.perf_counter() - self.dispatched_at)
+
+    def open_stream(self):
+        # called when relaying the response body starts, finish() closes it
+        UPSTREAM_STREAMS_OPEN.labels(self.upstream).inc()
+        self.stream_open = True
+
+    def chunk(self, line: bytes):
+        for marker in self.markers:
+            if marker in line:
+                break
+        else:
+            return
+
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+            self.observe("ttft_seconds", now - self.received_at)
+        else:
+            self.observe("inter_token_seconds", now - self.last_token_at)
+        self.last_token_at = now
+        self.chunks += 1
+
+    def finish(self, output_tokens: Optional[int] = None):
+        if self.stream_open:
+            UPSTREAM_STREAMS_OPEN.labels(self.upstream).dec()
+            self.stream_open = False
+
+        # streams usually report the real token count at the end, chunks are the fallback
+        tokens = output_tokens if output_tokens else self.chunks
+        if self.first_token_at is not None and self.last_token_at > self.first_token_at:
+            self.observe(
+                "tokens_per_second", tokens / (self.last_token_at - self.first_token_at)
+            )
@@ -1,5 +1,15 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
 from apps.webui.models.models import Models, ModelModel, ModelForm, ModelResponse
 
+from config import SRC_LOG_LEVELS, MODELS_CACHE_TTL
+
+log = logging.getLogger(__name__)
+log.setLevel(SRC_LOG_LEVELS["MODELS"])
+
 
 def get_model_id_from_custom_model_id(id: str):
     model = Models.get_model_by_id(id)
@@ -8,3 +18,134 @@ def get_model_id_from_custom_model_id(id: str):
         return model.id
     else:
         return id
+
+
+def get_base_model_id(id: str) -> str:
+    # "llama3:8b" -> "llama3"
+    return id.split(":")[0]
+
+
+####################
+# Model registry
+####################
+
+
+def is_filter_pipeline(model: dict) -> bool:
+    return "pipeline" in model and model["pipeline"].get("type", None) == "filter"
+
+
+class ModelIndex:
+    def __init__(self, models: Optional[List[dict]] = None):
+        self.by_id: Dict[str, dict] = {}
+        self.by_base_id: Dict[str, List[dict]] = {}
+
+        # filter chains sorted by priority, resolved once per refresh instead of per chat request
+        self.filters_by_model_id: Dict[str, List[dict]] = {}
+        self.wildcard_filters: List[dict] = []
+
+        if models is not None:
+            self.update(models)
+
+    def update(self, models: List[dict]):
+        # updated in place so references to by_id (e.g. app.state.MODELS) stay current
+        by_base_id = {}
+        for model in models:
+            by_base_id.setdefault(get_base_model_id(model["id"]), []).append(model)
+
+        self.by_id.clear()
+        self.by_id.update({model["id"]: model for model in models})
+        self.by_base_id.clear()
+        self.by_base_id.update(by_base_id)
+
+        filters = sorted(
+            [model for model in models if is_filter_pipeline(model)],
+            key=lambda x: x["pipeline"]["priority"],
+        )
+        self.wildcard_filters = [
+            filter for filter in filters if filter["pipeline"]["pipelines"] == ["*"]
+        ]
+        self.filters_by_model_id = {
+            model["id"]: [
+                filter
+                for filter in filters
+                if filter["pipeline"]["pipelines"] == ["*"]
+                or model["id"] in filter["pipeline"]["pipelines"]
+            ]
+            for model in models
+        }
+
+    def get(self, id: str) -> Optional[dict]:
+        return self.by_id.get(id)
+
+    def find(self, id: str) -> List[dict]:
+        # models matching `id` exactly, or by base id so "llama3" finds "llama3:latest"
+        if ":" in id:
+            model = self.by_id.get(id)
+            return [model] if model is not None else []
+        return self.by_base_id.get(id, [])
+
+    def get_filters(self, model_id: str) -> List[dict]:
+        return self.filters_by_model_id.get(model_id, self.wildcard_filters)
+
+
+class ModelRegistry:
+    """
+    Caches the merged model list (upstream + custom models) for `ttl` seconds.
+
+    Once the list expires it is still served while a background refresh runs,
+    and concurrent callers share a single in-flight load instead of each
+    fanning out to every upstream.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.loader: Optional[Callable[[], Awaitable[List[dict]]]] = None
+
+        self.models: Optional[List[dict]] = None
+        self.index = ModelIndex()
+        self.expires_at = 0.0
+        self.version = 0
+        self.refresh_task: Optional[asyncio.Task] = None
+
+    def register_loader(self, loader: Callable[[], Awaitable[List[dict]]]):
+        self.loader = loader
+
+    def set_models(self, models: List[dict]):
+        self.index.update(models)
+        self.models = models
+        self.expires_at = time.monotonic() + self.ttl
+
+    async def _load(self, version: int) -> List[dict]:
+        try:
+            models = await self.loader()
+        except Exception as e:
+            log.exception(f"Error loading models: {e}")
+            return self.models if self.models is not None else []
+
+        # drop results started before an invalidate, they may use the old config
+        if version == self.version:
+            self.set_models(models)
+        return models
+
+    def refresh(self) -> asyncio.Task:
+        if self.refresh_task is None or self.refresh_task.done():
+            self.refresh_task = asyncio.create_task(self._load(self.version))
+        return self.refresh_task
+
+    def invalidate(self):
+        # the next get_models waits for a fresh load; lookups keep the old index meanwhile
+        self.version += 1
+        self.models = None
+        self.refresh_task = None
+
+    async def get_models(self, force: bool = False) -> List[dict]:
+        if self.models is None or force:
+            return await asyncio.shield(self.refresh())
+
+        if time.monotonic() >= self.expires_at:
+            self.refresh()
+
+        return self.models
+
+
+AvailableModels = ModelRegistry(MODELS_CACHE_TTL)
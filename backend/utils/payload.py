@@ -0,0 +1,66 @@
+from typing import Tuple, Type, TypeVar
+
+import orjson
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from starlette.types import Message, Receive, Scope
+
+FormT = TypeVar("FormT", bound=BaseModel)
+
+
+def is_chat_completion_request(request: Request) -> bool:
+    return request.method == "POST" and (
+        "/ollama/api/chat" in request.url.path
+        or "/chat/completions" in request.url.path
+    )
+
+
+async def get_json_body(request: Request) -> dict:
+    """
+    Returns the request's JSON body, parsed on first access.
+
+    The parsed dict lives on `request.state`, which the middlewares and the mounted
+    sub-apps share, so later stages edit it in place instead of re-parsing the body
+    and rewriting content-length. Routes serialize it once before the upstream call.
+    """
+    if not hasattr(request.state, "json_body"):
+        body = await request.body()
+        request.state.json_body = orjson.loads(body) if body else {}
+    return request.state.json_body
+
+
+async def read_json_body(scope: Scope, receive: Receive) -> Tuple[dict, Receive]:
+    """
+    get_json_body for ASGI middleware: also returns the `receive` to hand downstream,
+    which replays the raw body if this call was the one that consumed it.
+    """
+    request = Request(scope, receive)
+    if hasattr(request.state, "json_body"):
+        return request.state.json_body, receive
+
+    data = await get_json_body(request)
+    body = await request.body()
+    body_sent = False
+
+    async def replay_receive() -> Message:
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # afterwards only disconnects are left to receive
+        return await receive()
+
+    return data, replay_receive
+
+
+async def get_json_form(request: Request, form: Type[FormT]) -> FormT:
+    # validate the shared body like a FastAPI body parameter would, 422 included
+    try:
+        return form.model_validate(await get_json_body(request))
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+
+def dump_json(data) -> bytes:
+    return orjson.dumps(data)
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import re
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from prometheus_client import Counter, Gauge
+from prometheus_client.core import GaugeMetricFamily
+
+from config import UPSTREAM_STREAM_CAPACITY, UPSTREAM_THROTTLE_WINDOW
+
+UPSTREAM_REQUESTS_PENDING = Gauge(
+    "upstream_requests_pending",
+    "Requests sent to an upstream that are still waiting for its response headers",
+    ["upstream"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_RESPONSES = Counter(
+    "upstream_responses_total", "Upstream responses by status", ["upstream", "status"]
+)
+# windowed counts as gauges, so the merged view across workers stays a plain sum
+UPSTREAM_RECENT_RESPONSES = Gauge(
+    "upstream_recent_responses",
+    "Upstream responses in the last UPSTREAM_THROTTLE_WINDOW seconds",
+    ["upstream"],
+    multiprocess_mode="livesum",
+)
+UPSTREAM_RECENT_THROTTLED = Gauge(
+    "upstream_recent_throttled",
+    "Upstream 429 responses in the last UPSTREAM_THROTTLE_WINDOW seconds",
+    ["upstream"],
+    multiprocess_mode="livesum",
+)
+
+
+class UpstreamLoadTracker:
+    def __init__(self, window: float):
+        self.window = window
+        # upstream -> (monotonic time, was 429) of its recent responses
+        self.responses: Dict[str, Deque[Tuple[float, bool]]] = {}
+        self.throttled: Dict[str, int] = defaultdict(int)
+        self.task: Optional[asyncio.Task] = None
+
+    def request_started(self, upstream: str):
+        UPSTREAM_REQUESTS_PENDING.labels(upstream).inc()
+
+    def request_finished(self, upstream: str, status: Optional[int]):
+        # status is None when the upstream could not be reached
+        UPSTREAM_REQUESTS_PENDING.labels(upstream).dec()
+        if status is None:
+            return
+
+        UPSTREAM_RESPONSES.labels(upstream, str(status)).inc()
+        self.responses.setdefault(upstream, deque()).append(
+            (time.monotonic(), status == 429)
+        )
+        if status == 429:
+            self.throttled[upstream] += 1
+        self._update(upstream)
+
+    def _update(self, upstream: str):
+        responses = self.responses[upstream]
+        cutoff = time.monotonic() - self.window
+        while responses and responses[0][0] < cutoff:
+            _, throttled = responses.popleft()
+            if throttled:
+                self.throttled[upstream] -= 1
+
+        UPSTREAM_RECENT_RESPONSES.labels(upstream).set(len(responses))
+        UPSTREAM_RECENT_THROTTLED.labels(upstream).set(self.throttled[upstream])
+
+    async def _run_forever(self):
+        # expire old responses even when an upstream gets no new traffic
+        while True:
+            await asyncio.sleep(1)
+            for upstream in list(self.responses.keys()):
+                self._update(upstream)
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+UpstreamLoad = UpstreamLoadTracker(UPSTREAM_THROTTLE_WINDOW)
+
+
+def get_upstream_host(upstream: str) -> str:
+    """
+    The host and port of `upstream` as a valid Kubernetes label value, for
+    autoscaler metric selectors, e.g. "http://ollama:11434" -> "ollama_11434".
+    """
+    url = urlparse(upstream)
+    try:
+        port = url.port
+    except ValueError:
+        port = None
+
+    host = url.hostname or upstream
+    value = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{host}_{port}" if port else host)
+    value = value.strip("_.-")
+    if len(value) > 63:
+        # label values are at most 63 characters, the hash keeps long hosts apart
+        digest = hashlib.sha1(upstream.encode()).hexdigest()[:8]
+        value = f"{value[:54].rstrip('_.-')}-{digest}"
+    return value
+
+
+class SaturationCollector:
+    """
+    Derives upstream_saturation from the samples of `registry`, after they have been
+    merged across workers: the higher of
+
+    - (open streams + pending requests) / UPSTREAM_STREAM_CAPACITY, and
+    - the share of 429s among the upstream's recent responses.
+
+    1.0 means the upstream is at capacity. Besides the base URL in `upstream`, the
+    samples carry an `upstream_host` label that Kubernetes selectors accept.
+    upstream_saturation_max is the highest value over all upstreams.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def collect(self):
+        load = defaultdict(float)
+        recent = defaultdict(float)
+        throttled = defaultdict(float)
+
+        for family in self.registry.collect():
+            if family.name in ("upstream_streams_open", "upstream_requests_pending"):
+                totals = load
+            elif family.name == "upstream_recent_responses":
+                totals = recent
+            elif family.name == "upstream_recent_throttled":
+                totals = throttled
+            else:
+                continue
+
+            for sample in family.samples:
+                totals[sample.labels["upstream"]] += sample.value
+
+        saturation = GaugeMetricFamily(
+            "upstream_saturation",
+            "Upstream load relative to its capacity, 1.0 when saturated",
+            labels=["upstream", "upstream_host"],
+        )
+        highest = 0.0
+        for upstream in set(load.keys()) | set(recent.keys()):
+            value = load[upstream] / UPSTREAM_STREAM_CAPACITY
+            if recent[upstream] > 0:
+                value = max(value, throttled[upstream] / recent[upstream])
+
+            saturation.add_metric([upstream, get_upstream_host(upstream)], value)
+            highest = max(highest, value)
+
+        yield saturation
+        yield GaugeMetricFamily(
+            "upstream_saturation_max",
+            "Highest upstream_saturation, the autoscaling signal",
+            value=highest,
+        )
@@ -0,0 +1,175 @@
+import asyncio
+import contextvars
+import os
+import time
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import EVENT_LOOP_LAG_INTERVAL
+from utils.saturation import SaturationCollector
+
+# With several uvicorn workers, prometheus_client keeps every metric in mmapped
+# files under PROMETHEUS_MULTIPROC_DIR and GET /metrics merges all workers' files.
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+# millisecond resolution at the low end, up to long-running streams
+REQUEST_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ["method", "route", "status"]
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request until its response is fully sent",
+    ["method", "route"],
+    buckets=REQUEST_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests being handled", multiprocess_mode="livesum"
+)
+UPSTREAM_STREAMS_OPEN = Gauge(
+    "upstream_streams_open",
+    "Upstream completion streams being relayed to clients",
+    ["upstream"],
+    multiprocess_mode="livesum",
+)
+DB_QUERIES = Counter("db_queries_total", "Database queries executed", ["route"])
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Time spent executing a database query",
+    ["route"],
+    buckets=REQUEST_BUCKETS,
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop woke up a sleeping task",
+    buckets=REQUEST_BUCKETS,
+)
+
+# scope of the request being handled, copied into the threadpool with the context
+CURRENT_SCOPE: contextvars.ContextVar[Optional[Scope]] = contextvars.ContextVar(
+    "current_scope", default=None
+)
+
+
+def get_route_label(scope: Scope) -> str:
+    # route templates keep the label cardinality bounded; "route" is set by
+    # FastAPI once the request is routed, mounts prefix their root_path
+    root_path = scope.get("root_path", "")
+    route = scope.get("route")
+    if route is None:
+        # static mounts and 404s
+        return f"{root_path}/*" if root_path else "unrouted"
+    return f"{root_path}{route.path}"
+
+
+def record_db_query(seconds: float):
+    scope = CURRENT_SCOPE.get()
+    route = get_route_label(scope) if scope is not None else "background"
+    DB_QUERIES.labels(route).inc()
+    DB_QUERY_SECONDS.labels(route).observe(seconds)
+
+
+def time_queries(database):
+    """Records the count and duration of every query `database` executes."""
+    execute_sql = database.execute_sql
+
+    def timed_execute_sql(sql, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return execute_sql(sql, params, *args, **kwargs)
+        finally:
+            record_db_query(time.perf_counter() - start)
+
+    database.execute_sql = timed_execute_sql
+
+
+class TelemetryMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start_time = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = CURRENT_SCOPE.set(scope)
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            CURRENT_SCOPE.reset(token)
+
+            route = get_route_label(scope)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status)).inc()
+            HTTP_REQUEST_SECONDS.labels(scope["method"], route).observe(
+                time.perf_counter() - start_time
+            )
+
+
+class EventLoopLagMonitor:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+
+    async def _run_forever(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = time.perf_counter() - start - self.interval
+            EVENT_LOOP_LAG_SECONDS.observe(max(lag, 0.0))
+
+    def start(self):
+        if self.task is None and self.interval > 0:
+            self.task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+        if MULTIPROCESS:
+            # drop this worker's live gauges from the merged view
+            multiprocess.mark_process_dead(os.getpid())
+
+
+EventLoopLag = EventLoopLagMonitor(EVENT_LOOP_LAG_INTERVAL)
+
+
+def render_metrics() -> bytes:
+    registry = REGISTRY
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+    # values computed from the merged samples, e.g. upstream_saturation
+    derived = CollectorRegistry()
+    derived.register(SaturationCollector(registry))
+
+    return generate_latest(registry) + generate_latest(derived)
@@ -0,0 +1,26 @@
+from typing import Optional, Tuple
+
+import orjson
+
+# byte patterns that only occur in SSE events carrying token usage
+OPENAI_USAGE_MARKERS = (b'"prompt_tokens"',)
+CLAUDE_USAGE_MARKERS = (b'"message_start"', b'"message_delta"')
+
+
+def parse_usage_event(line: bytes, markers: Tuple[bytes, ...]) -> Optional[dict]:
+    """
+    Decodes an SSE `data:` line only if it contains one of `markers`.
+
+    Token deltas make up almost the whole stream and never carry usage, so they are
+    rejected with a substring scan instead of a full JSON decode.
+    """
+    if not line.startswith(b"data: "):
+        return None
+
+    for marker in markers:
+        if marker in line:
+            try:
+                return orjson.loads(line[6:])  # strip "data: " at the front of response
+            except orjson.JSONDecodeError:
+                return None
+    return None
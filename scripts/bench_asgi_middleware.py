@@ -0,0 +1,120 @@
+"""
+Benchmark of the per-chunk cost of middleware on streamed responses.
+
+    python scripts/bench_asgi_middleware.py --chunks 5000 --streams 1,50,200
+
+Streams SSE chunks from a Starlette endpoint through four stacked no-op
+middlewares, as many as backend/main.py has, in three setups:
+
+`none`  no middleware
+`base`  BaseHTTPMiddleware, as the main app used before
+`asgi`  pure ASGI middleware that only looks at http.response.start, as the main
+        app uses now
+
+For each number of concurrent streams it prints the time per chunk and the
+chunks per second all streams together reach.
+"""
+
+import argparse
+import asyncio
+import time
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+
+CHUNK = b'data: {"choices":[{"index":0,"delta":{"content":"token "}}]}\n\n'
+MIDDLEWARES = 4
+
+
+class PassthroughMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+async def passthrough_dispatch(request, call_next):
+    return await call_next(request)
+
+
+def create_app(kind: str, chunks: int) -> Starlette:
+    async def stream():
+        for _ in range(chunks):
+            yield CHUNK
+
+    async def endpoint(request):
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    app = Starlette(routes=[Route("/", endpoint)])
+    for _ in range(MIDDLEWARES if kind != "none" else 0):
+        if kind == "base":
+            app.add_middleware(BaseHTTPMiddleware, dispatch=passthrough_dispatch)
+        else:
+            app.add_middleware(PassthroughMiddleware)
+    return app
+
+
+async def stream_once(app) -> int:
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/",
+        "raw_path": b"/",
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "server": ("testserver", 80),
+        "client": ("testclient", 1),
+    }
+    received = 0
+    done = asyncio.Event()
+
+    async def receive():
+        # the client stays connected until the whole body arrived
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal received
+        if message["type"] == "http.response.body":
+            received += 1
+            if not message.get("more_body"):
+                done.set()
+
+    await app(scope, receive, send)
+    return received
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000, help="chunks per stream")
+    parser.add_argument("--streams", default="1,50,200", help="concurrent streams to try")
+    args = parser.parse_args()
+
+    for streams in [int(s) for s in args.streams.split(",")]:
+        for kind in ("none", "base", "asgi"):
+            app = create_app(kind, args.chunks)
+            await stream_once(app)  # warm up
+            start = time.perf_counter()
+            await asyncio.gather(*[stream_once(app) for _ in range(streams)])
+            elapsed = time.perf_counter() - start
+
+            chunks = args.chunks * streams
+            print(
+                f"{streams:4d} streams  {kind:4s}  {elapsed / chunks * 1e6:7.1f} us/chunk"
+                f"  {chunks / elapsed:10.0f} chunks/s"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+"""
+Benchmark of the compressed chat encoding, see CompressedTextField in
+backend/apps/webui/internal/db.py.
+
+    python scripts/bench_chat_compression.py --chats 200 --messages 60
+
+Creates a fresh SQLite database with ENABLE_CHAT_COMPRESSION off and one with it
+on, each in its own process, and fills both with the same synthetic role-play
+chats. Prints the database size after VACUUM and the latency of inserting a
+chat, reading a chat and appending a message.
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+
+NAMES = ["Aria", "Brannoc", "the innkeeper", "Captain Vell", "Mira"]
+ACTIONS = [
+    "leans closer and whispers",
+    "draws a sword and says",
+    "laughs softly, saying",
+    "glances at the door and murmurs",
+    "narrows their eyes:",
+]
+LINES = [
+    "the caravan leaves at dawn",
+    "we cannot trust the guild",
+    "the map is a forgery",
+    "keep your voice down",
+    "the storm is coming from the east",
+    "you owe me a favour",
+    "*sips the ale slowly*",
+    "the old ruins hold the key",
+]
+
+
+def sentence(rng: random.Random) -> str:
+    return f"{rng.choice(NAMES)} {rng.choice(ACTIONS)} {rng.choice(LINES)}."
+
+
+def make_chat(rng: random.Random, count: int) -> dict:
+    messages = {}
+    parent_id = None
+    for i in range(count):
+        message_id = f"{rng.random():.12f}"
+        messages[message_id] = {
+            "id": message_id,
+            "parentId": parent_id,
+            "childrenIds": [],
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": " ".join(sentence(rng) for _ in range(rng.randint(2, 25) if i % 2 == 0 else rng.randint(10, 40))),
+            "timestamp": 1700000000 + i,
+            "model": "llama3:8b",
+        }
+        if parent_id is not None:
+            messages[parent_id]["childrenIds"].append(message_id)
+        parent_id = message_id
+
+    return {
+        "title": "Tavern",
+        "models": ["llama3:8b"],
+        "params": {},
+        "history": {"messages": messages, "currentId": parent_id},
+        "messages": list(messages.values()),
+    }
+
+
+def run(args):
+    """Runs in a child process, with DATA_DIR and ENABLE_CHAT_COMPRESSION set."""
+    sys.path.insert(0, BACKEND_DIR)
+    from apps.webui.internal.db import DB
+    from apps.webui.models.chats import ChatForm, Chats
+
+    rng = random.Random(1)
+    bodies = [make_chat(rng, args.messages) for _ in range(args.chats)]
+
+    start = time.perf_counter()
+    ids = [Chats.insert_new_chat("user", ChatForm(chat=body)).id for body in bodies]
+    insert = (time.perf_counter() - start) / len(ids)
+
+    start = time.perf_counter()
+    for id in ids:
+        Chats.get_chat_by_id(id)
+    read = (time.perf_counter() - start) / len(ids)
+    assert json.loads(Chats.get_chat_by_id(ids[0]).chat) == bodies[0]
+
+    start = time.perf_counter()
+    parent_id = bodies[0]["history"]["currentId"]
+    for i in range(args.appends):
+        message = {"id": f"append-{i}", "parentId": parent_id, "role": "assistant", "content": sentence(rng) * 20}
+        Chats.upsert_chat_message(ids[0], "user", message)
+        parent_id = message["id"]
+    append = (time.perf_counter() - start) / args.appends
+
+    DB.execute_sql("VACUUM")
+    size = os.path.getsize(os.path.join(os.environ["DATA_DIR"], "webui.db"))
+    raw = sum(len(json.dumps(body)) for body in bodies)
+
+    print(
+        f"{os.environ['ENABLE_CHAT_COMPRESSION']:5s}  {raw / 1e6:8.1f} MB  {size / 1e6:8.1f} MB"
+        f"  {insert * 1000:8.2f} ms  {read * 1000:8.2f} ms  {append * 1000:8.2f} ms",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=60, help="messages per chat")
+    parser.add_argument("--appends", type=int, default=200)
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        return run(args)
+
+    columns = ("chat JSON", "db size", "insert", "read", "append")
+    print("compr" + "".join(f"  {column:>11s}" for column in columns))
+    for enabled in ("false", "true"):
+        with tempfile.TemporaryDirectory() as data_dir:
+            env = {
+                **os.environ,
+                "DATA_DIR": data_dir,
+                "DATABASE_URL": f"sqlite:///{data_dir}/webui.db",
+                "ENABLE_CHAT_COMPRESSION": enabled,
+                "GLOBAL_LOG_LEVEL": "WARNING",
+            }
+            subprocess.run([sys.executable, __file__, "--run", *sys.argv[1:]], env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
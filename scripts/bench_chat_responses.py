@@ -0,0 +1,133 @@
+"""
+Benchmark of the chat fetch responses, see chat_json_response in
+backend/apps/webui/routers/chats.py.
+
+    python scripts/bench_chat_responses.py --messages 500 --chats 45
+
+Fills a fresh SQLite database with synthetic chats and serves them from a FastAPI
+app in two ways:
+
+`before` json.loads of the stored chat into a ChatResponse, which FastAPI
+         validates and serializes again, as the routes did before
+`after`  chat_json_response and chats_json_response, which splice the stored
+         chat JSON into the response as it is
+
+Prints the latency of GET /chats/{id} for one large chat and of GET /chats/all
+for all chats, after checking that both return the same JSON.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import List
+
+DATA_DIR = tempfile.mkdtemp()
+os.environ["DATA_DIR"] = DATA_DIR
+os.environ["DATABASE_URL"] = f"sqlite:///{DATA_DIR}/webui.db"
+os.environ.setdefault("GLOBAL_LOG_LEVEL", "WARNING")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from apps.webui.models.chats import ChatForm, ChatResponse, Chats  # noqa: E402
+from apps.webui.routers.chats import chat_json_response, chats_json_response  # noqa: E402
+
+WORDS = "the caravan leaves at dawn we cannot trust guild map forgery storm east favour ruins key".split()
+USER_ID = "user"
+
+
+def make_chat(rng: random.Random, count: int) -> dict:
+    messages = {}
+    parent_id = None
+    for i in range(count):
+        message_id = f"{rng.random():.12f}"
+        messages[message_id] = {
+            "id": message_id,
+            "parentId": parent_id,
+            "childrenIds": [],
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": " ".join(rng.choices(WORDS, k=rng.randint(50, 400))),
+            "timestamp": 1700000000 + i,
+            "model": "llama3",
+            "info": {"eval_count": 123, "total_duration": 45678},
+        }
+        if parent_id is not None:
+            messages[parent_id]["childrenIds"].append(message_id)
+        parent_id = message_id
+
+    return {
+        "title": "Chat",
+        "models": ["llama3"],
+        "params": {},
+        "history": {"messages": messages, "currentId": parent_id},
+        "messages": list(messages.values()),
+    }
+
+
+def to_chat_response(chat) -> ChatResponse:
+    return ChatResponse(**{**chat.model_dump(), "chat": json.loads(chat.chat)})
+
+
+def create_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/before/{id}", response_model=ChatResponse)
+    def get_chat_before(id: str):
+        return to_chat_response(Chats.get_chat_by_id_and_user_id(id, USER_ID))
+
+    @app.get("/after/{id}", response_model=ChatResponse)
+    def get_chat_after(id: str):
+        return chat_json_response(Chats.get_chat_by_id_and_user_id(id, USER_ID))
+
+    @app.get("/before", response_model=List[ChatResponse])
+    def get_chats_before():
+        return [to_chat_response(chat) for chat in Chats.get_chats_by_user_id(USER_ID)]
+
+    @app.get("/after", response_model=List[ChatResponse])
+    def get_chats_after():
+        return chats_json_response(Chats.get_chats_by_user_id(USER_ID))
+
+    return app
+
+
+def bench(client: TestClient, path: str, repeat: int):
+    response = client.get(path)  # warm up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        client.get(path)
+    return (time.perf_counter() - start) / repeat, response
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500, help="messages of the large chats")
+    parser.add_argument("--chats", type=int, default=45)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = random.Random(2)
+    ids = [
+        Chats.insert_new_chat(USER_ID, ChatForm(chat=make_chat(rng, args.messages if i < 5 else 40))).id
+        for i in range(args.chats)
+    ]
+
+    client = TestClient(create_app())
+    for name, path in (("GET /chats/{id}", f"/{ids[0]}"), ("GET /chats/all", "")):
+        before, before_response = bench(client, f"/before{path}", args.repeat)
+        after, after_response = bench(client, f"/after{path}", args.repeat)
+        assert before_response.json() == after_response.json(), f"{name}: the responses differ"
+
+        print(
+            f"{name:16s} {len(after_response.content) / 1e6:6.1f} MB"
+            f"  before {before * 1000:7.1f} ms  after {after * 1000:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Benchmark of parsing chat completion bodies once, see backend/utils/payload.py.
+
+    python scripts/bench_request_body.py --image-mb 4 --requests 20
+
+Sends a chat completion body with one base64 image through two ASGI middlewares
+and a route, the shape of RAGMiddleware, PipelineMiddleware and the proxy route:
+
+`before` every stage json.loads the body, edits it and json.dumps it again with
+         a new content-length, and the route serializes it for the upstream call
+`after`  the stages share the dict through read_json_body and get_json_body and
+         the route serializes it once with dump_json
+
+Prints the CPU time per request of both.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from starlette.requests import Request  # noqa: E402
+
+from utils.payload import dump_json, get_json_body, read_json_body  # noqa: E402
+
+
+def make_body(image_mb: float) -> bytes:
+    image = base64.b64encode(os.urandom(int(image_mb * 1024 * 1024 * 3 / 4))).decode()
+    return json.dumps({
+        "model": "model",
+        "stream": True,
+        "messages": [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": [
+                {"type": "text", "text": "What is in this image?"},
+                {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image}"}},
+            ]},
+        ],
+    }).encode()
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+####################
+# Before
+####################
+
+
+def before_middleware(app, key: str):
+    async def middleware(scope, receive, send):
+        data = json.loads(await read_body(receive))
+        data[key] = True
+        body = json.dumps(data).encode()
+
+        headers = [(k, v) for k, v in scope["headers"] if k != b"content-length"]
+        headers.append((b"content-length", str(len(body)).encode()))
+
+        async def replay():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        await app({**scope, "headers": headers}, replay, send)
+
+    return middleware
+
+
+async def before_route(scope, receive, send):
+    data = await Request(scope, receive).json()
+    payload = json.dumps(data).encode()
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": str(len(payload)).encode()})
+
+
+####################
+# After
+####################
+
+
+def after_middleware(app, key: str):
+    async def middleware(scope, receive, send):
+        data, receive = await read_json_body(scope, receive)
+        data[key] = True
+        await app(scope, receive, send)
+
+    return middleware
+
+
+async def after_route(scope, receive, send):
+    data = await get_json_body(Request(scope, receive))
+    payload = dump_json(data)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": str(len(payload)).encode()})
+
+
+async def request(app, body: bytes) -> int:
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/api/chat/completions",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "query_string": b"",
+    }
+    sent = False
+    response = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        response.append(message)
+
+    await app(scope, receive, send)
+    return int(response[-1]["body"])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image-mb", type=float, default=4)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    body = make_body(args.image_mb)
+    print(f"body: {len(body) / 1024 / 1024:.1f} MB")
+
+    apps = {
+        "before": before_middleware(before_middleware(before_route, "pipeline"), "rag"),
+        "after": after_middleware(after_middleware(after_route, "pipeline"), "rag"),
+    }
+    for name, app in apps.items():
+        await request(app, body)  # warm up
+        start = time.process_time()
+        for _ in range(args.requests):
+            await request(app, body)
+        elapsed = time.process_time() - start
+        print(f"{name:7s} {elapsed / args.requests * 1000:8.1f} ms CPU per request")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Microbenchmark of finding token usage in streamed responses, see
+backend/utils/usage.py.
+
+    python scripts/bench_usage_parser.py --tokens 2000
+    python scripts/bench_usage_parser.py --recording stream.txt --provider openai
+
+Runs each stream through both parsers and checks that they find the same usage:
+
+`before` json.loads of every data: line, as stream_token_counter did
+`after`  parse_usage_event, which only decodes lines that can carry usage
+
+Without --recording it uses a synthetic OpenAI and Claude stream of --tokens
+tokens. A recording is the raw response body of a streamed chat completion.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from utils.usage import CLAUDE_USAGE_MARKERS, OPENAI_USAGE_MARKERS, parse_usage_event  # noqa: E402
+
+MARKERS = {"openai": OPENAI_USAGE_MARKERS, "claude": CLAUDE_USAGE_MARKERS}
+
+
+def openai_stream(tokens: int) -> list:
+    chunk = {"id": "chatcmpl-1", "object": "chat.completion.chunk", "model": "model", "usage": None}
+    lines = [
+        f"data: {json.dumps({**chunk, 'choices': [{'index': 0, 'delta': {'content': f'token{i} '}}]})}\n".encode()
+        for i in range(tokens)
+    ]
+    usage = {"prompt_tokens": 100, "completion_tokens": tokens, "total_tokens": 100 + tokens}
+    lines.append(f"data: {json.dumps({**chunk, 'choices': [], 'usage': usage})}\n".encode())
+    lines.append(b"data: [DONE]\n")
+    return lines
+
+
+def claude_stream(tokens: int) -> list:
+    events = [{"type": "message_start", "message": {"id": "msg_1", "usage": {"input_tokens": 100, "output_tokens": 1}}}]
+    events += [
+        {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": f"token{i} "}}
+        for i in range(tokens)
+    ]
+    events.append({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": tokens}})
+    events.append({"type": "message_stop"})
+
+    lines = []
+    for event in events:
+        lines.append(f"event: {event['type']}\n".encode())
+        lines.append(f"data: {json.dumps(event)}\n".encode())
+    return lines
+
+
+def find_usage_before(lines: list) -> list:
+    found = []
+    for line in lines:
+        if not line.startswith(b"data: "):
+            continue
+        try:
+            event = json.loads(line[6:])
+        except json.JSONDecodeError:
+            continue
+        if event.get("usage") or event.get("type") in ("message_start", "message_delta"):
+            found.append(event)
+    return found
+
+
+def find_usage_after(lines: list, markers: tuple) -> list:
+    found = []
+    for line in lines:
+        event = parse_usage_event(line, markers)
+        if event is not None and (event.get("usage") or event.get("type") in ("message_start", "message_delta")):
+            found.append(event)
+    return found
+
+
+def bench(name: str, lines: list, markers: tuple, repeat: int):
+    assert find_usage_before(lines) == find_usage_after(lines, markers), f"{name}: the parsers disagree"
+
+    for label, parse in (("before", find_usage_before), ("after", lambda lines: find_usage_after(lines, markers))):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            parse(lines)
+        elapsed = (time.perf_counter() - start) / repeat
+        print(f"{name:8s} {label:7s} {elapsed * 1000:7.2f} ms per stream of {len(lines)} lines")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=2000)
+    parser.add_argument("--recording", help="file with a recorded stream")
+    parser.add_argument("--provider", choices=list(MARKERS), default="openai", help="provider of --recording")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.recording:
+        with open(args.recording, "rb") as f:
+            lines = f.read().splitlines(keepends=True)
+        bench(args.provider, lines, MARKERS[args.provider], args.repeat)
+    else:
+        bench("openai", openai_stream(args.tokens), OPENAI_USAGE_MARKERS, args.repeat)
+        bench("claude", claude_stream(args.tokens), CLAUDE_USAGE_MARKERS, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
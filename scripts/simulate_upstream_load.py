@@ -0,0 +1,198 @@
+"""
+Local simulation of upstream saturation, see docs/saturation.md.
+
+    python scripts/simulate_upstream_load.py stub --max-streams 8 --max-queue 8
+    python scripts/simulate_upstream_load.py load --token <api key> --max-clients 32
+
+`stub` serves an OpenAI-compatible /v1/models and a streaming /v1/chat/completions
+that relays at most --max-streams streams at once, holds up to --max-queue more
+requests before sending headers and answers 429 beyond that.
+
+`load` ramps streaming chat completions through the Open WebUI proxy from one to
+--max-clients concurrent clients and prints the saturation gauges from /metrics
+once per second, with the replicas the HorizontalPodAutoscaler in
+docs/saturation.md would ask for: ceil(upstream_saturation / --hpa-target).
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import re
+import time
+
+import aiohttp
+from aiohttp import web
+
+STUB_MODEL = "stub-model"
+
+
+####################
+# Stub upstream
+####################
+
+
+def create_stub_app(max_streams: int, max_queue: int, tokens: int, token_delay: float):
+    streams = asyncio.Semaphore(max_streams)
+    waiting = 0
+
+    async def models(request: web.Request):
+        return web.json_response(
+            {"object": "list", "data": [{"id": STUB_MODEL, "object": "model", "owned_by": "stub"}]}
+        )
+
+    async def chat_completions(request: web.Request):
+        nonlocal waiting
+        if streams.locked() and waiting >= max_queue:
+            return web.json_response(
+                {"error": {"message": "Too many requests", "type": "rate_limit"}}, status=429
+            )
+
+        waiting += 1
+        try:
+            await streams.acquire()
+        finally:
+            waiting -= 1
+
+        try:
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+
+            for i in range(tokens):
+                chunk = {"choices": [{"index": 0, "delta": {"content": f"token{i} "}}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                await asyncio.sleep(token_delay)
+
+            usage = {"choices": [], "usage": {"prompt_tokens": 10, "completion_tokens": tokens, "total_tokens": tokens + 10}}
+            await response.write(f"data: {json.dumps(usage)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            return response
+        finally:
+            streams.release()
+
+    app = web.Application()
+    app.router.add_get("/v1/models", models)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+####################
+# Load generator
+####################
+
+
+SATURATION_METRICS = (
+    "upstream_saturation",
+    "upstream_saturation_max",
+    "upstream_streams_open",
+    "upstream_requests_pending",
+    "upstream_recent_throttled",
+)
+
+
+def parse_metrics(text: str) -> dict:
+    # sums every sample of the gauges we print, over all upstreams
+    values = {name: 0.0 for name in SATURATION_METRICS}
+    for line in text.splitlines():
+        match = re.match(r"^([a-z_]+)(\{[^}]*\})? ([0-9.e+-]+)$", line)
+        if match and match.group(1) in values:
+            values[match.group(1)] += float(match.group(3))
+    return values
+
+
+async def run_client(session: aiohttp.ClientSession, url: str, headers: dict, stats: dict, stop: asyncio.Event):
+    payload = {
+        "model": STUB_MODEL,
+        "stream": True,
+        "messages": [{"role": "user", "content": "Hello"}],
+    }
+    while not stop.is_set():
+        try:
+            async with session.post(url, json=payload, headers=headers) as response:
+                stats[response.status] = stats.get(response.status, 0) + 1
+                async for _ in response.content:
+                    pass
+                if response.status != 200:
+                    await asyncio.sleep(0.5)
+        except aiohttp.ClientError:
+            stats["error"] = stats.get("error", 0) + 1
+            await asyncio.sleep(0.5)
+
+
+async def run_load(args):
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    metrics_headers = {"Authorization": f"Bearer {args.metrics_key}"} if args.metrics_key else {}
+    url = f"{args.base_url}/openai/chat/completions"
+
+    stats = {}
+    stop = asyncio.Event()
+    clients = []
+    started = time.monotonic()
+
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None)) as session:
+        print("   t  clients  saturation  replicas  streams  pending  429s  responses")
+        while True:
+            elapsed = time.monotonic() - started
+            if elapsed >= args.duration:
+                break
+
+            # linear ramp from 1 to --max-clients over the first half, then hold
+            target = min(args.max_clients, 1 + int(2 * elapsed / args.duration * args.max_clients))
+            while len(clients) < target:
+                clients.append(asyncio.create_task(run_client(session, url, headers, stats, stop)))
+
+            try:
+                async with session.get(f"{args.base_url}/metrics", headers=metrics_headers) as response:
+                    values = parse_metrics(await response.text())
+            except aiohttp.ClientError as e:
+                print(f"Error reading /metrics: {e}")
+                values = {name: 0.0 for name in SATURATION_METRICS}
+
+            # an AverageValue target divides the metric by the target, whatever the current replicas
+            replicas = max(1, math.ceil(round(values["upstream_saturation"] / args.hpa_target, 6)))
+            print(
+                f"{elapsed:4.0f}  {len(clients):7d}  {values['upstream_saturation_max']:10.2f}  {replicas:8d}"
+                f"  {values['upstream_streams_open']:7.0f}  {values['upstream_requests_pending']:7.0f}"
+                f"  {values['upstream_recent_throttled']:4.0f}  {dict(sorted(stats.items(), key=str))}"
+            )
+            await asyncio.sleep(1)
+
+        stop.set()
+        for client in clients:
+            client.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stub = commands.add_parser("stub", help="run the stub upstream")
+    stub.add_argument("--host", default="127.0.0.1")
+    stub.add_argument("--port", type=int, default=8081)
+    stub.add_argument("--max-streams", type=int, default=8)
+    stub.add_argument("--max-queue", type=int, default=8)
+    stub.add_argument("--tokens", type=int, default=100)
+    stub.add_argument("--token-delay", type=float, default=0.05)
+
+    load = commands.add_parser("load", help="ramp up clients against Open WebUI")
+    load.add_argument("--base-url", default="http://localhost:8080")
+    load.add_argument("--token", default="", help="API key or JWT of an Open WebUI user")
+    load.add_argument("--metrics-key", default="", help="METRICS_API_KEY, if set")
+    load.add_argument("--max-clients", type=int, default=32)
+    load.add_argument("--duration", type=float, default=60)
+    load.add_argument("--hpa-target", type=float, default=0.8, help="averageValue of the autoscaler")
+
+    args = parser.parse_args()
+    if args.command == "stub":
+        web.run_app(
+            create_stub_app(args.max_streams, args.max_queue, args.tokens, args.token_delay),
+            host=args.host,
+            port=args.port,
+        )
+    else:
+        asyncio.run(run_load(args))
+
+
+if __name__ == "__main__":
+    main()
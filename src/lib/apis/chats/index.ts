@@ -1,6 +1,32 @@
 import { WEBUI_API_BASE_URL } from '$lib/constants';
 import { getTimeRange } from '$lib/utils';
 
+// chat listings are paginated; follows X-Next-Cursor until the last page
+const CHAT_PAGE_SIZE = 200;
+
+const fetchAllChatPages = async (fetchPage: (cursor: string | null) => Promise<Response>) => {
+	let chats = [];
+	let cursor = null;
+
+	do {
+		const res = await fetchPage(cursor);
+		if (!res.ok) throw await res.json();
+
+		chats = chats.concat(await res.json());
+		cursor = res.headers.get('X-Next-Cursor');
+	} while (cursor);
+
+	return chats;
+};
+
+const getChatPageUrl = (path: string, cursor: string | null) => {
+	const params = new URLSearchParams({ limit: `${CHAT_PAGE_SIZE}` });
+	if (cursor) {
+		params.set('cursor', cursor);
+	}
+	return `${WEBUI_API_BASE_URL}${path}?${params.toString()}`;
+};
+
 export const createNewChat = async (token: string, chat: object) => {
 	let error = null;
 
@@ -35,21 +61,16 @@ export const createNewChat = async (token: string, chat: object) => {
 export const getChatList = async (token: string = '') => {
 	let error = null;
 
-	const res = await fetch(`${WEBUI_API_BASE_URL}/chats/`, {
-		method: 'GET',
-		headers: {
-			Accept: 'application/json',
-			'Content-Type': 'application/json',
-			...(token && { authorization: `Bearer ${token}` })
-		}
-	})
-		.then(async (res) => {
-			if (!res.ok) throw await res.json();
-			return res.json();
-		})
-		.then((json) => {
-			return json;
+	const res = await fetchAllChatPages((cursor) =>
+		fetch(getChatPageUrl('/chats/', cursor), {
+			method: 'GET',
+			headers: {
+				Accept: 'application/json',
+				'Content-Type': 'application/json',
+				...(token && { authorization: `Bearer ${token}` })
+			}
 		})
+	)
 		.catch((err) => {
 			error = err;
 			console.log(err);
@@ -66,10 +87,11 @@ export const getChatList = async (token: string = '') => {
 	}));
 };
 
-export const getChatListByUserId = async (token: string = '', userId: string) => {
+// one page of the user's chats and the cursor of the next page, null after the last
+export const getChatListPage = async (token: string = '', cursor: string | null = null) => {
 	let error = null;
 
-	const res = await fetch(`${WEBUI_API_BASE_URL}/chats/list/user/${userId}`, {
+	const res = await fetch(getChatPageUrl('/chats/', cursor), {
 		method: 'GET',
 		headers: {
 			Accept: 'application/json',
@@ -79,11 +101,43 @@ export const getChatListByUserId = async (token: string = '', userId: string) =>
 	})
 		.then(async (res) => {
 			if (!res.ok) throw await res.json();
-			return res.json();
+			return {
+				chats: await res.json(),
+				cursor: res.headers.get('X-Next-Cursor')
+			};
 		})
-		.then((json) => {
-			return json;
+		.catch((err) => {
+			error = err;
+			console.log(err);
+			return null;
+		});
+
+	if (error) {
+		throw error;
+	}
+
+	return {
+		chats: res.chats.map((chat) => ({
+			...chat,
+			time_range: getTimeRange(chat.updated_at)
+		})),
+		cursor: res.cursor
+	};
+};
+
+export const getChatListByUserId = async (token: string = '', userId: string) => {
+	let error = null;
+
+	const res = await fetchAllChatPages((cursor) =>
+		fetch(getChatPageUrl(`/chats/list/user/${userId}`, cursor), {
+			method: 'GET',
+			headers: {
+				Accept: 'application/json',
+				'Content-Type': 'application/json',
+				...(token && { authorization: `Bearer ${token}` })
+			}
 		})
+	)
 		.catch((err) => {
 			error = err;
 			console.log(err);
@@ -141,21 +195,16 @@ export const getAllChatListsByUserId = async (token: string = '') => {
 export const getArchivedChatList = async (token: string = '') => {
 	let error = null;
 
-	const res = await fetch(`${WEBUI_API_BASE_URL}/chats/archived`, {
-		method: 'GET',
-		headers: {
-			Accept: 'application/json',
-			'Content-Type': 'application/json',
-			...(token && { authorization: `Bearer ${token}` })
-		}
-	})
-		.then(async (res) => {
-			if (!res.ok) throw await res.json();
-			return res.json();
-		})
-		.then((json) => {
-			return json;
+	const res = await fetchAllChatPages((cursor) =>
+		fetch(getChatPageUrl('/chats/archived', cursor), {
+			method: 'GET',
+			headers: {
+				Accept: 'application/json',
+				'Content-Type': 'application/json',
+				...(token && { authorization: `Bearer ${token}` })
+			}
 		})
+	)
 		.catch((err) => {
 			error = err;
 			console.log(err);
@@ -265,21 +314,16 @@ export const getAllUserChats = async (token: string) => {
 export const getAllUserChatsAbridged = async (token: string) => {
 	let error = null;
 
-	const res = await fetch(`${WEBUI_API_BASE_URL}/chats/all/db/abridged`, {
-		method: 'GET',
-		headers: {
-			Accept: 'application/json',
-			'Content-Type': 'application/json',
-			...(token && { authorization: `Bearer ${token}` })
-		}
-	})
-		.then(async (res) => {
-			if (!res.ok) throw await res.json();
-			return res.json();
-		})
-		.then((json) => {
-			return json;
+	const res = await fetchAllChatPages((cursor) =>
+		fetch(getChatPageUrl('/chats/all/db/abridged', cursor), {
+			method: 'GET',
+			headers: {
+				Accept: 'application/json',
+				'Content-Type': 'application/json',
+				...(token && { authorization: `Bearer ${token}` })
+			}
 		})
+	)
 		.catch((err) => {
 			error = err;
 			console.log(err);
@@ -327,24 +371,21 @@ export const getAllChatTags = async (token: string) => {
 export const getChatListByTagName = async (token: string = '', tagName: string) => {
 	let error = null;
 
-	const res = await fetch(`${WEBUI_API_BASE_URL}/chats/tags`, {
-		method: 'POST',
-		headers: {
-			Accept: 'application/json',
-			'Content-Type': 'application/json',
-			...(token && { authorization: `Bearer ${token}` })
-		},
-		body: JSON.stringify({
-			name: tagName
-		})
-	})
-		.then(async (res) => {
-			if (!res.ok) throw await res.json();
-			return res.json();
-		})
-		.then((json) => {
-			return json;
+	const res = await fetchAllChatPages((cursor) =>
+		fetch(`${WEBUI_API_BASE_URL}/chats/tags`, {
+			method: 'POST',
+			headers: {
+				Accept: 'application/json',
+				'Content-Type': 'application/json',
+				...(token && { authorization: `Bearer ${token}` })
+			},
+			body: JSON.stringify({
+				name: tagName,
+				cursor: cursor,
+				limit: CHAT_PAGE_SIZE
+			})
 		})
+	)
 		.catch((err) => {
 			error = err;
 			console.log(err);
@@ -594,6 +635,41 @@ export const updateChatById = async (token: string, id: string, chat: object) =>
 	return res;
 };
 
+export const upsertChatMessage = async (token: string, id: string, message: object) => {
+	let error = null;
+
+	const res = await fetch(`${WEBUI_API_BASE_URL}/chats/${id}/messages`, {
+		method: 'POST',
+		headers: {
+			Accept: 'application/json',
+			'Content-Type': 'application/json',
+			...(token && { authorization: `Bearer ${token}` })
+		},
+		body: JSON.stringify({
+			message: message
+		})
+	})
+		.then(async (res) => {
+			if (!res.ok) throw await res.json();
+			return res.json();
+		})
+		.then((json) => {
+			return json;
+		})
+		.catch((err) => {
+			error = err;
+
+			console.log(err);
+			return null;
+		});
+
+	if (error) {
+		throw error;
+	}
+
+	return res;
+};
+
 type PageTimeMap = {
 	[key: string]: number
 }
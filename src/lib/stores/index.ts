@@ -20,6 +20,8 @@ export const theme = writable('system');
 export const chatId = writable('');
 
 export const chats = writable([]);
+// cursor of the page after the chats loaded so far, null once all are loaded
+export const chatsCursor: Writable<string | null> = writable(null);
 export const tags = writable([]);
 export const models: Writable<Model[]> = writable([]);
 
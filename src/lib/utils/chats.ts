@@ -0,0 +1,38 @@
+import { get } from 'svelte/store';
+
+import { chats, chatsCursor } from '$lib/stores';
+import { getChatList, getChatListPage } from '$lib/apis/chats';
+
+// $chats starts with the most recent page; older pages are only fetched when needed
+
+export const loadFirstChatPage = async (token: string) => {
+	const page = await getChatListPage(token);
+	chats.set(page.chats);
+	chatsCursor.set(page.cursor);
+};
+
+export const loadNextChatPage = async (token: string) => {
+	const cursor = get(chatsCursor);
+	if (!cursor) {
+		return;
+	}
+
+	const page = await getChatListPage(token, cursor);
+	chats.update((loaded) => [...loaded, ...page.chats]);
+	chatsCursor.set(page.cursor);
+};
+
+// pages that look at all of the user's chats load the rest first
+export const loadRemainingChats = async (token: string) => {
+	if (get(chats).length === 0) {
+		await loadFirstChatPage(token);
+	}
+	while (get(chatsCursor)) {
+		await loadNextChatPage(token);
+	}
+};
+
+export const loadAllChats = async (token: string) => {
+	chats.set(await getChatList(token));
+	chatsCursor.set(null);
+};